@@ -7,21 +7,21 @@
 #     * Update media for new cards from Forvo library
 #     * Update decks for all verbs since latest available
 #     * Update decks on Google Drive
-# 
+#
+# anki and pydrive take most of a second to import, so they are imported where they are first used: runs that never
+# open the collection or Google Drive do not load them.
+#
 # Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
 #
 
 import os
 import string
 import json
-from wpt import WPT
-from leoverb import LeoVerb
-from forvo import Forvo
-import anki
-from anki.exporting import AnkiPackageExporter
-from anki.importing.apkg import AnkiPackageImporter
-from pydrive.auth import GoogleAuth
-from pydrive.drive import GoogleDrive
+from leoverb import LeoVerb, verb_cache
+from forvo import Forvo, LookupDeferred
+from postindex import title_verb
+import fixtures
+import tracing
 
 # German --> English **field** translations
 FIELD_TRANSLATION_TABLE = {
@@ -52,6 +52,8 @@ PRONOUN_NOTE_TABLE = {
     "ihr": "ihr", 
     "sie": "Sie / sie"}
 
+DRIVE_HOST = "www.googleapis.com"
+
 def get_two_digit_week(week: int) -> str:
     return "0" + str(week) if week < 10 else str(week)
 
@@ -78,38 +80,67 @@ class AnkiDeVotD:
     full_output_file = "German__VotD.apkg"
     wpt = None
     
-    verb_list = None
-    weeks = None
-    gdrive = None
-    forvo = None
+    _verb_list = None
+    _weeks = None
+    _gdrive = None
+    _forvo = None
     current_pkg = None
+    media_names = None  # File names in the collection media folder
     
-    def __init__(self, wpt: object):
+    def __init__(self, wpt: object, gdrive: object=None, forvo: object=None):
+        """
+        AnkiDeVotD(wpt, gdrive=None, forvo=None) - Constructor. The verb list is read and the GDrive and Forvo
+                                                   clients are created (unless given) on first use.
+        """
         self.decks = {}
         self.week_decks = {}
         self.cwd = os.getcwd()
-        self.verb_list = []
-        self.weeks = []
         self.wpt = wpt
-        self._get_verb_posts()
-        self._build_verb_weeks()
-        self.gdrive = GDrive()
-        self.forvo = Forvo("ssm", region="us-east-2")
-        
+        self._gdrive = gdrive
+        self._forvo = forvo
+
+    @property
+    def verb_list(self) -> list:
+        if self._verb_list is None:
+            self._get_verb_posts()
+        return self._verb_list
+
+    @property
+    def weeks(self) -> list:
+        if self._weeks is None:
+            self._build_verb_weeks()
+        return self._weeks
+
+    @property
+    def gdrive(self):
+        if self._gdrive is None:
+            self._gdrive = GDrive()
+        return self._gdrive
+
+    @property
+    def forvo(self):
+        if self._forvo is None:
+            self._forvo = Forvo("ssm", region="us-east-2")
+        return self._forvo
+
     def _get_verb_posts(self):
-        titles = self.wpt.get_titles("Verbs")
-        self.verb_list = [title.split("\u2014")[0].strip() for title in titles]
+        # Read from the local post manifest, which only downloads the posts changed since the last run. Verbs keep
+        # their spelling (not the casefolded index key) so they match the verbs on the cards and on Leo
+        titles = self.wpt.posted_titles("Verbs")
+        self._verb_list = [title_verb(title) for title in titles]
     
     def _build_verb_weeks(self):
+        self._weeks = []
         week = []
         for verb in self.verb_list:
             week.append(verb)
             if len(week) == 7:
-                self.weeks.append(week)
+                self._weeks.append(week)
                 week = []
         if len(week) > 0:
-            self.weeks.append(week)
+            self._weeks.append(week)
     
+    @tracing.traced("anki.setup")
     def setup(self):
         fname = self.gdrive.dl_year((len(self.weeks) // 52) + 1)
         self.current_pkg = self.cwd + "/data/" + fname
@@ -124,6 +155,7 @@ class AnkiDeVotD:
         missing = self.get_missing_verbs()
         return False if len(missing) > 0 else True
     
+    @tracing.traced("anki.run")
     def run(self):
         """
         run() - Workflow to update all verbs not yet created in Anki collection.
@@ -139,19 +171,32 @@ class AnkiDeVotD:
                 smallest_index = i
         for verb in self.verb_list[smallest_index:]:
             if verb in missing_verbs:
-                self.add_verb(verb)
+                try:
+                    self.add_verb(verb)
+                except LookupDeferred as e:
+                    # Verbs go into the weekly decks in posted order, so the rest waits for the next run as well
+                    print(f"Stopped at { verb }: { e }")
+                    break
+        verb_cache().flush()
         
         self.package_full()
         self.package_week()
         self.collection.close()
+        print(self.forvo.report())
     
+    @tracing.traced("anki.open_collection")
     def open_collection(self):
+        import anki
         self.collection = anki.Collection('/'.join([self.cwd, self.colln_fname]))
+        self.media_names = None
         
     def importpkg(self):
-        importer = AnkiPackageImporter(self.collection, self.current_pkg)
-        importer.run()
+        from anki.importing.apkg import AnkiPackageImporter
+        with tracing.span("anki.import", bytes=os.path.getsize(self.current_pkg)):
+            importer = AnkiPackageImporter(self.collection, self.current_pkg)
+            importer.run()
     
+    @tracing.traced("anki.get_decks")
     def get_decks(self):
         """
         get_decks() - Gets all decks in the collection and assigns them to the deck dictionary
@@ -179,6 +224,7 @@ class AnkiDeVotD:
                     self.week_decks[week].append(deck.id)
                 else: week = 0
     
+    @tracing.traced("anki.get_verbs")
     def get_verbs(self):
         # Cycle through all decks that fit the criteria
         for key in self.decks.keys():
@@ -260,16 +306,40 @@ class AnkiDeVotD:
         """
         get_media_link(word) - gets the media link if in the media manager or initiates grab + add
         """
-        media_link = f"<div>[sound:{ word }.mp3]</div>"
-        # Default forvo (library) filenames for words are f"{ word }.mp3"
-        if self.collection.media.have(f"{ word }.mp3"):
-            return media_link
-        media_path = self.forvo.get_pronunciation(word)
-        if media_path is not None:
-            self.collection.media.add_file(media_path)
-            return media_link
-        else:
-            return ""
+        return self.get_media_links([word])[word]
+
+    def get_media_links(self, words: list, reserve: int=None) -> dict:
+        """
+        get_media_links(words, reserve=None) -> dict
+            get_media_link for many words. Audio comes from Forvo in one batch (the media store answers words
+            downloaded before), and the files the collection does not hold yet are registered together. reserve is
+            passed to Forvo.get_pronunciations. Raises forvo.LookupDeferred when a word could not be looked up in
+            this run, so no card is saved without audio Forvo may still have.
+        """
+        if self.media_names is None:
+            # One listing of the media folder instead of a collection.media.have() probe per word
+            self.media_names = set(os.listdir(self.collection.media.dir()))
+        links = {}
+        with tracing.span("anki.media", words=len(words)) as span:
+            # Cards made before the media store link the audio as <word>.mp3
+            fetch = [word for word in words if f"{ word }.mp3" not in self.media_names]
+            names = {word: f"{ word }.mp3" for word in words if word not in fetch}
+            paths = self.forvo.get_pronunciations(fetch, reserve=reserve, complete=True) if fetch else {}
+            new = [path for path in paths.values()
+                   if path is not None and os.path.basename(path) not in self.media_names]
+            span.set(hit=len(words) - len(new), miss=len(new))
+            self.register_media(new)
+            names.update((word, os.path.basename(path)) for word, path in paths.items() if path is not None)
+        for word in words:
+            links[word] = f"<div>[sound:{ names[word] }]</div>" if word in names else ""
+        return links
+
+    def register_media(self, paths: list):
+        """
+        register_media(paths) - Adds media files to the collection
+        """
+        for path in paths:
+            self.media_names.add(self.collection.media.add_file(path))
 
     def get_model(self, tense):
         """
@@ -284,10 +354,16 @@ class AnkiDeVotD:
         print(model)
         return model
 
-    def add_verb(self, verb):
+    @tracing.traced("anki.add_verb")
+    def add_verb(self, verb, reserve: int=None):
         """
-        add_verb(verb) - Adds the verb and its conjugations, along with any pronunciations, to the anki collection
-                       - Creates new decks as needed (weekly decks)
+        add_verb(verb, reserve=None) - Adds the verb and its conjugations, along with any pronunciations, to the anki
+                                       collection
+                                     - Creates new decks as needed (weekly decks)
+                                     - reserve: Forvo requests to leave unused today (default Forvo.reserve; the
+                                       verb of the day passes 0)
+                                     - Raises forvo.LookupDeferred, adding nothing, when a pronunciation could not
+                                       be looked up in this run
         """
         # This method has a lot of work to do, but it's all one component. This will be an entry point for
         # votd as well.
@@ -302,14 +378,14 @@ class AnkiDeVotD:
         #
         
         # This is how we define our note information structure:
-        #    LeoVerb - This contains two dictionaries plus the german and english verb:
-        #       - conjugations - German conjugation dictionary
-        #       - en_conjugations - English conjugation dictionary
+        #    LeoVerb - This contains two Conjugation tables plus the german and english verb:
+        #       - conjugations - German conjugation table
+        #       - en_conjugations - English conjugation table
         #       - verb - German infinitive
         #       - english - English infinitive
         #    self.tenses - This contains a reference to the deck tense and a list for each reference:
-        #       - self.tenses[tense][0] - German key hierarchy in LeoVerb.conjugations
-        #       - self.tenses[tense][1] - English key hierarchy in LeoVerb.conjugations
+        #       - self.tenses[tense][0] - German (mood, tense) in LeoVerb.conjugations
+        #       - self.tenses[tense][1] - English (mood, tense) in LeoVerb.en_conjugations
 
         if self.collection is None:
             self.setup()
@@ -320,21 +396,22 @@ class AnkiDeVotD:
         print(json.dumps(decks, indent=4))
         leo = LeoVerb(verb)
         en_inf = '; '.join(leo.english)
-        media_link = self.get_media_link(leo.verb)
+        # Pronunciations of the infinitive and every conjugated form are fetched in one batch
+        words = [leo.verb]
+        for tense in filter(lambda t: t != "Infinitive", decks.keys()):
+            words.extend(form for pronoun, form in leo.conjugations.forms(*self.tenses[tense][0])
+                         if pronoun in PRONOUN_NOTE_TABLE.keys())
+        media_links = self.get_media_links(words, reserve)
         notes = {      # Dictionary of list of cards with Front (english) and Back (german) - Starting with infinitive
-            "Infinitive": [[en_inf, f"{ leo.verb }{ media_link }"]]
+            "Infinitive": [[en_inf, f"{ leo.verb }{ media_links[leo.verb] }"]]
             } 
         for tense in filter(lambda t: t != "Infinitive", decks.keys()):
             tense_notes = []
             path = self.tenses[tense]
             # sets up de_conj and en_conj to be the leo conjugations for this tense
-            de_conj = leo.conjugations
-            for p in path[0]:
-                de_conj = de_conj[p]
-            en_conj = leo.en_conjugations
-            if path[1][0] in en_conj.keys():
-                for p in path[1]:
-                    en_conj = en_conj[p]
+            de_conj = dict(leo.conjugations.forms(*path[0]))
+            if tuple(path[1]) in leo.en_conjugations:
+                en_conj = dict(leo.en_conjugations.forms(*path[1]))
             else:
                 en_conj = {}
             # Cycle through pronouns and create notes
@@ -346,7 +423,7 @@ class AnkiDeVotD:
                     de_tense = ' '.join(self.tenses[tense][0])
                     en_tense = ' '.join(self.tenses[tense][1])
                     
-                    media_link = self.get_media_link(de_conj[pronoun])
+                    media_link = media_links[de_conj[pronoun]]
                     if en_f in en_conj.keys():
                         note_txt = [f"{ en_pn } { en_conj[en_f] }<br>({ en_inf })<br>(<i>{ en_tense }</i>)",
                                     f"{ de_pn } { de_conj[pronoun] }{ media_link }(<i>{ de_tense }</i>)"]
@@ -357,19 +434,22 @@ class AnkiDeVotD:
             notes[tense] = tense_notes
         
         # CREATE CARDS!!!
+        from anki.notes import Note
         for tense in decks.keys():
             model = self.get_model(tense)
             for note_txt in notes[tense]:
-                note = anki.notes.Note(self.collection, model)
+                note = Note(self.collection, model)
                 note.fields = note_txt
                 self.collection.add_note(note, decks[tense])
             if tense == "Infinitive":
                 self.decks[decks[tense]]['verbs'].add(leo.verb)
 
+    @tracing.traced("anki.package_full")
     def package_full(self):
         """
         package_full() - Packages up the latest year and initiates upload to Google Drive
         """
+        from anki.exporting import AnkiPackageExporter
         output_file = '/'.join([self.cwd, self.data_dir, self.full_output_file])
         exporter = AnkiPackageExporter(self.collection)
         exporter.exportInto(output_file)
@@ -382,6 +462,8 @@ class AnkiDeVotD:
         pass
 
 def authorize_drive():
+    from pydrive.auth import GoogleAuth
+    from pydrive.drive import GoogleDrive
     gauth = GoogleAuth()
     gauth.DEFAULT_SETTINGS['client_config_file'] = "client_secret.json"
     gauth.LoadCredentialsFile("drivecreds.txt")
@@ -402,13 +484,17 @@ class GDrive:
     folder_id = None
     
     def __init__(self):
-        os.chdir("auth")
-        self._refresh_creds()
-        self.drive = GoogleDrive(self.gauth)
-        os.chdir("..")
+        if not fixtures.replaying():
+            from pydrive.drive import GoogleDrive
+            with tracing.span("gdrive.auth", "network"):
+                os.chdir("auth")
+                self._refresh_creds()
+                self.drive = GoogleDrive(self.gauth)
+                os.chdir("..")
         self.get_folder_id(self.folder)
     
     def _refresh_creds(self):
+        from pydrive.auth import GoogleAuth
         self.gauth = GoogleAuth()
         self.gauth.LoadCredentialsFile("drivecreds.txt")
         if self.gauth.credentials is None:
@@ -419,11 +505,38 @@ class GDrive:
             self.gauth.Authorize()
         self.gauth.SaveCredentialsFile("drivecreds.txt")
 
+    def _list(self, query: str) -> list:
+        """
+        _list(query) - Drive file list for a query, recorded to / replayed from fixtures when enabled
+        """
+        with tracing.span("gdrive.list", "network", host=DRIVE_HOST):
+            if fixtures.replaying():
+                return fixtures.replay("drive", ["list", query], query)
+            file_list = self.drive.ListFile({'q': query}).GetList()
+            if fixtures.recording():
+                fixtures.record("drive", ["list", query], [dict(f) for f in file_list])
+            return file_list
+
+    def _download(self, f, fname: str):
+        """
+        _download(f, fname) - Saves the content of Drive file f to fname, recorded to / replayed from fixtures
+        """
+        key = ["file", f['id'], f['version']]
+        with tracing.span("gdrive.download", "network", host=DRIVE_HOST, file=f['title']) as span:
+            if fixtures.replaying():
+                fixtures.replay_file("drive", key, fname, f['title'])
+            else:
+                f.GetContentFile(fname)
+                if fixtures.recording():
+                    fixtures.record_file("drive", key, fname)
+            span.set(bytes=os.path.getsize(fname))
+
     def get_folder_id(self, folder):
-        file_list = self.drive.ListFile({'q': "'root' in parents and trashed=false"}).GetList()
+        file_list = self._list("'root' in parents and trashed=false")
         for f in filter(lambda f: f['title']==folder, file_list):
             self.folder_id = f['id']
 
+    @tracing.traced("gdrive.dl_package", "network")
     def dl_package(self, pkg_name) -> bool:
         """
         dl_package(pkg_name) -  Downloads Google Drive package if the remote version is newer than the local version
@@ -431,7 +544,7 @@ class GDrive:
         if self.folder_id is None:
             self.get_folder_id(self.folder)
         os.chdir("data")
-        file_list = self.drive.ListFile({'q': f"'{ self.folder_id }' in parents and trashed=false"}).GetList()
+        file_list = self._list(f"'{ self.folder_id }' in parents and trashed=false")
         # Save the meta info - Only download if the revision is larger
         if os.path.exists(f"{ pkg_name }.meta"):
             with open(f"{ pkg_name }.meta") as metafile:
@@ -443,9 +556,9 @@ class GDrive:
             # Check the version from the disk version (if disk version exists)
             if int(meta['version']) < int(f['version']):
                 print(f"Downloading { f['title'] }")
-                f.GetContentFile(f['title'])
+                self._download(f, f['title'])
                 with open(f"{ pkg_name }.meta", "w") as metafile:
-                    json.dump(f, metafile)
+                    json.dump(dict(f), metafile)
         os.chdir("..")
         return True
         
@@ -476,6 +589,7 @@ class GDrive:
             return None
 
 if __name__ == "__main__":
+    from wpt import WPT
     wpt = WPT("ssm", region="us-east-2")
     advd = AnkiDeVotD(wpt)
     advd.run()
@@ -0,0 +1,370 @@
+#
+# bench.py
+#    -- Benchmark suite for the parse, render and deck build hot paths. Runs on canned data only: pages and
+#       templates are generated here, the verb cache and Anki collection live in a temporary directory and fixture
+#       replay mode is switched on, so nothing goes to the network. The run works in a temporary directory too, so
+#       the files written through relative paths (compiled templates, media) are removed with it.
+#
+# Usage:
+#    python bench.py                  - runs every benchmark and compares it against the stored baseline
+#    python bench.py --save           - runs every benchmark and stores the results as the new baseline
+#    python bench.py name [name ...]  - runs only the named benchmarks (either mode)
+#
+#   Baselines are local: timings only compare on the machine that took them, so each machine keeps its own in
+#   bench_baseline.json next to this file and it is not committed (see .gitignore). Save one with --save before the
+#   change being measured, then run without it. A benchmark slower than its baseline by more than its threshold
+#   (THRESHOLD unless the benchmark sets its own) is reported as a regression and the run exits with status 1.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import timeit
+import contextlib
+import fixtures
+import leoverb
+from leoverb import LeoVerb, verb_cache
+from bench_leoparse import make_search_page
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+THRESHOLD = 0.25        # Allowed slowdown against the baseline (0.25 = 25% slower)
+REPEAT = 5
+COLLECTION_VERBS = 364  # Verbs in the canned Anki collection: a full year of verbs of the day
+ADD_BATCH = 7           # Verbs added per add_verb run: one weekly deck
+
+PRONOUNS = ["ich", "du", "er/sie/es", "wir", "ihr", "sie"]
+EN_PRONOUNS = ["I", "you", "he/she/it", "we", "you", "they"]
+
+TITLE_TEMPLATE = "Private: {{ verb_de }} — {{ verb_en }}"
+BODY_TEMPLATE = """<!-- wp:paragraph -->
+<p><strong>{{ verb_de }}</strong> &mdash; {{ verb_en }}</p>
+<!-- /wp:paragraph -->
+<!-- wp:table -->
+<figure class="wp-block-table"><table><tbody>
+<tr><td>ich</td><td>{{ conj_ich }}</td><td>wir</td><td>{{ conj_wir }}</td></tr>
+<tr><td>du</td><td>{{ conj_du }}</td><td>ihr</td><td>{{ conj_ihr }}</td></tr>
+<tr><td>er/sie/es</td><td>{{ conj_er }}</td><td>sie</td><td>{{ conj_sie }}</td></tr>
+</tbody></table></figure>
+<!-- /wp:table -->
+{% for word in verb_en.split('; ') %}<p>{{ word }}: <a href="https://dict.leo.org/german-english/{{ verb_de }}">{{ word }}</a></p>
+{% endfor %}<p><a href="https://dict.leo.org/pages/flecttab/flectionTable.php?kx={{ verb_leo }}">Verb table</a>
+ | <a href="https://dict.leo.org/forum/viewWrongentry.php?idThread={{ info_leo }}">Info</a></p>
+"""
+
+_benchmarks = {}
+
+
+def benchmark(name: str, number: int=1, threshold: float=None):
+    """
+    @benchmark(name, number=1, threshold=None)
+        Registers a benchmark. The decorated function does any setup and returns the callable to time, which is run
+        number times per measurement.
+    """
+    def register(setup):
+        _benchmarks[name] = {"setup": setup, "number": number, "threshold": threshold}
+        return setup
+    return register
+
+
+def make_de_table(verb: str) -> str:
+    """
+    make_de_table(verb) - A dict.leo.org German conjugation table page for a regular verb
+    """
+    stem = verb[:-2]
+    endings = ["e", "st", "t", "en", "t", "en"]
+    page = ['<html><body><div class="pagecontent"><table>']
+    for mood in leoverb.TENSE_HEADERS:
+        page.append(f'<tr><th colspan="2"><h2>{ mood }</h2></th></tr>')
+        for tense in ["Präsens", "Perfekt", "Präteritum", "Plusquamperfekt", "Futur I", "Futur II"]:
+            page.append(f'<tr><th colspan="2"><h3>{ tense }</h3></th></tr>')
+            for pronoun, ending in zip(PRONOUNS, endings):
+                page.append(f'<tr><td></td><td><span>{ pronoun }</span>\u200b <b>{ stem }{ ending }</b></td></tr>')
+    page.append('</table></div></body></html>')
+    return '\n'.join(page)
+
+
+def make_en_table(verb: str) -> str:
+    """
+    make_en_table(verb) - A dict.leo.org English conjugation table page
+    """
+    page = ['<html><body><div class="pagecontent"><table>']
+    for mood in leoverb.EN_TENSE_HEADERS:
+        page.append(f'<tr><th colspan="2"><h2>{ mood }</h2></th></tr>')
+        for tense in ["Simple present", "Present progressive", "Simple past", "Past progressive", "Present perfect"]:
+            page.append(f'<tr><th colspan="2"><h3>{ tense }</h3></th></tr>')
+            for pronoun in EN_PRONOUNS:
+                form = verb + "s" if pronoun == "he/she/it" else verb
+                page.append(f'<tr><td></td><td><span>{ pronoun }</span> <b>{ form }</b></td></tr>')
+    page.append('</table></div></body></html>')
+    return '\n'.join(page)
+
+
+def canned_verb(i: int) -> LeoVerb:
+    """
+    canned_verb(i) - A fully looked up LeoVerb built from canned pages
+    """
+    leo = LeoVerb(f"bench{ i:04d}en", lookup=False)
+    leo.english = [f"to walk{ i }", f"to go{ i }"]
+    leo.table_link = f"{ leoverb.LEO_URL }/pages/flecttab/flectionTable.php?kx=k{ i }"
+    leo.table_key = f"k{ i }"
+    leo.info_leo = f"AIID{ i }"
+    leo.en_table_link = f"{ leoverb.LEO_URL }/pages/flecttab/flectionTable.php?kx=e{ i }"
+    leo.en_table_key = f"e{ i }"
+    leo.get_table("de", make_de_table(leo.verb))
+    leo.get_table("en", make_en_table(f"walk{ i }"))
+    return leo
+
+
+class CannedPosts:
+    """
+    CannedPosts - Stands in for WPT as the source of posted verb titles
+    """
+    def __init__(self, verbs: list):
+        self.titles = [f"{ verb } — to walk" for verb in verbs]
+
+    def get_titles(self, category: str) -> list:
+        return self.titles
+
+    def posted_titles(self, category: str) -> list:
+        return self.titles
+
+
+class CannedDrive:
+    """
+    CannedDrive - Stands in for GDrive. The canned collection is built in the workspace, nothing is downloaded.
+    """
+    def dl_year(self, year: int) -> str:
+        return None
+
+
+class CannedForvo:
+    """
+    CannedForvo - Stands in for Forvo, writing a small mp3 per word into the workspace
+    """
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+
+    def get_pronunciation(self, word: str) -> str:
+        fname = f"{ self.data_dir }/{ word }.mp3"
+        with open(fname, 'wb') as fp:
+            fp.write(b"ID3" + word.encode('UTF-8') * 64)
+        return fname
+
+    def get_pronunciations(self, words: list, reserve: int=None, complete: bool=False) -> dict:
+        return {word: self.get_pronunciation(word) for word in words}
+
+
+class Workspace:
+    """
+    Workspace - Temporary directory holding the verb cache and the canned Anki collection shared by the deck
+                benchmarks. The collection is built once, by adding COLLECTION_VERBS canned verbs.
+    """
+    root = None
+    advd = None
+    next_verb = None
+
+    def __init__(self):
+        from ankidevotd import AnkiDeVotD
+        self.root = tempfile.mkdtemp(prefix="votd_bench_")
+        leoverb.DATABASE = os.path.join(self.root, "verb.sqlite")
+        leoverb.DBM_DATABASE = os.path.join(self.root, "verb.dbm")
+        verbs = self.cache_verbs(0, COLLECTION_VERBS)
+        os.makedirs(os.path.join(self.root, "data", "current"))
+        with quiet():
+            self.advd = AnkiDeVotD(CannedPosts(verbs), gdrive=CannedDrive(),
+                                   forvo=CannedForvo(os.path.join(self.root, "forvo")))
+            self.advd.cwd = self.root
+            self.advd.open_collection()
+            self.advd.create_new_weekly_deck(1)
+            for verb in verbs:
+                self.advd.add_verb(verb)
+            # Re-read the decks as AnkiDeVotD.setup() does after importing a package, so they list their cards
+            self.advd.decks = {}
+            self.advd.week_decks = {}
+            self.advd.get_decks()
+            self.advd.get_verbs()
+        self.next_verb = COLLECTION_VERBS
+
+    def cache_verbs(self, start: int, count: int) -> list:
+        records = {}
+        for i in range(start, start + count):
+            leo = canned_verb(i)
+            records[leo.verb] = leo._record()
+        verb_cache().put_many(records)
+        verb_cache().flush()
+        return list(records.keys())
+
+    def close(self):
+        if self.advd.collection is not None:
+            self.advd.collection.close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+_workspace = None
+
+def workspace() -> Workspace:
+    global _workspace
+    if _workspace is None:
+        _workspace = Workspace()
+    return _workspace
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    quiet() - Swallows the progress output of the code being timed
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@benchmark("leo_table_de", number=20)
+def bench_table_de():
+    leo = LeoVerb("gehen", lookup=False)
+    page = make_de_table("gehen")
+    return lambda: leo.get_table("de", page)
+
+@benchmark("leo_table_en", number=20)
+def bench_table_en():
+    leo = LeoVerb("gehen", lookup=False)
+    leo.en_table_link = leoverb.LEO_URL
+    page = make_en_table("walk")
+    return lambda: leo.get_table("en", page)
+
+@benchmark("leo_verb_section", number=20)
+def bench_verb_section():
+    leo = LeoVerb("gehen", lookup=False)
+    page = make_search_page()
+    def run():
+        leo.get_verb_search(page)
+        leo.get_verb_section()
+    return run
+
+@benchmark("leo_verb_rows", number=20)
+def bench_verb_rows():
+    leo = LeoVerb("gehen", lookup=False)
+    leo.get_verb_search(make_search_page())
+    leo.get_verb_section()
+    return leo.get_verb_rows
+
+def _wpt():
+    from wpt import WPT
+    wpt = WPT(secret_store="ssm")
+    leo = canned_verb(0)
+    wpt.set_template(TITLE_TEMPLATE, BODY_TEMPLATE)
+    wpt.set_template_vars(leo.template_vars("Indikativ", "Präsens"))
+    return wpt
+
+@benchmark("wpt_template", number=20)
+def bench_wpt_template():
+    wpt = _wpt()
+    return lambda: wpt.set_template(TITLE_TEMPLATE, BODY_TEMPLATE)
+
+@benchmark("wpt_title", number=200)
+def bench_wpt_title():
+    return _wpt().get_title
+
+@benchmark("wpt_body", number=200)
+def bench_wpt_body():
+    return _wpt().get_body
+
+@benchmark("anki_get_verbs")
+def bench_get_verbs():
+    advd = workspace().advd
+    def run():
+        with quiet():
+            advd.get_verbs()
+    return run
+
+@benchmark("anki_add_verb", threshold=0.5)
+def bench_add_verb():
+    ws = workspace()
+    def run():
+        verbs = ws.cache_verbs(ws.next_verb, ADD_BATCH)
+        ws.next_verb += ADD_BATCH
+        ws.advd.verb_list.extend(verbs)
+        with quiet():
+            for verb in verbs:
+                ws.advd.add_verb(verb)
+    return run
+
+@benchmark("anki_package_full", threshold=0.5)
+def bench_package_full():
+    advd = workspace().advd
+    os.makedirs(os.path.join(advd.cwd, advd.data_dir), exist_ok=True)
+    return advd.package_full
+
+
+def measure(name: str) -> float:
+    """
+    measure(name) -> seconds per run of the benchmark (best of REPEAT)
+    """
+    entry = _benchmarks[name]
+    run = entry['setup']()
+    return min(timeit.repeat(run, number=entry['number'], repeat=REPEAT)) / entry['number']
+
+
+def load_baseline() -> dict:
+    if not os.path.exists(BASELINE):
+        return {}
+    with open(BASELINE) as fp:
+        return json.load(fp)
+
+
+def save_baseline(results: dict):
+    baseline = load_baseline()
+    baseline.update({name: {"seconds": seconds} for name, seconds in results.items()})
+    with open(BASELINE, 'w') as fp:
+        json.dump(baseline, fp, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    fixtures.configure(mode="replay")
+    args = sys.argv[1:]
+    save = "--save" in args
+    names = [arg for arg in args if arg != "--save"] or list(_benchmarks.keys())
+    unknown = [name for name in names if name not in _benchmarks]
+    if unknown:
+        print(f"Unknown benchmarks { unknown }. Available:")
+        for name in _benchmarks.keys():
+            print(f"    { name }")
+        exit(1)
+
+    baseline = load_baseline()
+    if not baseline and not save:
+        print(f"No baseline in { BASELINE }, run with --save first to store one for this machine")
+    results = {}
+    regressions = []
+    cwd = os.getcwd()
+    run_dir = tempfile.mkdtemp(prefix="votd_bench_run_")
+    try:
+        os.chdir(run_dir)
+        for name in names:
+            results[name] = measure(name)
+            line = f"{ name:20s} { results[name] * 1000:10.3f} ms"
+            if name in baseline and not save:
+                ratio = results[name] / baseline[name]['seconds']
+                threshold = _benchmarks[name]['threshold'] or THRESHOLD
+                line += f"  baseline { baseline[name]['seconds'] * 1000:10.3f} ms  { ratio:5.2f}x"
+                if ratio > 1 + threshold:
+                    line += "  REGRESSION"
+                    regressions.append(name)
+            print(line)
+    finally:
+        if _workspace is not None:
+            _workspace.close()
+        os.chdir(cwd)
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    if save:
+        save_baseline(results)
+        print(f"Saved { len(results) } baselines to { BASELINE }")
+    elif regressions:
+        print(f"{ len(regressions) } regression(s): { ', '.join(regressions) }")
+        exit(1)
@@ -0,0 +1,91 @@
+#
+# bench_cli.py
+#    -- Import time and cold start of the verb.py CLI, one fresh interpreter per measurement
+#
+# Usage:
+#    python bench_cli.py              - measures every case below
+#    python bench_cli.py votd anki    - measures only the named cases
+#
+#   Cases:
+#       import   - python -c "import verb"
+#       bad_args - an unknown command, which should fail before anything is built
+#       votd / week / anki - each CLI command, run in fixture replay mode against an empty fixture directory. The
+#                  run stops at its first external call (fixtures.FixtureMissing), so the time measured is the cold
+#                  start up to the point where the command would start talking to the network.
+#
+#   For each case the best wall time of REPEAT runs is printed with the slowest top level imports of that run
+#   (python -X importtime), which shows whether anki, pydrive, boto3, requests or jinja2 were loaded.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+REPEAT = 5
+TOP_IMPORTS = 5     # Slowest top level imports listed per case
+HEAVY = ["anki", "pydrive", "boto3", "requests", "jinja2"]
+
+CASES = {
+    "import": ["-c", "import verb"],
+    "bad_args": ["verb.py", "nosuch"],
+    "votd": ["verb.py", "votd", "gehen"],
+    "week": ["verb.py", "week", "2030-01-07", "gehen", "kommen", "sehen", "lesen", "laufen", "essen", "trinken"],
+    "anki": ["verb.py", "anki"]
+}
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    parse_importtime(stderr) -> dict - Top level module --> cumulative import time (s) from python -X importtime
+    """
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        name = fields[2].rstrip()
+        # Nested imports are indented below the module that imported them
+        if name.startswith("  ") or not fields[1].strip().isdigit():
+            continue
+        top = name.strip().split(".")[0]
+        imports[top] = imports.get(top, 0) + int(fields[1]) / 1e6
+    return imports
+
+
+def run(args: list, fixture_dir: str) -> dict:
+    env = dict(os.environ, VOTD_FIXTURES="replay", VOTD_FIXTURE_DIR=fixture_dir)
+    env.pop("VOTD_TRACE", None)
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime"] + args, env=env, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - start
+    errors = [line for line in proc.stderr.splitlines() if line and not line.startswith("import time:")]
+    return {
+        "wall": wall,
+        "status": proc.returncode,
+        "stopped": errors[-1] if errors else "",
+        "imports": parse_importtime(proc.stderr)
+    }
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(CASES.keys())
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        print(f"Unknown cases { unknown }. Available: { list(CASES.keys()) }")
+        exit(1)
+    with tempfile.TemporaryDirectory(prefix="votd_bench_cli_") as fixture_dir:
+        for name in names:
+            best = min((run(CASES[name], fixture_dir) for i in range(REPEAT)), key=lambda r: r['wall'])
+            heavy = [module for module in HEAVY if module in best['imports']]
+            print(f"{ name:10s} { best['wall'] * 1000:9.1f} ms  exit { best['status'] }"
+                  f"  heavy imports: { ', '.join(heavy) or 'none' }")
+            slowest = sorted(best['imports'].items(), key=lambda item: -item[1])[:TOP_IMPORTS]
+            print(f"{ '':10s} " + ", ".join(f"{ module } { seconds * 1000:.1f} ms" for module, seconds in slowest))
+            if best['stopped']:
+                print(f"{ '':10s} stopped at: { best['stopped'][:100] }")
@@ -0,0 +1,60 @@
+#
+# bench_conjugation.py
+#    -- Compares the memory held by conjugation tables as nested dictionaries (the layout LeoVerb used to keep)
+#       against Conjugation objects, for a bulk deck build's worth of verbs
+#
+# Usage:
+#    python bench_conjugation.py [number of verbs]
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import sys
+import tracemalloc
+from conjugation import Conjugation
+
+PRONOUNS = ["ich", "du", "er/sie/es", "wir", "ihr", "sie"]
+# Shape of a dict.leo.org German table: mood --> tenses
+MOODS = {
+    "Indikativ": ["Präsens", "Perfekt", "Präteritum", "Plusquamperfekt", "Futur I", "Futur II"],
+    "Konjunktiv": ["Präsens", "Perfekt", "Konjunktiv II - Präteritum", "Konjunktiv II - Plusquamperfekt",
+                   "Futur I", "Futur II"],
+    "Imperativ": ["Präsens"],
+    "Unpersönliche Zeiten": ["Partizip Präsens", "Partizip Perfekt"]}
+
+
+def parsed(text: str) -> str:
+    # Keys parsed from a page are new string objects for every verb, not shared constants
+    return ''.join(list(text))
+
+
+def make_dict(i: int) -> dict:
+    """
+    make_dict(i) - A table as LeoVerb.get_table used to build it
+    """
+    table = {}
+    for mood, tenses in MOODS.items():
+        table[parsed(mood)] = {}
+        for tense in tenses:
+            pronouns = PRONOUNS if not tense.startswith("Partizip") else ["-"]
+            table[mood][parsed(tense)] = {parsed(p): f"geh{ i }e { tense[:3] }" for p in pronouns}
+    return table
+
+
+def measure(build, count: int) -> int:
+    tracemalloc.start()
+    tables = [build(i) for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tables
+    return size
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    as_dict = measure(make_dict, count)
+    as_conj = measure(lambda i: Conjugation.from_dict(make_dict(i)), count)
+    print(f"{ count } verbs")
+    print(f"    nested dicts  { as_dict / 2**20:8.2f} MiB  ({ as_dict / count:7.0f} bytes/verb)")
+    print(f"    Conjugation   { as_conj / 2**20:8.2f} MiB  ({ as_conj / count:7.0f} bytes/verb)")
+    print(f"    reduction     { as_dict / as_conj:8.1f}x")
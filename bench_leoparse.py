@@ -0,0 +1,126 @@
+#
+# bench_leoparse.py
+#    -- Compares the single pass leoparse tokenizers against the tempered-dot regexes LeoVerb used before them
+#
+# Usage:
+#    python bench_leoparse.py                            - runs against generated Leo-like pages
+#    python bench_leoparse.py search.html table.html     - runs against recorded dict.leo.org pages
+#                                                          (a search page and a verb table page)
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import re
+import sys
+import timeit
+import unicodedata
+import leoparse
+
+REPEAT = 5
+
+
+def sanitize_text(txt) -> str:
+    return ''.join([c for c in txt if unicodedata.category(c)[0]!="C"])
+
+# The regex implementations below are the ones LeoVerb used before leoparse. They are kept here only to compare.
+def regex_sections(html: str) -> dict:
+    section_dic = {}
+    re_sec = re.compile('(<thead>(((?!<thead>).)*))')
+    re_row = re.compile('(<tr>(((?!</tr>).)*)</tr>)')
+    sections = re_sec.findall(html)
+    for section in sections:
+        header = re_row.search(section[0])
+        if header:
+            title = re.search(r'<h2 (((?!>).)*)>(((?!<).)*)</h2>', header.group())
+            if title:
+                section_dic[title.groups()[2]] = section[0]
+    return section_dic
+
+def regex_rows(html: str) -> list:
+    regex = re.compile('(<tr(((?!>).)*)data-dz-ui="dictentry"(((?!>).)*)>(((?!</tr>).)*)</tr>)')
+    return [row[0] for row in regex.findall(html)]
+
+def regex_table(html: str) -> list:
+    conj_tab = []
+    rows_expr = re.compile("(<tr(((?!>).)*)>(((?!</tr>).)*)</tr>)")
+    head_expr = re.compile("(<th(((?!>).)*)>(((?!<th>).)*)</th>)")
+    cols_expr = re.compile("(<td(((?!>).)*)>(((?!</td>).)*)</td>)")
+    strip_expr = re.compile("<[^>]+>")
+    rows = rows_expr.findall(html)
+    for row in rows:
+        row_text = row[0]
+        cols =  cols_expr.findall(row_text)
+        if len(cols) == 0:
+            cols = head_expr.findall(row_text)
+        row_tab = ""
+        for col in cols:
+            row_tab = strip_expr.sub('', col[0].lstrip().rstrip())
+        if row_tab:
+            conj_tab.append(row_tab)
+    return conj_tab
+
+
+def make_search_page(sections: int = 6, rows: int = 40) -> str:
+    """
+    make_search_page(sections, rows) - Builds a page shaped like a dict.leo.org search result
+    """
+    titles = ["Nouns", "Verbs", "Adjectives", "Adverbs", "Phrases", "Examples", "Forum"]
+    page = ['<html><head><title>LEO</title></head><body><div id="centerColumn">']
+    for s in range(sections):
+        title = titles[s % len(titles)]
+        page.append('<table class="tblf1 tblf-fullwidth tblf-alternate"><thead>')
+        page.append(f'<tr><th colspan="5"><h2 class="bg-c-orange">{ title }</h2></th></tr></thead><tbody>')
+        for r in range(rows):
+            page.append(
+                f'<tr data-dz-ui="dictentry" data-dz-rel-uid="{ s }{ r }" data-dz-rel-aiid="AIID{ r }">'
+                f'<td class="bg-c-grey"><i class="icon">&nbsp;</i></td>'
+                f'<td data-dz-attr="relink" lang="en"><samp><a href="/german-english/to">to</a> '
+                f'<a href="/german-english/walk{ r }">walk{ r }</a></samp></td>'
+                f'<td data-dz-attr="relink" lang="de"><samp><a href="/englisch-deutsch/gehen{ r }">gehen{ r }</a> '
+                f'<a href="/pages/flecttab/flectionTable.php?kx=k{ r }" data-dz-flex-label-1="gehen{ r }" '
+                f'data-dz-flex-table-1="DE{ r }" title="Open verb table">Verb table</a>'
+                f'<sup>{ r }</sup> | ging, gegangen | </samp></td>'
+                f'<td><i class="ico" data-dz-rel-aiid="AIID{ r }">&nbsp;</i></td></tr>')
+        page.append('</tbody></table>')
+    page.append('</div></body></html>')
+    return '\n'.join(page)
+
+
+def make_table_page(moods: int = 4, tenses: int = 6) -> str:
+    """
+    make_table_page(moods, tenses) - Builds a page shaped like a dict.leo.org verb conjugation table
+    """
+    pronouns = ["ich", "du", "er/sie/es", "wir", "ihr", "sie"]
+    page = ['<html><body><div class="pagecontent">']
+    for m in range(moods):
+        page.append(f'<table class="tb-bg-alt-lightgrey"><tr><th colspan="2"><h2>Mood { m }</h2></th></tr>')
+        for t in range(tenses):
+            page.append(f'<tr><th colspan="2"><h3>Tense { t }</h3></th></tr>')
+            for p in pronouns:
+                page.append(f'<tr><td class="pronoun"></td><td><span>{ p }</span> <b>geh{ t }e</b></td></tr>')
+        page.append('</table>')
+    page.append('</div></body></html>')
+    return '\n'.join(page)
+
+
+def bench(name: str, old, new, text: str):
+    assert old(text) == new(text), f"{ name }: regex and tokenizer results differ"
+    t_old = min(timeit.repeat(lambda: old(text), number=1, repeat=REPEAT))
+    t_new = min(timeit.repeat(lambda: new(text), number=1, repeat=REPEAT))
+    print(f"{ name:10s} { len(text):10d} chars  regex { t_old * 1000:9.2f} ms  tokenizer { t_new * 1000:9.2f} ms"
+          f"  speedup { t_old / t_new:6.1f}x")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        with open(sys.argv[1]) as fp:
+            search = sanitize_text(fp.read())
+        with open(sys.argv[2]) as fp:
+            table = fp.read().replace('\u200b', '')
+    else:
+        search = sanitize_text(make_search_page())
+        table = make_table_page()
+    bench("sections", regex_sections, leoparse.get_sections, search)
+    verbs = leoparse.get_sections(search).get("Verbs", search)
+    bench("rows", regex_rows, leoparse.get_dictentry_rows, verbs)
+    bench("table", regex_table, leoparse.get_table_rows, table)
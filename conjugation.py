@@ -0,0 +1,116 @@
+#
+# Conjugation
+#   Compact conjugation table for one verb in one language. The nested {mood: {tense: {pronoun: form}}} dictionaries
+#   LeoVerb used to hold cost several dicts and a fresh copy of every pronoun / tense key per verb. A Conjugation
+#   holds just two references:
+#       layout - tuple of (mood, tense, pronouns) entries describing the table. Layouts are interned, so every verb
+#                with the same table shape (almost all of them) shares a single layout object, and its keys are
+#                interned strings.
+#       values - flat tuple of the conjugated forms, in layout order
+#   Lookups by (mood, tense) go through an index built once per layout.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import sys
+
+_LAYOUTS = {}    # layout --> the shared layout object
+_INDEXES = {}    # id(layout) --> {(mood, tense): (start, pronouns)}
+
+
+def _intern_layout(layout: tuple) -> tuple:
+    shared = _LAYOUTS.get(layout)
+    if shared is None:
+        shared = tuple((sys.intern(mood), sys.intern(tense), tuple(sys.intern(p) for p in pronouns))
+                       for mood, tense, pronouns in layout)
+        _LAYOUTS[shared] = shared
+        index = {}
+        start = 0
+        for mood, tense, pronouns in shared:
+            index[(mood, tense)] = (start, pronouns)
+            start += len(pronouns)
+        _INDEXES[id(shared)] = index
+    return shared
+
+
+class Conjugation:
+    """
+    Conjugation - Immutable conjugation table indexed by (mood, tense, pronoun)
+
+    Methods:
+        Conjugation.from_dict(conjugations) - Builds the table from {mood: {tense: {pronoun: form}}}
+        Conjugation.from_rows(rows)         - Builds the table from (mood, tense, pronoun, form) rows in table order
+        (mood, tense) in conj               - whether the table has the tense
+        forms(mood, tense)                  - ((pronoun, form), ...) for one tense, in table order
+        get(mood, tense, pronoun)           - one form, or None
+        rows()                              - (mood, tense, pronoun, form) for every form, in table order
+        to_dict()                           - the nested dictionary layout
+    """
+    __slots__ = ("layout", "values")
+
+    def __init__(self, layout: tuple=(), forms: tuple=()):
+        self.layout = _intern_layout(layout)
+        self.values = tuple(forms)
+
+    @classmethod
+    def from_dict(cls, conjugations: dict) -> "Conjugation":
+        if isinstance(conjugations, Conjugation):
+            return conjugations
+        layout = []
+        forms = []
+        for mood, tenses in (conjugations or {}).items():
+            for tense, tense_forms in tenses.items():
+                layout.append((mood, tense, tuple(tense_forms.keys())))
+                forms.extend(tense_forms.values())
+        return cls(tuple(layout), forms)
+
+    @classmethod
+    def from_rows(cls, rows) -> "Conjugation":
+        conjugations = {}
+        for mood, tense, pronoun, form in rows:
+            conjugations.setdefault(mood, {}).setdefault(tense, {})[pronoun] = form
+        return cls.from_dict(conjugations)
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in _INDEXES[id(self.layout)]
+
+    def __bool__(self) -> bool:
+        return len(self.layout) > 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, dict):
+            other = Conjugation.from_dict(other)
+        if not isinstance(other, Conjugation):
+            return NotImplemented
+        return self.layout is other.layout and self.values == other.values
+
+    def __repr__(self) -> str:
+        return f"Conjugation({ self.to_dict() })"
+
+    def forms(self, mood: str, tense: str) -> tuple:
+        """
+        forms(mood, tense) -> ((pronoun, form), ...) - raises KeyError when the table has no such tense
+        """
+        start, pronouns = _INDEXES[id(self.layout)][(mood, tense)]
+        return tuple(zip(pronouns, self.values[start:start + len(pronouns)]))
+
+    def get(self, mood: str, tense: str, pronoun: str, default: str=None) -> str:
+        entry = _INDEXES[id(self.layout)].get((mood, tense))
+        if entry is None or pronoun not in entry[1]:
+            return default
+        return self.values[entry[0] + entry[1].index(pronoun)]
+
+    def rows(self):
+        i = 0
+        for mood, tense, pronouns in self.layout:
+            for pronoun in pronouns:
+                yield mood, tense, pronoun, self.values[i]
+                i += 1
+
+    def to_dict(self) -> dict:
+        conjugations = {}
+        i = 0
+        for mood, tense, pronouns in self.layout:
+            conjugations.setdefault(mood, {})[tense] = dict(zip(pronouns, self.values[i:i + len(pronouns)]))
+            i += len(pronouns)
+        return conjugations
@@ -0,0 +1,484 @@
+#
+# Service emulator
+#   A local stand-in for the parts of the external services this project calls, so the client classes can be run
+#   and load tested without the network:
+#       WordPress REST v1.1 - POST /oauth2/token, GET /rest/v1.1/sites/<site>/posts/ (list and search),
+#                             GET /rest/v1.1/sites/<site>/posts/<id> and POST /rest/v1.1/sites/<site>/posts/new/
+#       dict.leo.org        - GET /german-english/<verb> (search page) and GET /pages/flecttab/flectionTable.php
+#       Forvo               - GET /key/<key>/format/json/action/word-pronunciations/word/<word>/... and the mp3s
+#       Google Drive v2     - GET /drive/v2/files?q=... (list) and GET /drive/v2/files/<id>?alt=media (download)
+#   Pages and posts are generated from the request (every verb exists), in the shapes leoparse.py, WPT and Forvo
+#   read. Posts created through posts/new are kept in memory for the life of the server.
+#
+#   Every service can be given a latency (seconds, with relative jitter), an error rate (fraction of requests
+#   answered 503) and a quota (requests per quota window, answered 429 - or Forvo's "Limit/day reached." - when
+#   used up). Values are set for all services or per service (wp, leo, forvo, drive):
+#       python emulator.py --port 8765 --latency 0.05 --latency leo=0.2 --error-rate forvo=0.01 --quota forvo=500
+#
+#   loadgen.py points WPT, LeoVerb and Forvo at an emulator and drives them at a chosen concurrency.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+
+SERVICES = ["wp", "leo", "forvo", "drive"]
+SITE = "emulator.local"
+TEMPLATE_ID = 1             # ID of the (private) template post
+SEED_POSTS = 400            # Published Verbs posts created at start
+TOKEN_LIFETIME = 14 * 24 * 3600
+QUOTA_WINDOW = 24 * 3600    # Seconds before the quota counters start again
+MAX_POSTS_PAGE = 100        # Largest "number" the posts list accepts
+FORVO_MISS_RATE = 0.05      # Fraction of words Forvo has no pronunciation for
+MP3_BYTES = 16 * 1024       # Size of a generated pronunciation
+
+TEMPLATE_TITLE = "{{ verb_de }} &#8212; {{ verb_en }}"
+TEMPLATE_BODY = """<p>{{ verb_de }} ({{ verb_en }})</p>
+<table><tr><td>ich</td><td>{{ conj_ich }}</td></tr><tr><td>du</td><td>{{ conj_du }}</td></tr>
+<tr><td>er/sie/es</td><td>{{ conj_er }}</td></tr><tr><td>wir</td><td>{{ conj_wir }}</td></tr>
+<tr><td>ihr</td><td>{{ conj_ihr }}</td></tr><tr><td>sie/Sie</td><td>{{ conj_sie }}</td></tr></table>
+<p><a href="https://dict.leo.org/pages/flecttab/flectionTable.php?kx={{ verb_leo }}">LEO</a>
+<a href="https://dict.leo.org/forum/{{ info_leo }}">Forum</a></p>"""
+
+PRONOUNS = [("ich", "e"), ("du", "st"), ("er/sie/es", "t"), ("wir", "en"), ("ihr", "t"), ("sie/Sie", "en")]
+EN_PRONOUNS = [("I", ""), ("you", ""), ("he/she/it", "s"), ("we", ""), ("you", ""), ("they", "")]
+DE_TENSES = {"Indikativ": ["Präsens", "Präteritum"], "Konjunktiv": ["Präsens"]}
+EN_TENSES = {"Indicative": ["Simple present", "Simple past"], "Conditional": ["Simple"]}
+
+
+def _timestamp(when: datetime) -> str:
+    return when.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+def _now() -> str:
+    return _timestamp(datetime.now(timezone.utc))
+
+def _english(verb: str) -> str:
+    # A stable made-up English verb for a German one ("gehen" --> "gehenize")
+    return (re.sub(r'[^a-z]', '', verb.casefold()) or "do") + "ize"
+
+def _stem(verb: str) -> str:
+    return verb[:-2] if verb.endswith("en") else verb[:-1] if verb.endswith("n") else verb
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode('UTF-8')).digest()[:4], "big")
+
+
+def parse_settings(values: list, convert=float) -> dict:
+    """
+    parse_settings(values, convert=float) -> dict - ["0.05", "leo=0.2"] --> {"*": 0.05, "leo": 0.2}
+    """
+    settings = {}
+    for value in values or []:
+        service, _, setting = value.rpartition("=")
+        if service and service not in SERVICES:
+            raise Exception(f"Service must be one of { SERVICES }")
+        settings[service or "*"] = convert(setting)
+    return settings
+
+
+class Emulator:
+    """
+    Emulator - Threaded local HTTP server answering for WordPress, dict.leo.org, Forvo and Google Drive
+
+    Methods:
+        Emulator(host, port, latency, jitter, error_rate, quota, ...) - Constructor. latency / error_rate / quota are
+                                                                       a value for every service or {service: value}
+        start() -> str - starts serving on a background thread, returns the base URL
+        stop() - shuts the server down
+        stats() - per-service requests, errors injected and requests over quota
+        url - base URL ("http://127.0.0.1:<port>")
+    """
+    host = None
+    port = None
+    url = None
+    server = None
+    thread = None
+    latency = None
+    jitter = None
+    error_rate = None
+    quota = None
+    quota_window = None
+    token_lifetime = None
+    forvo_miss_rate = None
+    counts = None
+    posts = None
+    tokens = None
+    lock = None
+
+    def __init__(self, host: str="127.0.0.1", port: int=0, latency=0.0, jitter: float=0.0, error_rate=0.0,
+                 quota=None, quota_window: float=QUOTA_WINDOW, token_lifetime: int=TOKEN_LIFETIME,
+                 seed_posts: int=SEED_POSTS, forvo_miss_rate: float=FORVO_MISS_RATE):
+        self.host = host
+        self.port = port
+        self.latency = latency if isinstance(latency, dict) else {"*": latency}
+        self.jitter = jitter
+        self.error_rate = error_rate if isinstance(error_rate, dict) else {"*": error_rate}
+        self.quota = quota if isinstance(quota, dict) else {"*": quota}
+        self.quota_window = quota_window
+        self.token_lifetime = token_lifetime
+        self.forvo_miss_rate = forvo_miss_rate
+        self.lock = threading.Lock()
+        self.counts = {service: {"requests": 0, "errors": 0, "over_quota": 0, "window": 0, "window_start": time.time()}
+                       for service in SERVICES}
+        self.tokens = {}
+        self.posts = {}
+        self._seed(seed_posts)
+
+    def _setting(self, settings: dict, service: str):
+        return settings.get(service, settings.get("*"))
+
+    def _seed(self, count: int):
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        self._add_post("Private: " + TEMPLATE_TITLE, TEMPLATE_BODY, [], status="private",
+                       date=now - timedelta(days=count + 1))
+        for i in range(count):
+            verb = f"verb{ i }en"
+            self._add_post(f"{ verb } &#8212; to { _english(verb) }", f"<p>{ verb }</p>", ["Verbs"],
+                           date=now - timedelta(days=count - i))
+
+    def _add_post(self, title: str, content: str, categories: list, tags: list=None, status: str="publish",
+                  date: datetime=None) -> dict:
+        date = date or datetime.now(timezone.utc).replace(microsecond=0)
+        if status == "publish" and date > datetime.now(timezone.utc):
+            status = "future"
+        post_id = len(self.posts) + 1
+        post = {
+            "ID": post_id,
+            "title": title,
+            "content": content,
+            "URL": f"https://{ SITE }/{ date:%Y/%m/%d}/{ post_id }/",
+            "date": _timestamp(date),
+            "modified": _now(),
+            "status": status,
+            "categories": {name: {"name": name} for name in categories},
+            "tags": {name: {"name": name} for name in (tags or [])}
+        }
+        self.posts[post_id] = post
+        return post
+
+    def start(self) -> str:
+        emulator = self
+
+        class Handler(_Handler):
+            pass
+        Handler.emulator = emulator
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.url = f"http://{ self.host }:{ self.port }"
+        self.thread = threading.Thread(target=self.server.serve_forever, name="emulator", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def admit(self, service: str) -> int:
+        """
+        admit(service) -> int - Counts a request and sleeps for the service latency. Returns 0 to answer it,
+                                429 when the service quota is used up or 503 for an injected error.
+        """
+        latency = self._setting(self.latency, service) or 0.0
+        if latency:
+            time.sleep(max(0.0, latency * (1 + self.jitter * random.uniform(-1, 1))))
+        quota = self._setting(self.quota, service)
+        with self.lock:
+            counts = self.counts[service]
+            counts['requests'] += 1
+            if time.time() - counts['window_start'] > self.quota_window:
+                counts['window'] = 0
+                counts['window_start'] = time.time()
+            if quota is not None and counts['window'] >= quota:
+                counts['over_quota'] += 1
+                return 429
+            counts['window'] += 1
+            if random.random() < (self._setting(self.error_rate, service) or 0.0):
+                counts['errors'] += 1
+                return 503
+        return 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {service: {key: c[key] for key in ("requests", "errors", "over_quota")}
+                    for service, c in self.counts.items()}
+
+    def report(self) -> str:
+        lines = [f"{ 'service':8s} { 'requests':>9s} { 'errors':>7s} { 'quota':>7s}"]
+        for service, s in self.stats().items():
+            lines.append(f"{ service:8s} { s['requests']:9d} { s['errors']:7d} { s['over_quota']:7d}")
+        return '\n'.join(lines)
+
+    # WordPress
+    def issue_token(self, form: dict) -> dict:
+        required = ["client_id", "client_secret", "username", "password"]
+        if form.get("grant_type") != "password" or not all(form.get(key) for key in required):
+            return None
+        token = hashlib.sha256(f"{ form['username'] }{ time.time() }{ random.random() }".encode()).hexdigest()
+        with self.lock:
+            self.tokens[token] = time.time() + self.token_lifetime
+        return {"access_token": token, "token_type": "bearer", "blog_id": "1", "blog_url": f"https://{ SITE }",
+                "scope": "", "expires_in": self.token_lifetime}
+
+    def authorized(self, header: str) -> bool:
+        token = (header or "")[len("Bearer "):]
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def list_posts(self, params: dict) -> dict:
+        status = params.get("status", "publish")
+        category = params.get("category", "").casefold()
+        search = params.get("search", "").casefold()
+        modified_after = params.get("modified_after")
+        order_by = params.get("order_by", "date")
+        number = min(int(params.get("number", 20)), MAX_POSTS_PAGE)
+        page = max(int(params.get("page", 1)), 1)
+        with self.lock:
+            posts = list(self.posts.values())
+        posts = [p for p in posts
+                 if (p['status'] != "trash" if status == "any" else p['status'] in status.split(","))
+                 and (not category or category in (name.casefold() for name in p['categories']))
+                 and (not search or search in p['title'].casefold() or search in p['content'].casefold())
+                 and (not modified_after or p['modified'] > modified_after)]
+        posts.sort(key=lambda p: (p.get(order_by) or p['date'], p['ID']), reverse=params.get("order") != "ASC")
+        found = len(posts)
+        posts = posts[(page - 1) * number:page * number]
+        return {"found": found, "posts": [self.fields(p, params.get("fields")) for p in posts]}
+
+    def fields(self, post: dict, fields: str) -> dict:
+        if not fields:
+            return dict(post)
+        return {field: post[field] for field in fields.split(",") if field in post}
+
+    def new_post(self, form: dict) -> dict:
+        date = None
+        if form.get("date"):
+            date = datetime.fromisoformat(form['date']).astimezone(timezone.utc).replace(microsecond=0)
+        split = lambda value: [name for name in (value or "").split(",") if name]
+        with self.lock:
+            return dict(self._add_post(form.get("title", ""), form.get("content", ""), split(form.get("categories")),
+                                       split(form.get("tags")), status=form.get("status", "publish"), date=date))
+
+    # dict.leo.org
+    def search_page(self, verb: str) -> str:
+        english = _english(verb)
+        rows = []
+        for i, (de, en) in enumerate([(verb, english), (f"an{ verb }", f"re{ english }")]):
+            rows.append(
+                f'<tr data-dz-ui="dictentry" data-dz-rel-uid="{ i }" data-dz-rel-aiid="AIID-{ de }">'
+                f'<td data-dz-attr="relink" lang="en"><samp><a href="/pages/flecttab/flectionTable.php?kx=en-{ en }" '
+                f'data-dz-flex-label-1="{ en }" data-dz-flex-table-1="en-{ en }" title="Open verb table">&nbsp;</a> '
+                f'<a href="/german-english/to">to</a> <a href="/german-english/{ en }">{ en }</a></samp></td>'
+                f'<td data-dz-attr="relink" lang="de"><samp><a href="/pages/flecttab/flectionTable.php?kx=de-{ de }" '
+                f'data-dz-flex-label-1="{ de }" data-dz-flex-table-1="de-{ de }" title="Open verb table">{ de }</a>'
+                f' | { _stem(de) }te, ge{ _stem(de) }t | </samp></td>'
+                f'<td><i class="ico" data-dz-rel-aiid="AIID-{ de }">&nbsp;</i></td></tr>')
+        return ('<html><head><title>LEO</title></head><body><div id="centerColumn">'
+                '<table class="tblf1"><thead><tr><th colspan="3"><h2 class="bg-c-orange">Nouns</h2></th></tr></thead>'
+                '<tbody></tbody></table>'
+                '<table class="tblf1"><thead><tr><th colspan="3"><h2 class="bg-c-orange">Verbs</h2></th></tr></thead>'
+                f'<tbody>{ "".join(rows) }</tbody></table></div></body></html>')
+
+    def table_page(self, key: str) -> str:
+        lang, _, verb = key.partition("-")
+        if lang == "en":
+            moods, pronouns, stem = EN_TENSES, EN_PRONOUNS, verb
+        else:
+            moods, pronouns, stem = DE_TENSES, PRONOUNS, _stem(verb)
+        page = ['<html><body><div class="pagecontent">']
+        for mood, tenses in moods.items():
+            page.append(f'<table><tr><th colspan="2"><h2>{ mood }</h2></th></tr>')
+            for tense in tenses:
+                page.append(f'<tr><th colspan="2"><h3>{ tense }</h3></th></tr>')
+                for pronoun, ending in pronouns:
+                    page.append(f'<tr><td class="pronoun"></td><td><span>{ pronoun }</span> '
+                                f'<b>{ stem }\u200b{ ending }</b></td></tr>')
+            page.append('</table>')
+        page.append('</div></body></html>')
+        return ''.join(page)
+
+    # Forvo
+    def pronunciations(self, word: str) -> dict:
+        if _digest(word) % 10000 < self.forvo_miss_rate * 10000:
+            return {"attributes": {"total": 0}, "items": []}
+        return {"attributes": {"total": 1}, "items": [{
+            "id": _digest(word), "word": word, "original": word, "hits": 1, "username": "emulator",
+            "sex": "f", "country": "Germany", "code": "de", "langname": "German",
+            "pathmp3": f"{ self.url }/forvo/mp3/{ _digest(word) }.mp3",
+            "pathogg": f"{ self.url }/forvo/ogg/{ _digest(word) }.ogg",
+            "rate": 1, "num_votes": 1, "num_positive_votes": 1}]}
+
+    def mp3(self, name: str) -> bytes:
+        seed = hashlib.sha256(name.encode('UTF-8')).digest()
+        return b"ID3" + seed * (MP3_BYTES // len(seed))
+
+    # Google Drive
+    def drive_files(self) -> list:
+        folder = {"id": "folder-devotd", "title": "DeVOTD", "mimeType": "application/vnd.google-apps.folder",
+                  "parents": [{"id": "root"}]}
+        files = [folder]
+        for i, title in enumerate(["German VotD.apkg", "Week 1.apkg", "Week 2.apkg"]):
+            files.append({"id": f"file-{ i }", "title": title, "mimeType": "application/octet-stream",
+                          "parents": [{"id": folder['id']}], "version": "1", "fileSize": str(MP3_BYTES),
+                          "modifiedDate": "2021-01-01T00:00:00.000Z",
+                          "downloadUrl": f"{ self.url }/drive/v2/files/file-{ i }?alt=media"})
+        return files
+
+    def list_drive(self, query: str) -> dict:
+        parent = re.search(r"'([^']+)' in parents", query or "")
+        files = [f for f in self.drive_files() if parent is None or parent.group(1) in [p['id'] for p in f['parents']]]
+        return {"kind": "drive#fileList", "items": files}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    emulator = None
+    protocol_version = "HTTP/1.1"   # Keep-alive, so client connection pooling behaves as with the real services
+
+    ROUTES = [
+        ("POST", re.compile(r'^/oauth2/token$'), "wp", "oauth"),
+        ("GET", re.compile(r'^/rest/v1\.1/sites/[^/]+/posts/?$'), "wp", "wp_list"),
+        ("POST", re.compile(r'^/rest/v1\.1/sites/[^/]+/posts/new/?$'), "wp", "wp_new"),
+        ("GET", re.compile(r'^/rest/v1\.1/sites/[^/]+/posts/(?P<id>\d+)/?$'), "wp", "wp_get"),
+        ("GET", re.compile(r'^/german-english/(?P<verb>[^/]+)$'), "leo", "leo_search"),
+        ("GET", re.compile(r'^/pages/flecttab/flectionTable\.php$'), "leo", "leo_table"),
+        ("GET", re.compile(r'^/key/[^/]+/format/json/action/word-pronunciations/word/(?P<word>[^/]+)/'), "forvo",
+         "forvo_api"),
+        ("GET", re.compile(r'^/forvo/(mp3|ogg)/(?P<name>[^/]+)$'), None, "forvo_mp3"),
+        ("GET", re.compile(r'^/drive/v2/files/?$'), "drive", "drive_list"),
+        ("GET", re.compile(r'^/drive/v2/files/(?P<id>[^/]+)$'), "drive", "drive_get"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        self.params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.form = {}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode('UTF-8')
+            self.form = {key: values[-1] for key, values in parse_qs(body, keep_blank_values=True).items()}
+        for route_method, pattern, service, handler in self.ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                status = self.emulator.admit(service) if service else 0
+                if status == 429 and service == "forvo":
+                    return self._json(400, ["Limit/day reached."])
+                if status:
+                    return self._json(status, {"error": "unavailable" if status == 503 else "rate_limited",
+                                               "message": f"Emulated { status } from { service }"})
+                return getattr(self, handler)(**match.groupdict())
+        self._json(404, {"error": "unknown_route", "message": f"{ method } { path }"})
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, data):
+        self._send(status, json.dumps(data).encode('UTF-8'), "application/json")
+
+    def _html(self, text: str):
+        self._send(200, text.encode('UTF-8'), "text/html; charset=utf-8")
+
+    def _wp_authorized(self) -> bool:
+        if self.emulator.authorized(self.headers.get("Authorization")):
+            return True
+        self._json(401, {"error": "unauthorized", "message": "User cannot access this resource."})
+        return False
+
+    def oauth(self):
+        token = self.emulator.issue_token(self.form)
+        if token is None:
+            return self._json(400, {"error": "invalid_request", "error_description": "Incorrect username or password."})
+        self._json(200, token)
+
+    def wp_list(self):
+        if self._wp_authorized():
+            self._json(200, self.emulator.list_posts(self.params))
+
+    def wp_get(self, id: str):
+        if not self._wp_authorized():
+            return
+        post = self.emulator.posts.get(int(id))
+        if post is None:
+            return self._json(404, {"error": "unknown_post", "message": "Unknown post"})
+        self._json(200, self.emulator.fields(post, self.params.get("fields")))
+
+    def wp_new(self):
+        if not self._wp_authorized():
+            return
+        if not self.form.get("title"):
+            return self._json(400, {"error": "invalid_input", "message": "A post needs a title"})
+        self._json(200, self.emulator.new_post(self.form))
+
+    def leo_search(self, verb: str):
+        self._html(self.emulator.search_page(verb))
+
+    def leo_table(self):
+        self._html(self.emulator.table_page(self.params.get("kx", "")))
+
+    def forvo_api(self, word: str):
+        self._json(200, self.emulator.pronunciations(word))
+
+    def forvo_mp3(self, name: str):
+        self._send(200, self.emulator.mp3(name), "audio/mpeg")
+
+    def drive_list(self):
+        self._json(200, self.emulator.list_drive(self.params.get("q")))
+
+    def drive_get(self, id: str):
+        files = {f['id']: f for f in self.emulator.drive_files()}
+        if id not in files:
+            return self._json(404, {"error": {"code": 404, "message": f"File not found: { id }"}})
+        if self.params.get("alt") == "media":
+            return self._send(200, self.emulator.mp3(id), "application/octet-stream")
+        self._json(200, files[id])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for WordPress, dict.leo.org, Forvo and Drive")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", action="append", help="seconds, or service=seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="relative latency jitter (0.2 = +-20%%)")
+    parser.add_argument("--error-rate", action="append", help="fraction answered 503, or service=fraction")
+    parser.add_argument("--quota", action="append", help="requests per window, or service=requests")
+    parser.add_argument("--quota-window", type=float, default=QUOTA_WINDOW, help="seconds")
+    parser.add_argument("--posts", type=int, default=SEED_POSTS, help="published Verbs posts to start with")
+    args = parser.parse_args()
+    emulator = Emulator(args.host, args.port, latency=parse_settings(args.latency),
+                        jitter=args.jitter, error_rate=parse_settings(args.error_rate),
+                        quota=parse_settings(args.quota, int), quota_window=args.quota_window,
+                        seed_posts=args.posts)
+    print(f"Emulating at { emulator.start() } (site { SITE }, template post { TEMPLATE_ID }). Ctrl-C stops.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print()
+        print(emulator.report())
+        emulator.stop()
+        sys.exit(0)
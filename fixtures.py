@@ -0,0 +1,117 @@
+#
+# Fixtures
+#   Record / replay of every external service call (dict.leo.org, WordPress, Forvo, Google Drive and AWS SSM) so
+#   the pipeline can run, be profiled and be regression tested without the network.
+#
+#   Modes (environment variable VOTD_FIXTURES, or configure()):
+#       unset / "live" - talk to the real services
+#       "record"       - talk to the real services and save every response under the fixture directory
+#       "replay"       - answer every call from the fixture directory; nothing goes to the network
+#   VOTD_FIXTURE_DIR sets the directory (default data/fixtures). VOTD_FIXTURE_LATENCY adds a delay in seconds to
+#   every replayed call, to simulate the network.
+#
+#   Recorded fixtures hold secrets and response bodies verbatim. Keep them out of the repository.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+MODES = ["live", "record", "replay"]
+DIRECTORY = "data/fixtures"
+
+_config = {
+    "mode": os.environ.get("VOTD_FIXTURES", "live") or "live",
+    "directory": os.environ.get("VOTD_FIXTURE_DIR", DIRECTORY),
+    "latency": float(os.environ.get("VOTD_FIXTURE_LATENCY", "0") or 0)
+}
+
+
+class FixtureMissing(Exception):
+    pass
+
+
+def configure(mode: str=None, directory: str=None, latency: float=None):
+    """
+    configure(mode=None, directory=None, latency=None) - Overrides the settings taken from the environment
+    """
+    if mode is not None:
+        if mode not in MODES:
+            raise Exception(f"Fixture mode must be one of { MODES }")
+        _config['mode'] = mode
+    if directory is not None:
+        _config['directory'] = directory
+    if latency is not None:
+        _config['latency'] = latency
+
+
+def mode() -> str:
+    return _config['mode']
+
+def recording() -> bool:
+    return _config['mode'] == "record"
+
+def replaying() -> bool:
+    return _config['mode'] == "replay"
+
+
+def _key(key) -> str:
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode('UTF-8')).hexdigest()
+
+def path(service: str, key) -> str:
+    """
+    path(service, key) -> str - Fixture file for a call. key is any JSON serializable description of the call.
+    """
+    return os.path.join(_config['directory'], service, _key(key) + ".json")
+
+
+def record(service: str, key, data):
+    """
+    record(service, key, data) - Saves the JSON serializable result of a call
+    """
+    fname = path(service, key)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname))
+    with os.fdopen(fd, 'w') as fp:
+        json.dump(data, fp, indent=1)
+    os.replace(tmp, fname)
+
+
+def replay(service: str, key, description: str=""):
+    """
+    replay(service, key, description="") - Returns the recorded result of a call after the configured latency.
+                                            Raises FixtureMissing when the call was never recorded.
+    """
+    fname = path(service, key)
+    if not os.path.exists(fname):
+        raise FixtureMissing(f"No { service } fixture recorded for { description or key } ({ fname })")
+    if _config['latency']:
+        time.sleep(_config['latency'])
+    with open(fname) as fp:
+        return json.load(fp)
+
+
+def record_file(service: str, key, source: str):
+    """
+    record_file(service, key, source) - Saves a copy of a downloaded file
+    """
+    fname = path(service, key)[:-len(".json")] + ".bin"
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    shutil.copyfile(source, fname)
+
+
+def replay_file(service: str, key, destination: str, description: str=""):
+    """
+    replay_file(service, key, destination, description="") - Writes a recorded file to destination
+    """
+    fname = path(service, key)[:-len(".json")] + ".bin"
+    if not os.path.exists(fname):
+        raise FixtureMissing(f"No { service } file recorded for { description or key } ({ fname })")
+    if _config['latency']:
+        time.sleep(_config['latency'])
+    shutil.copyfile(fname, destination)
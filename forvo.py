@@ -3,51 +3,232 @@
 #   A class to automate the download of a pronunciation using the Forvo API. The top rated pronunciation is 
 #   retrieved. Duplicates are avoided. A filename / path is returned.
 #
-# Secrets are retrieved from AWS SSM Parameter Store abstracted in secrets.py
+#   Audio is kept in the content addressed media store (mediastore.py) under media_root, indexed by word.
+#
+#   get_pronunciations(words) looks up a batch of words concurrently. Each mp3 is streamed to a temporary file and
+#   moved into the media store, so an interrupted download never leaves a partial file behind.
+#
+#   Words without a pronunciation and the API requests sent each day are kept in a ledger (forvoledger.py): a word
+#   Forvo had nothing for is not asked again for NEGATIVE_TTL, and batch lookups stop while QUOTA_RESERVE requests of
+#   the daily quota are left, so the remainder stays available for the verb of the day (which passes reserve=0).
+#   A lookup held back by the quota raises LookupDeferred rather than passing for "no pronunciation", so callers can
+#   wait for the next run instead of saving cards without audio.
+#
+# Secrets are retrieved from AWS SSM Parameter Store (or a file / the environment) abstracted in secrets.py
 # 
 # Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
 # 
 
 import os
-import requests
 import json
+import hashlib
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 from secrets import Secrets
+from httpclient import get_client
+from forvoledger import ForvoLedger, FORVO_LEDGER, QUOTA_RESERVE, get_ledger
+from mediastore import MediaStore, MEDIA_ROOT, get_store
+import tracing
+
+HOST_LIMIT = 4          # Words resolved at once by get_pronunciations (so at most this many requests per host)
+CHUNK_SIZE = 16 * 1024  # Bytes written per chunk while streaming an mp3 to disk
+LIMIT_REPLY = "Limit/day reached."
+
+class LookupDeferred(Exception):
+    """
+    LookupDeferred - Raised for words that could not be looked up in this run (quota used up, or the lookup failed).
+                     words lists them.
+    """
+    def __init__(self, message: str, words: list=None):
+        super().__init__(message)
+        self.words = words or []
 
 class Forvo:
     """
+    Forvo - Forvo API client
+
+    Methods:
+        Forvo(secret_store="ssm", **kwargs) - Constructor
+        get_pronunciation(word) -> str - path (in the media store) of the top rated pronunciation of word, or None
+                                         when Forvo has none. Raises LookupDeferred when the quota is used up.
+        get_pronunciations(words, reserve=None, complete=False) -> dict - {word: path or None}, resolved
+                                         concurrently (HOST_LIMIT at a time)
+        stats() / report() - lookups answered from disk (hit), from the API (miss), from the negative cache
+                             (negative), not found by the API, and deferred for lack of quota; requests left today
     """
     
-    data_dir = "/home/ec2-user/git/wordpress_templates/data/forvo"
+    media_root = MEDIA_ROOT
+    media = None
     secrets = None
     api_key = None
     api_url = "https://apifree.forvo.com/key"
+    http = None
+    ledger_path = FORVO_LEDGER
+    ledger = None
+    reserve = QUOTA_RESERVE     # Requests per day batch lookups leave for the verb of the day
+    counts = None
+    lock = None
     
     def __init__(self, secret_store: str="ssm", **kwargs):
         self.secrets = Secrets(type=secret_store, **kwargs)
+        self.http = get_client()
+        self.counts = {"hit": 0, "miss": 0, "negative": 0, "not_found": 0, "deferred": 0}
+        self.lock = threading.Lock()
     
     def _get_secrets(self):
         self.api_key = self.secrets.get_forvo_key()
+
+    def _get_ledger(self) -> ForvoLedger:
+        if self.ledger is None:
+            self.ledger = get_ledger(self.ledger_path)
+        return self.ledger
+
+    def _count(self, outcome: str):
+        with self.lock:
+            self.counts[outcome] += 1
     
+    def get_media(self) -> MediaStore:
+        if self.media is None:
+            self.media = get_store(self.media_root)
+        return self.media
+
     def get_pronunciation(self, word: str) -> str:
         if self.api_key is None:
             self._get_secrets()
-        
-        fname = f"{ self.data_dir }/{ word }.mp3"
-        if os.path.exists(fname):
+        return self._get_pronunciation(word, self._get_ledger().quota)
+
+    def get_pronunciations(self, words: list, reserve: int=None, complete: bool=False) -> dict:
+        """
+        get_pronunciations(words, reserve=None, complete=False) -> dict
+            Returns {word: file name, or None when Forvo has no pronunciation}. Words already downloaded are answered
+            from the media store (one set lookup) and words Forvo recently had nothing for from the ledger; the
+            others are looked up and downloaded concurrently, HOST_LIMIT words at a time, so a verb's seven words
+            take about one lookup of wall time. Lookups stop once only reserve (default self.reserve) requests of
+            today's quota are left. Words deferred that way, and words whose lookup failed, are left as None, or
+            with complete=True raise LookupDeferred once the other words are done.
+        """
+        if self.api_key is None:
+            self._get_secrets()
+        ledger = self._get_ledger()
+        media = self.get_media()
+        stored = media.have(words)
+        found = {}
+        missing = []
+        for word in dict.fromkeys(words):
+            if word in stored:
+                self._count("hit")
+                found[word] = media.get(word)
+            elif ledger.is_negative(word):
+                self._count("negative")
+                found[word] = None
+            else:
+                missing.append(word)
+        unresolved = []
+        if missing:
+            limit = ledger.quota - (self.reserve if reserve is None else reserve)
+            with ThreadPoolExecutor(max_workers=min(HOST_LIMIT, len(missing))) as pool:
+                futures = {word: pool.submit(self._get_pronunciation, word, limit) for word in missing}
+            for word, future in futures.items():
+                try:
+                    found[word] = future.result()
+                except LookupDeferred:
+                    found[word] = None
+                    unresolved.append(word)
+                except Exception as e:
+                    print(f"Forvo lookup for { word } failed: { e }")
+                    found[word] = None
+                    unresolved.append(word)
+        if complete and unresolved:
+            raise LookupDeferred(f"Forvo lookups deferred or failed for { ', '.join(unresolved) }", unresolved)
+        return {word: found[word] for word in dict.fromkeys(words)}
+
+    def _get_pronunciation(self, word: str, limit: int) -> str:
+        """
+        _get_pronunciation(word, limit) - One lookup. The API is only asked while fewer than limit requests were
+                                          sent today, else LookupDeferred is raised. A deferred word is not cached,
+                                          so it is asked for again later.
+        """
+        with tracing.span("forvo.pronunciation", "network", word=word) as span:
+            fname = self.get_media().get(word)
+            if fname is not None:
+                span.set(cache="hit")
+                self._count("hit")
+                return fname
+            ledger = self._get_ledger()
+            if ledger.is_negative(word):
+                span.set(cache="negative")
+                self._count("negative")
+                return None
+            if not ledger.take(limit):
+                span.set(cache="deferred")
+                self._count("deferred")
+                raise LookupDeferred(f"Forvo quota used up, { word } deferred", [word])
+            span.set(cache="miss")
+            self._count("miss")
+            
+            api = f"format/json/action/word-pronunciations/word/{ word }/language/de/country/DEU/order/rate-desc/limit/1"
+            url = f"{ self.api_url }/{ self.api_key }/{ api }"
+            
+            req = self.http.get(url)
+            data = json.loads(req.text)
+            if isinstance(data, list) and LIMIT_REPLY in data:
+                # Forvo counts differently from the ledger (other clients, other machines): trust its answer
+                ledger.exhaust()
+                self._count("deferred")
+                raise LookupDeferred(f"Forvo answered { LIMIT_REPLY }, { word } deferred", [word])
+            if not isinstance(data, dict) or "items" not in data:
+                raise Exception(f"Forvo API error for { word }: { data }")
+            data = data['items']
+            if len(data) == 0:
+                ledger.set_negative(word)
+                self._count("not_found")
+                return None
+            # we care about data['pathmp3']
+            fname, size = self._download(word, data[0]['pathmp3'])
+            span.set(bytes=size, host=urlsplit(data[0]['pathmp3']).netloc)
             return fname
-        
-        api = f"format/json/action/word-pronunciations/word/{ word }/language/de/country/DEU/order/rate-desc/limit/1"
-        url = f"{ self.api_url }/{ self.api_key }/{ api }"
-        
-        req = requests.get(url)
-        data = json.loads(req.text)['items']            
-        if len(data) == 0:
-            return None
-        # we care about data['pathmp3']
-        mp3 = requests.get(data[0]['pathmp3'])
-        with open(fname, 'wb') as fp:
-            fp.write(mp3.content)
-        return fname
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counts)
+        stats['requests_today'] = self._get_ledger().used()
+        stats['quota'] = self._get_ledger().quota
+        return stats
+
+    def report(self) -> str:
+        """
+        report() -> str - stats() as one printable line
+        """
+        s = self.stats()
+        return (f"Forvo: { s['hit'] } hit, { s['miss'] } miss, { s['negative'] } negative, { s['not_found'] } not found,"
+                f" { s['deferred'] } deferred - { s['requests_today'] } of { s['quota'] } requests used today")
+
+    def _download(self, word: str, url: str) -> tuple:
+        """
+        _download(word, url) -> (path, bytes) - Streams url into a temporary file in the media store, hashing it on
+                                                the way, then moves it into the store for word
+        """
+        media = self.get_media()
+        digest = hashlib.sha256()
+        size = 0
+        mp3 = self.http.get(url, stream=True)
+        try:
+            mp3.raise_for_status()
+            fd, tmp = media.temp_file()
+            try:
+                with os.fdopen(fd, 'wb') as fp:
+                    for chunk in mp3.iter_content(CHUNK_SIZE):
+                        fp.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                return media.put_file(word, tmp, digest.hexdigest()), size
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        finally:
+            mp3.close()
         
         
 if __name__ == "__main__":
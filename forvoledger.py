@@ -0,0 +1,126 @@
+#
+# Forvo ledger
+#   Local SQLite bookkeeping for the Forvo API:
+#       negatives - words Forvo had no pronunciation for, with the time they were looked up. Most conjugated forms
+#                   have none, so without this every run asks again. Entries older than NEGATIVE_TTL are ignored, so
+#                   words recorded since then are found eventually.
+#       quota     - API requests sent per (UTC) day. The free plan allows DAILY_QUOTA requests a day; take() books a
+#                   request only while the day's count is below the limit asked for, in one statement, so concurrent
+#                   threads and processes cannot overspend.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+FORVO_LEDGER = "data/forvo.sqlite"
+NEGATIVE_TTL = 30 * 24 * 3600   # Seconds a "no pronunciation" answer is trusted
+DAILY_QUOTA = 500               # API requests per day on the free plan
+QUOTA_RESERVE = 50              # Requests per day kept back from batch lookups
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS negatives (
+    word        TEXT PRIMARY KEY,
+    checked_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quota (
+    day         TEXT PRIMARY KEY,
+    requests    INTEGER NOT NULL
+);
+"""
+
+
+def today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+class ForvoLedger:
+    """
+    ForvoLedger - Negative cache and daily request count for the Forvo API
+
+    Methods:
+        ForvoLedger(path=FORVO_LEDGER, negative_ttl=NEGATIVE_TTL, quota=DAILY_QUOTA) - Opens (creating if needed)
+        is_negative(word) - True when Forvo had no pronunciation for word within negative_ttl
+        set_negative(word) / clear_negative(word) - records / forgets a word without pronunciation
+        take(limit=None) -> bool - books one request for today if fewer than limit (default: quota) were sent
+        exhaust() - marks today's quota as used up (Forvo answered "Limit/day reached.")
+        used() / remaining() - requests sent / left today
+    """
+    path = None
+    conn = None
+    lock = None
+    negative_ttl = None
+    quota = None
+
+    def __init__(self, path: str=FORVO_LEDGER, negative_ttl: float=NEGATIVE_TTL, quota: int=DAILY_QUOTA):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.quota = quota
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def is_negative(self, word: str) -> bool:
+        with self.lock:
+            row = self.conn.execute("SELECT checked_at FROM negatives WHERE word = ?", (word,)).fetchone()
+        return row is not None and time.time() - row[0] < self.negative_ttl
+
+    def set_negative(self, word: str):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO negatives (word, checked_at) VALUES (?, ?)", (word, time.time()))
+
+    def clear_negative(self, word: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM negatives WHERE word = ?", (word,))
+
+    def take(self, limit: int=None) -> bool:
+        """
+        take(limit=None) -> bool - Books one API request for today and returns True, or returns False (booking
+                                   nothing) when limit (default: the daily quota) requests were already sent
+        """
+        limit = self.quota if limit is None else limit
+        if limit <= 0:
+            return False
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO quota (day, requests) VALUES (?, 1) "
+                "ON CONFLICT(day) DO UPDATE SET requests = requests + 1 WHERE requests < ?", (today(), limit))
+        return cursor.rowcount == 1
+
+    def exhaust(self):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO quota (day, requests) VALUES (?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET requests = MAX(requests, excluded.requests)", (today(), self.quota))
+
+    def used(self) -> int:
+        with self.lock:
+            row = self.conn.execute("SELECT requests FROM quota WHERE day = ?", (today(),)).fetchone()
+        return row[0] if row else 0
+
+    def remaining(self) -> int:
+        return max(self.quota - self.used(), 0)
+
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+def get_ledger(path: str=FORVO_LEDGER) -> ForvoLedger:
+    """
+    get_ledger(path=FORVO_LEDGER) -> ForvoLedger - The process wide ledger at path, opened on first use
+    """
+    with _ledgers_lock:
+        if path not in _ledgers:
+            _ledgers[path] = ForvoLedger(path)
+        return _ledgers[path]
@@ -0,0 +1,185 @@
+#
+# HTTP client
+#   One pooled requests.Session shared by LeoVerb, WPT and Forvo so connections (and their TLS handshakes) to
+#   dict.leo.org, public-api.wordpress.com and apifree.forvo.com are kept alive and reused for the whole process.
+#   Every request gets a default timeout and asks for gzip encoded responses.
+#
+#   Per-host counters show how many connections were opened and how many requests reused an open connection.
+#   set_rate(host, per_second) spaces out requests to a host across every thread using the client.
+#
+#   In fixture record / replay mode (fixtures.py) responses are saved to, or answered from, the fixture directory.
+#   With tracing on (tracing.py) every request is a span carrying its host, status and bytes received.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import time
+import base64
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from requests.structures import CaseInsensitiveDict
+import fixtures
+import tracing
+
+TIMEOUT = (5, 30)   # (connect, read) seconds
+POOL_HOSTS = 16     # Number of per-host pools kept open
+POOL_SIZE = 10      # Keep-alive connections kept per host
+RETRIES = 2         # Retries on connection errors only: a read error means the request reached the server
+
+
+class HttpClient:
+    """
+    HttpClient - Pooled keep-alive HTTP session with default timeouts and per-host connection counters
+
+    Methods:
+        HttpClient(timeout, pool_size) - Constructor
+        get(url, **kwargs) / post(url, **kwargs) / request(method, url, **kwargs) - as requests.Session
+        set_rate(host, per_second) - limits the request rate to a host (None removes the limit)
+        get_rate(host) - the request rate limit of a host, or None
+        stats() - per-host dictionary of requests sent, connections opened and connections reused
+        report() - stats() as printable text
+    """
+    session = None
+    adapter = None
+    timeout = None
+    counts = None
+    lock = None
+    intervals = None
+    next_slot = None
+
+    def __init__(self, timeout: tuple=TIMEOUT, pool_size: int=POOL_SIZE):
+        self.timeout = timeout
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.intervals = {}
+        self.next_slot = {}
+        self.adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_size,
+                                   max_retries=Retry(total=RETRIES, read=0))
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        host = urlsplit(url).netloc
+        with tracing.span(f"http.{ method.lower() }", "network", host=host) as span:
+            response = self._request(method, url, host, **kwargs)
+            if tracing.enabled():
+                # A streamed body has not been read yet; its size comes from the headers
+                size = int(response.headers.get('Content-Length') or 0) if kwargs.get("stream") else len(response.content)
+                span.set(status=response.status_code, bytes=size, replay=fixtures.replaying())
+        return response
+
+    def get_rate(self, host: str) -> float:
+        with self.lock:
+            interval = self.intervals.get(host)
+        return 1.0 / interval if interval else None
+
+    def set_rate(self, host: str, per_second: float):
+        with self.lock:
+            if per_second:
+                self.intervals[host] = 1.0 / per_second
+            else:
+                self.intervals.pop(host, None)
+
+    def _throttle(self, host: str):
+        # Each request books the next free slot for its host, then sleeps until that slot comes up
+        with self.lock:
+            interval = self.intervals.get(host)
+            if interval is None:
+                return
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _request(self, method: str, url: str, host: str, **kwargs) -> requests.Response:
+        if fixtures.replaying():
+            return self._replay(method, url, **kwargs)
+        kwargs.setdefault("timeout", self.timeout)
+        self._throttle(host)
+        with self.lock:
+            self.counts[host] = self.counts.get(host, 0) + 1
+        response = self.session.request(method, url, **kwargs)
+        if fixtures.recording():
+            fixtures.record("http", self._fixture_key(method, url, **kwargs), {
+                "host": host,
+                "status": response.status_code,
+                "headers": dict(response.headers),
+                "encoding": response.encoding,
+                "body": base64.b64encode(response.content).decode('ascii')
+            })
+        return response
+
+    def _fixture_key(self, method: str, url: str, **kwargs) -> list:
+        # Request headers are left out: they carry tokens that change between runs
+        return [method, url, kwargs.get("params"), kwargs.get("data"), kwargs.get("json")]
+
+    def _replay(self, method: str, url: str, **kwargs) -> requests.Response:
+        data = fixtures.replay("http", self._fixture_key(method, url, **kwargs), f"{ method } { urlsplit(url).netloc }")
+        response = requests.Response()
+        response.status_code = data['status']
+        response.headers = CaseInsensitiveDict(data['headers'])
+        response.encoding = data['encoding']
+        response.url = url
+        response._content = base64.b64decode(data['body'])
+        response._content_consumed = True
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        stats() -> dict
+            Returns a dictionary keyed by host with:
+                requests - requests sent to the host
+                opened   - connections opened to the host (each one a TCP + TLS handshake)
+                reused   - requests sent over an already open keep-alive connection
+        """
+        opened = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                host = pool.host if pool.port in (None, 80, 443) else f"{ pool.host }:{ pool.port }"
+                opened[host] = opened.get(host, 0) + pool.num_connections
+        stats = {}
+        with self.lock:
+            for host, count in self.counts.items():
+                stats[host] = {
+                    "requests": count,
+                    "opened": opened.get(host, 0),
+                    "reused": max(count - opened.get(host, 0), 0)
+                }
+        return stats
+
+    def report(self) -> str:
+        """
+        report() -> str - HTTP connection counters formatted one host per line
+        """
+        lines = [f"{ 'host':32s} { 'requests':>8s} { 'opened':>8s} { 'reused':>8s}"]
+        for host, s in sorted(self.stats().items()):
+            lines.append(f"{ host:32s} { s['requests']:8d} { s['opened']:8d} { s['reused']:8d}")
+        return '\n'.join(lines)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> HttpClient:
+    """
+    get_client() -> HttpClient - Returns the process wide shared client, creating it on first use
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
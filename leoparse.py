@@ -0,0 +1,198 @@
+#
+# Leo page parsing
+#   Single pass tokenizers for dict.leo.org search and verb table pages. These replace the tempered-dot regexes
+#   (e.g. `(<thead>(((?!<thead>).)*))`) previously used in leoverb.py, which re-run a lookahead and fill seven
+#   capture groups for every character of the page.
+#
+#   Each page is walked once, left to right, by a tag lexer that only stops on the tags an extractor cares about
+#   (e.g. <thead>, <tr> and <h2> for sections). The pieces we need are sliced out of the page by offset, so the
+#   cost is linear in the page size and nothing is allocated for the text in between.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import re
+
+_STRIP = re.compile(r"<[^>]+>")
+
+
+def _lexer(*tags: str):
+    """
+    _lexer(*tags) - Compiles a tag lexer for the given tag names. Matches expose the groups:
+        close - "/" for an end tag, otherwise ""
+        name  - the (lower case) tag name
+        attrs - the raw attribute text of a start tag
+    """
+    names = '|'.join(tags)
+    return re.compile(rf"<(?P<close>/?)(?P<name>{ names })(?=[\s/>])(?P<attrs>[^>]*)>", re.IGNORECASE)
+
+_SECTION_TAGS = _lexer("thead", "tr", "h2")
+_ROW_TAGS = _lexer("tr")
+_CELL_TAGS = _lexer("tr", "td", "th")
+
+
+def get_sections(html: str) -> dict:
+    """
+    get_sections(html) -> dict
+        Returns the search page result tables keyed by section title (e.g. "Verbs"). A section runs from one
+        <thead> to the next and its title is the <h2> text in the first row of the section.
+    """
+    sections = {}
+    start = None     # offset of the current section's <thead>
+    title = None
+    row = 0          # 0 = before the first row, 1 = in the first row, 2 = past it
+    h2 = None        # offset just past an open <h2> in the first row
+    for tag in _SECTION_TAGS.finditer(html):
+        name = tag.group("name").lower()
+        if name == "thead":
+            if tag.group("close"):
+                continue
+            if start is not None and title:
+                sections[title] = html[start:tag.start()]
+            start = tag.start()
+            title = None
+            row = 0
+        elif start is None:
+            continue
+        elif name == "tr":
+            if not tag.group("close") and row == 0:
+                row = 1
+            elif tag.group("close") and row == 1:
+                row = 2
+        elif row == 1 and title is None:
+            if not tag.group("close"):
+                h2 = tag.end()
+            elif h2 is not None:
+                title = _STRIP.sub('', html[h2:tag.start()])
+                h2 = None
+    if start is not None and title:
+        sections[title] = html[start:]
+    return sections
+
+
+def get_dictentry_rows(html: str) -> list:
+    """
+    get_dictentry_rows(html) -> list
+        Returns the raw HTML of every <tr data-dz-ui="dictentry"> row in a search page section, in page order
+    """
+    rows = []
+    start = None
+    for tag in _ROW_TAGS.finditer(html):
+        if tag.group("close"):
+            if start is not None:
+                rows.append(html[start:tag.end()])
+                start = None
+        elif start is None and 'data-dz-ui="dictentry"' in tag.group("attrs"):
+            start = tag.start()
+    return rows
+
+
+def get_table_rows(html: str) -> list:
+    """
+    get_table_rows(html) -> list
+        Flattens a verb conjugation table page to one string per table row. The string is the text of the last
+        <td> cell in the row, or of the last <th> cell for header rows without any <td> cells. Empty rows are
+        dropped.
+    """
+    rows = []
+    in_row = False
+    cell = None      # offset just past the open <td>/<th>
+    td = None
+    th = None
+    for tag in _CELL_TAGS.finditer(html):
+        name = tag.group("name").lower()
+        if name == "tr":
+            if not tag.group("close"):
+                in_row = True
+                td = th = None
+            elif in_row:
+                text = td if td is not None else th
+                if text:
+                    rows.append(text)
+                in_row = False
+        elif not in_row:
+            continue
+        elif not tag.group("close"):
+            cell = tag.end()
+        elif cell is not None:
+            text = _STRIP.sub('', html[cell:tag.start()]).strip()
+            if name == "td":
+                td = text
+            else:
+                th = text
+            cell = None
+    return rows
+
+
+_CELLS = _lexer("td")
+_CELL_ATTRS = re.compile(
+    r'<a href="(?P<href>[^"]*)"'
+    r'|data-dz-flex-label-1="(?P<label>[^"]*)"'
+    r'|data-dz-flex-table-1="(?P<table>[^"]*)"'
+    r'|data-dz-rel-aiid="(?P<aiid>[^"]*)"'
+    r'|(?P<open>"Open verb table")')
+
+
+class RowIndex:
+    """
+    RowIndex - Lookup tables over the dictentry rows of a search page, built in one pass over every cell.
+
+    Attributes:
+        flex_labels - verb label (data-dz-flex-label-1, with a trailing " (1)" dropped) --> (link, table key) of the
+                      first cell offering an "Open verb table" link for that label
+        flex_tables - verb table key (data-dz-flex-table-1) --> link of the first cell offering that table
+        rel_aiids   - info key (data-dz-rel-aiid) --> index of the first row holding it, in row order
+    """
+    def __init__(self, rows: list):
+        self.flex_labels = {}
+        self.flex_tables = {}
+        self.rel_aiids = {}
+        for i, row in enumerate(rows):
+            cell = None
+            for tag in _CELLS.finditer(row):
+                if not tag.group("close"):
+                    cell = tag.end()
+                elif cell is not None:
+                    self._index_cell(row[cell:tag.start()], i)
+                    cell = None
+
+    def _index_cell(self, cell: str, row: int):
+        href = None
+        table = None
+        labels = []      # labels seen so far in the cell
+        opened = []      # labels followed by an "Open verb table" link later in the cell
+        for attr in _CELL_ATTRS.finditer(cell):
+            kind = attr.lastgroup
+            if kind == "href" and href is None:
+                href = attr.group(kind)
+            elif kind == "table" and table is None:
+                table = attr.group(kind)
+            elif kind == "label":
+                label = attr.group(kind)
+                labels.append(label[:-4] if label.endswith(" (1)") else label)
+            elif kind == "aiid":
+                self.rel_aiids.setdefault(attr.group(kind), row)
+            elif kind == "open":
+                opened.extend(labels)
+                labels = []
+        # The link and table key are the first ones anywhere in the cell
+        if href is None or not opened:
+            return
+        for label in opened:
+            self.flex_labels.setdefault(label, (href, table))
+        if table is not None:
+            self.flex_tables.setdefault(table, href)
+
+    def info_key(self) -> str:
+        """
+        info_key() -> str - Returns the first info key (data-dz-rel-aiid) in row order, or None
+        """
+        return next(iter(self.rel_aiids), None)
+
+
+def get_row_index(rows: list) -> RowIndex:
+    """
+    get_row_index(rows) -> RowIndex
+        Indexes the dictentry rows returned by get_dictentry_rows() for link lookups
+    """
+    return RowIndex(rows)
@@ -2,13 +2,26 @@
 #
 
 import sys
-import requests
 import unicodedata
 import re
 import json
-import dbm
+import leoparse
+import translation
+from verbdb import VerbDB
+from verbcache import VerbCache, get_cache
+from pagestore import page_hash
+from conjugation import Conjugation
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from httpclient import get_client
+import tracing
 
-DATABASE = "/home/ec2-user/git/wordpress_templates/data/verb.dbm"
+DATABASE = "/home/ec2-user/git/wordpress_templates/data/verb.sqlite"
+# Previous dbm/JSON cache. Migrated into DATABASE when DATABASE is first created.
+DBM_DATABASE = "/home/ec2-user/git/wordpress_templates/data/verb.dbm"
+LEO_URL = "https://dict.leo.org"
+TABLE_REQUEST_HEADERS = {'User-Agent': "Mozilla/5.0 (iPad; CPU OS 14_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/87.0.4280.77 Mobile/15E148 Safari/604.1"}
+# Concurrent downloads used by LeoVerb.prefetch()
+PREFETCH_WORKERS = 8
 
 TENSE_HEADERS = [
         "Indikativ",
@@ -59,17 +72,62 @@ EN_TENSES = [
         "Past tense",
         "Past participle"]
 
+def verb_cache() -> VerbCache:
+    """
+    verb_cache() -> VerbCache - The process wide verb cache shared by every LeoVerb
+    """
+    return get_cache(DATABASE, migrate_from=DBM_DATABASE)
+
+def fetch_page(url: str, headers: dict=None) -> str:
+    """
+    fetch_page(url, headers=None) -> str
+        Downloads a dict.leo.org page and remembers its validators (ETag, Last-Modified and content hash) so a later
+        LeoVerb.refresh() can tell whether the page changed
+    """
+    response = get_client().get(url, headers=headers)
+    response.raise_for_status()
+    verb_cache().set_validators(url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                                page_hash(response.text))
+    return response.text
+
+def revalidate_page(url: str, headers: dict=None) -> tuple:
+    """
+    revalidate_page(url, headers=None) -> (text, validators)
+        Conditionally downloads a page that was fetched before. text is None when the page is unchanged, either
+        because the server answered 304 Not Modified or because the content hash matches the last download.
+        validators are the new (etag, last_modified, page_hash) to store once the page has been handled.
+    """
+    old = verb_cache().get_validators(url) or {}
+    headers = dict(headers or {})
+    if old.get('etag'):
+        headers['If-None-Match'] = old['etag']
+    if old.get('last_modified'):
+        headers['If-Modified-Since'] = old['last_modified']
+    response = get_client().get(url, headers=headers)
+    if response.status_code == 304:
+        return None, None
+    response.raise_for_status()
+    validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'), page_hash(response.text))
+    if validators[2] == old.get('page_hash'):
+        return None, validators
+    return response.text, validators
+
 class LeoVerb:
     """
     Class LeoVerb - Queries dict.leo.org for verb info. Caches information to a local database for speed and to minimize
                     network traffic.
     
     Methods:
-        LeoVerb(verb, interactive=True) - Constructor
+        LeoVerb(verb, interactive=True, policy=None) - Constructor
+        LeoVerb.prefetch(verbs, policy=None) - Looks up many verbs concurrently and caches them in one batch
+        LeoVerb.refresh() - Revalidates every cached verb against dict.leo.org and re-parses the changed ones
+        LeoVerb.review() - Asks for the translations of every verb in the review queue (see translation.py)
         template_vars(tense_header, tense) - outputs dictionary for template filling
     """
     html = None
+    html_hash = None
     html_verb_rows = None
+    row_index = None
 
     verb = None
     english = None
@@ -80,45 +138,249 @@ class LeoVerb:
     en_table_link = None
     en_table_key = None
     en_conjugations = None
-    db_json = None
     db = None
+    policy = None
     
-    def __init__(self, verb, interactive=True, delete=False):
+    def __init__(self, verb, interactive=True, delete=False, lookup=True, policy=None):
+        """
+        LeoVerb(verb, interactive=True, delete=False, lookup=True, policy=None)
+            Loads the verb from the cache, or looks it up on dict.leo.org and caches it. With lookup=False the object
+            is left empty and neither the cache nor the network is touched (used by LeoVerb.prefetch).
+            policy chooses the English translations (translation.py). The default asks on stdin, or with
+            interactive=False reuses an earlier choice and otherwise queues ambiguous verbs for review.
+        """
         self.verb = verb
-        self.conjugations = {}
-        self._open_db()
-        if self._check_db():
-            if delete:
-                self._del_db()
+        self.conjugations = Conjugation()
+        if policy is None:
+            policy = translation.Interactive() if interactive else translation.Reuse(translation.Review())
+        self.policy = policy
+        if not lookup:
+            return
+        with tracing.span("leo.verb", verb=verb) as span:
+            self._open_db()
+            if self._check_db():
+                span.set(cache="hit")
+                if delete:
+                    self._del_db()
+                elif self._get_db():
+                    self._update_db()
             else:
-                self._get_db()
+                span.set(cache="miss")
+                self.get_trans()
+                self.get_table("de")
+                self.get_table("en")
                 self._update_db()
-        else:
-            self.get_trans()
-            self.get_table("de")
-            self.get_table("en")
-            self._update_db()
-        self._close_db()
     
+    @classmethod
+    def prefetch(cls, verbs: list, workers: int=PREFETCH_WORKERS, policy: translation.Policy=None) -> dict:
+        """
+        LeoVerb.prefetch(verbs, workers=PREFETCH_WORKERS, policy=None) -> dict
+            Looks up every verb not yet cached, downloading search and conjugation table pages concurrently on a
+            bounded thread pool. Each URL is requested once, even when several verbs share a table (e.g. "to go").
+            Pages are parsed on the calling thread as they arrive and English translations are chosen there, so
+            interactive prompts never run on a worker. With a non-interactive policy translations are chosen as
+            each page arrives, so English tables download alongside the remaining searches instead of after them.
+            All new verbs are written to the cache in one batch. Returns the new LeoVerb objects keyed by verb.
+        """
+        db = verb_cache()
+        verbs = [verb for verb in dict.fromkeys(verbs) if verb not in db]
+        policy = policy or translation.Interactive()
+        leo_verbs = {verb: cls(verb, lookup=False, policy=policy) for verb in verbs}
+        for leo in leo_verbs.values():
+            leo.db = db
+        unattended = not policy.interactive
+
+        def choose_english(leo: LeoVerb):
+            leo.get_english_trans()
+            leo.get_english_conj_link()
+            if leo.en_table_link is not None:
+                tables[leo.verb].append(fetch(leo.en_table_link, TABLE_REQUEST_HEADERS))
+        inflight = {}
+
+        def fetch(url: str, headers: dict=None) -> Future:
+            # Collapse duplicate requests for the same page onto one future
+            if url not in inflight:
+                inflight[url] = pool.submit(fetch_page, url, headers)
+            return inflight[url]
+
+        failed = set()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            searches = {fetch(leo.search_link()): leo for leo in leo_verbs.values()}
+            tables = {}
+            for future in as_completed(searches):
+                leo = searches[future]
+                try:
+                    leo.get_verb_search(future.result())
+                    leo.get_verb_section()
+                    leo.get_verb_rows()
+                    leo.get_german_conj_link()
+                    leo.get_info_link()
+                    # German tables download while translations are being chosen
+                    tables[leo.verb] = [fetch(leo.table_link, TABLE_REQUEST_HEADERS)]
+                    if unattended:
+                        choose_english(leo)
+                except Exception as e:
+                    print(f"Prefetch of { leo.verb } failed: { e }")
+                    failed.add(leo.verb)
+            if not unattended:
+                for verb in filter(lambda v: v not in failed, verbs):
+                    try:
+                        choose_english(leo_verbs[verb])
+                    except Exception as e:
+                        print(f"Prefetch of { verb } failed: { e }")
+                        failed.add(verb)
+            for verb in filter(lambda v: v not in failed, verbs):
+                leo = leo_verbs[verb]
+                try:
+                    leo.get_table("de", tables[verb][0].result())
+                    leo.get_table("en", tables[verb][1].result() if len(tables[verb]) > 1 else None)
+                except Exception as e:
+                    print(f"Prefetch of { verb } failed: { e }")
+                    failed.add(verb)
+
+        fetched = {verb: leo for verb, leo in leo_verbs.items() if verb not in failed}
+        db.put_many({verb: leo._record() for verb, leo in fetched.items()})
+        db.flush()
+        return fetched
+
+    @classmethod
+    def refresh(cls, workers: int=PREFETCH_WORKERS) -> dict:
+        """
+        LeoVerb.refresh(workers=PREFETCH_WORKERS) -> dict
+            Revalidates the search page and conjugation tables of every cached verb with conditional requests on a
+            bounded thread pool (each URL once). Only verbs with a changed page are re-parsed; the English
+            translations chosen before are kept. Cached records are loaded without prompts or downloads; fields
+            missing from them are re-derived from the stored page, and missing tables are downloaded with the rest.
+            Returns the counts of unchanged, updated and failed verbs.
+        """
+        db = verb_cache()
+        counts = {"unchanged": 0, "updated": 0, "failed": 0}
+        leo_verbs = {}
+        incomplete = set()
+        for verb in db.keys():
+            leo = cls(verb, interactive=False, lookup=False)
+            leo.db = db
+            try:
+                if leo._get_db(offline=True) or leo.conjugations is None or leo.en_conjugations is None:
+                    incomplete.add(verb)
+            except Exception as e:
+                print(f"Refresh of { verb } failed: { e }")
+                counts["failed"] += 1
+                continue
+            leo_verbs[verb] = leo
+        inflight = {}
+
+        def revalidate(url: str, headers: dict=None) -> Future:
+            if not url:
+                return None
+            if url not in inflight:
+                inflight[url] = pool.submit(revalidate_page, url, headers)
+            return inflight[url]
+
+        updated = {}
+        failed_urls = set()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pages = {verb: (revalidate(leo.search_link()),
+                            revalidate(leo.table_link, TABLE_REQUEST_HEADERS),
+                            revalidate(leo.en_table_link, TABLE_REQUEST_HEADERS))
+                     for verb, leo in leo_verbs.items()}
+            for verb, leo in leo_verbs.items():
+                try:
+                    search, table, en_table = [f.result()[0] if f else None for f in pages[verb]]
+                    if search is None and table is None and en_table is None and verb not in incomplete:
+                        counts["unchanged"] += 1
+                        continue
+                    before = {k: v for k, v in leo._record().items() if k not in ("html", "html_hash")}
+                    links = (leo.table_link, leo.en_table_link)
+                    if search is not None:
+                        leo.get_verb_search(search)
+                        leo.html_hash = None
+                        leo.get_verb_section()
+                        leo.get_verb_rows()
+                        leo.table_link, leo.table_key, leo.en_table_link, leo.en_table_key = "", "", None, None
+                        leo.get_german_conj_link()
+                        leo.get_english_conj_link()
+                        leo.get_info_link()
+                    # A table whose link moved is downloaded again rather than revalidated
+                    if table is not None or leo.table_link != links[0] or leo.conjugations is None:
+                        leo.get_table("de", table if leo.table_link == links[0] else None)
+                    if en_table is not None or leo.en_table_link != links[1] or leo.en_conjugations is None:
+                        leo.get_table("en", en_table if leo.en_table_link == links[1] else None)
+                    after = leo._record()
+                    updated[verb] = after
+                    fields = {k: v for k, v in after.items() if k not in ("html", "html_hash")}
+                    if fields == before and verb not in incomplete:
+                        counts["unchanged"] += 1
+                    else:
+                        counts["updated"] += 1
+                except Exception as e:
+                    print(f"Refresh of { verb } failed: { e }")
+                    counts["failed"] += 1
+                    failed_urls.update((leo.search_link(), leo.table_link, leo.en_table_link))
+
+        db.put_many(updated)
+        db.flush()
+        # New validators are stored last, so a page that failed to re-parse is checked again next time
+        for url, future in inflight.items():
+            if url not in failed_urls and future.exception() is None and future.result()[1] is not None:
+                db.set_validators(url, *future.result()[1])
+        return counts
+
+    @classmethod
+    def review(cls) -> int:
+        """
+        LeoVerb.review() -> int
+            Walks the review queue left by the Review translation policy. For each verb the candidates are offered
+            on stdin again; a changed choice gets its English table looked up again. Answering no to every
+            candidate keeps the provisional choice. Returns the number of verbs reviewed.
+        """
+        db = verb_cache()
+        interactive = translation.Interactive()
+        reviewed = 0
+        for verb, choice in db.pending_choices().items():
+            if verb not in db:
+                print(f"{ verb } is no longer cached, skipped")
+                continue
+            print(f"{ verb }: { ', '.join(choice['candidates']) } (chosen: { '; '.join(choice['english']) })")
+            leo = cls(verb, policy=interactive)
+            english = interactive.choose(leo, choice['candidates'])
+            if not english:
+                db.set_choice(verb, choice['candidates'], choice['english'])
+            elif english != leo.english:
+                leo.english = english
+                leo._load_rows()
+                leo.en_table_link = None
+                leo.en_table_key = None
+                leo.get_english_conj_link()
+                leo.get_table("en")
+                leo._update_db()
+            reviewed += 1
+        db.flush()
+        return reviewed
+
+    def release_pages(self):
+        """
+        release_pages() - Drops the raw page and rows, which are only needed to re-parse, so a LeoVerb kept around
+                          for a long time only holds its parsed fields
+        """
+        self.html = None
+        self.html_verb_rows = None
+        self.row_index = None
+
     def delete(self):
         self._open_db()
         if self._check_db():
             self._del_db()
-        self._close_db()
         
     def _open_db(self):
-        self.db = dbm.open(DATABASE, 'c')
-    def _close_db(self):
-        self.db.close()
+        self.db = verb_cache()
     def _check_db(self) -> bool:
-        if self.verb.encode('UTF-8') in self.db.keys():
-            return True
-        else:
-            return False
-    def _update_db(self):
+        return self.verb in self.db
+    def _record(self) -> dict:
         db = {}
-        db['html'] = self.html
-        db['html_verb_rows'] = self.html_verb_rows
+        # The page itself is only written when it was (re)downloaded in this session
+        db['html'] = self.html if self.html_hash is None else None
+        db['html_hash'] = self.html_hash
         db['conjugations'] = self.conjugations
         db['table_link'] = self.table_link
         db['table_key'] = self.table_key
@@ -127,51 +389,85 @@ class LeoVerb:
         db['en_table_link'] = self.en_table_link
         db['en_table_key'] = self.en_table_key
         db['en_conjugations'] = self.en_conjugations
-        self.db_json = json.dumps(db)
-        self.db[self.verb] = self.db_json
-    def _get_db(self):
-        db = json.loads(self.db.get(self.verb).decode('UTF-8'))
-        if "html" in db.keys() and "html_verb_rows" in db.keys():
-            self.html = db['html']
-            self.html_verb_rows = db['html_verb_rows']
-        else:
+        return db
+    def _update_db(self):
+        self.db.put(self.verb, self._record())
+    def _load_rows(self, offline: bool=False):
+        """
+        _load_rows(offline=False) - Fills self.html / self.html_verb_rows for a cached verb that needs re-parsing. The
+                                    page comes from the page store, or from dict.leo.org if it was never stored
+                                    (an exception when offline).
+        """
+        if self.html_verb_rows is not None:
+            return
+        self.html = self.db.get_page({'html_hash': self.html_hash})
+        if self.html is None:
+            if offline:
+                raise Exception(f"No stored page for { self.verb }")
+            self.html_hash = None
             self.get_verb_search()
             self.get_verb_section()
-            self.get_verb_rows()
+        self.get_verb_rows()
+    def _get_db(self, offline: bool=False) -> bool:
+        """
+        _get_db(offline=False) -> bool
+            Loads the cached record. Anything missing from it is looked up again, in which case True is returned so
+            the record gets rewritten. The raw page is only loaded for that. With offline=True nothing is downloaded:
+            missing fields are only re-derived from the stored page and missing conjugation tables are left as None.
+        """
+        db = self.db.get(self.verb)
+        self.html_hash = db.get('html_hash')
+        changed = False
 
         if "english" in db.keys():
             self.english = db['english']
         else:
+            self._load_rows(offline)
             self.get_english_trans()
+            changed = True
 
-        if "table_link" in db.keys() and "table_key" in db.keys():
+        if db.get('table_link') is not None and "table_key" in db.keys():
             self.table_link = db['table_link']
             self.table_key = db['table_key']
         else:
+            self._load_rows(offline)
             self.get_german_conj_link()
+            changed = True
 
-        if "en_table_link" in db.keys() and "en_table_key" in db.keys():
-            self.en_table_link = db['en_table_link']
-            self.en_table_key = db['en_table_key']
+        # No link is a valid answer (Leo has no English table) once an English table was stored for the verb
+        if db.get('en_table_link') is not None or "en_conjugations" in db.keys():
+            self.en_table_link = db.get('en_table_link')
+            self.en_table_key = db.get('en_table_key')
         else:
+            self._load_rows(offline)
             self.get_english_conj_link()
+            changed = changed or self.en_table_link is not None
 
-        if "info_leo" in db.keys():
+        if db.get('info_leo') is not None:
             self.info_leo = db['info_leo']
         else:
+            self._load_rows(offline)
             self.get_info_link()
+            changed = True
 
         if "conjugations" in db.keys():
-            self.conjugations = db['conjugations']
+            self.conjugations = Conjugation.from_dict(db['conjugations'])
+        elif offline:
+            self.conjugations = None
         else:
             self.get_table("de")
+            changed = True
 
         if "en_conjugations" in db.keys():
-            self.en_conjugations = db['en_conjugations']
+            self.en_conjugations = Conjugation.from_dict(db['en_conjugations'])
+        elif offline:
+            self.en_conjugations = None
         else:
             self.get_table("en")
+            changed = changed or self.en_table_link is not None
+        return changed
     def _del_db(self):
-        self.db[self.verb] = "{}"
+        self.db.delete(self.verb)
 
     def _sanitize_text(self, txt) -> str:
         """
@@ -203,18 +499,26 @@ class LeoVerb:
         t_vars['verb_de'] = self.verb
         t_vars['verb_leo'] = self.table_key
         t_vars['info_leo'] = self.info_leo
-        conj = self.conjugations[tense_header][tense]
-        for key in conj.keys():
-            tkey = "conj_" + key.split('/')[0]
-            t_vars[tkey] = conj[key]
+        for pronoun, form in self.conjugations.forms(tense_header, tense):
+            tkey = "conj_" + pronoun.split('/')[0]
+            t_vars[tkey] = form
         return t_vars
 
-    def get_verb_search(self):
+    def search_link(self) -> str:
+        """
+        search_link() - URL of the dict.leo.org search page for this verb
+        """
+        return LEO_URL + "/german-english/" + self.verb
+
+    def get_verb_search(self, text=None):
         """
-        get_verb_search() - fills self.html with the search page request. This helps us reuse the doc across many functions
+        get_verb_search(text=None) - fills self.html with the search page request. This helps us reuse the doc across
+                                     many functions. The page is downloaded unless its text is given.
         """
         # Get HTML search page for verb requested
-        verb_search = self._sanitize_text(requests.get("https://dict.leo.org/german-english/" + self.verb).text)
+        if text is None:
+            text = fetch_page(self.search_link())
+        verb_search = self._sanitize_text(text)
         self.html = verb_search
     
     def get_verb_section(self):
@@ -222,20 +526,7 @@ class LeoVerb:
         get_verb_section() - Transforms self.html to focus on just the verb section of the search page
         """
         # A. Get table sections (Nouns, Verbs, etc) and key by section title
-        section_dic = {}
-        re_sec = re.compile(f'(<thead>(((?!<thead>).)*))')
-        re_row = re.compile(f'(<tr>(((?!</tr>).)*)</tr>)')
-        sections = re_sec.findall(self.html)
-        for section in sections:
-            header = re_row.search(section[0])
-            if header:
-                title = re.search(r'<h2 (((?!>).)*)>(((?!<).)*)</h2>', header.group())
-                # 0 = rest of header
-                # 1 = last char of 0
-                # 2 = title
-                # 3 = last char of title
-                if title:
-                    section_dic[title.groups()[2]] = section[0]
+        section_dic = leoparse.get_sections(self.html)
         if 'Verbs' not in section_dic.keys():
             raise Exception(f"No verb section for verb { self.verb }")
         else:
@@ -243,79 +534,72 @@ class LeoVerb:
     
     def get_verb_rows(self):
         """
-        get_verb_rows() - transforms self.html into a list of regex matches for verb dictionary entry rows
+        get_verb_rows() - transforms self.html into a list of the raw HTML of each verb dictionary entry row
         """
-        # need parens around the entire regex because we're using findall
-        #regex = re.compile(f'(<tr(((?!>).)*)>(((?!</tr>).)*)data-dz-flex-label-1="{ verb }( \([0-9]+\))?"(((?!</tr>).)*)</tr>)')
-        regex = re.compile(f'(<tr(((?!>).)*)data-dz-ui="dictentry"(((?!>).)*)>(((?!</tr>).)*)</tr>)')
-        # use findall to find all matches even though we're *probably* interested in the 1st one
-        rows = regex.findall(self.html)
+        rows = leoparse.get_dictentry_rows(self.html)
         if len(rows) == 0:
             raise Exception("Verb dictionary entries not found on dict.leo.org!")
         else:
             self.html_verb_rows = rows
+            self.row_index = None
     
-    def get_english_trans(self, interactive=True):
-        # Get English translations
-        if interactive:
-            i = 0
-            trans_cell = None
-            self.english = []
-            while not trans_cell and i < len(self.html_verb_rows):
-                # Looking for English translations - it's the first cell with /german-english (and we pull from these) but more
-                # definitively it has:
-                #     <td data-dz-attr="relink" lang="en">
-                # telling us this cell relinks to english words
-                trans_cell = re.search(r'<td data-dz-attr="relink" lang="en">(((?!</td>).)*)</td>', self.html_verb_rows[i][0])
-            
-                ### Find translation info
-                trans_match = re.findall(r'/german-english/([a-zA-z-]+)', trans_cell.group())
-                trans = ' '.join(trans_match)
-                print(f"English translation found: { trans }")
-                answer = ""
-                while answer.upper() not in ["Y", "N", "Q"]:
-                    print("Add / Quit (Y/n/Q)?")
-                    answer = sys.stdin.read(1)
-                    sys.stdin.readline()
-                if answer.upper() == "Y":
-                    self.english.append(trans)
-                    print(f"English translation now: { self.english }")
-                    trans_cell = None
-                if answer.upper() == "N":
-                    trans_cell = None
-                i += 1
-            if len(self.english) == 0:
-                raise Exception(f"No English chosen for { self.verb }")
+    def get_english_candidates(self) -> list:
+        """
+        get_english_candidates() - English translations offered in the verb rows, in page order without duplicates
+        """
+        candidates = []
+        for row in self.html_verb_rows:
+            # Looking for English translations - it's the first cell with /german-english (and we pull from these) but more
+            # definitively it has:
+            #     <td data-dz-attr="relink" lang="en">
+            # telling us this cell relinks to english words
+            trans_cell = re.search(r'<td data-dz-attr="relink" lang="en">(((?!</td>).)*)</td>', row)
+            if not trans_cell:
+                continue
+            ### Find translation info
+            trans_match = re.findall(r'/german-english/([a-zA-z-]+)', trans_cell.group())
+            trans = ' '.join(trans_match)
+            if trans and trans not in candidates:
+                candidates.append(trans)
+        return candidates
+
+    def get_english_trans(self, policy: translation.Policy=None):
+        """
+        get_english_trans(policy=None) - Sets self.english to the translations chosen by the policy (default: the
+                                         policy given to the constructor)
+        """
+        if self.db is None:
+            self._open_db()
+        policy = policy or self.policy
+        self.english = policy.choose(self, self.get_english_candidates())
+        if len(self.english) == 0:
+            raise Exception(f"No English chosen for { self.verb }")
+
+    def get_row_index(self) -> leoparse.RowIndex:
+        """
+        get_row_index() - Returns the link index over self.html_verb_rows, building it on first use
+        """
+        if self.row_index is None:
+            self.row_index = leoparse.get_row_index(self.html_verb_rows)
+        return self.row_index
 
     def get_german_conj_link(self):
         """
         get_german_conj_link() - Retrieves the first link to the German conjugation table
         """
         # Get conjugation page
-        regex = re.compile(f'<td(((?!>).)*)>(((?!</td>).)*)data-dz-flex-label-1="{ self.verb }( \(1\))?"(((?!</td>).)*)"Open verb table"(((?!</td>).)*)</td>')
-        i = 0
-        conj_cell = None
-        while not conj_cell and i < len(self.html_verb_rows):
-            # Looking for conjugation tables (DE)
-            if conj_cell is None:
-                conj_cell = regex.search(self.html_verb_rows[i][0])
-            if conj_cell:
-                # this gets the link & verb table:
-                link = re.search(r'<a href="(((?!").)*)"', conj_cell.group())
-                self.table_link = "https://dict.leo.org" + link.groups()[0]
-                key = re.search(r'data-dz-flex-table-1="(((?!").)*)"', conj_cell.group())
-                self.table_key = key.groups()[0]
-            i+=1
+        conj = self.get_row_index().flex_labels.get(self.verb)
+        if conj:
+            link, self.table_key = conj
+            self.table_link = LEO_URL + link
     
     def get_english_conj_link(self):
         """
         get_english_conj_link() - Retrieves the first link to the English conjugation table
         """
         # Get conjugation page
-        j = 0
-        conj_cell = None
-        while j < len(self.english):
-            i = 0
+        index = self.get_row_index()
+        for english in self.english:
             # One problem: sometimes no English conjugation tables are available!
             #   Handling this issue? Options:
             #      * User (me) provides a table
@@ -323,41 +607,28 @@ class LeoVerb:
             #   The latter is preferred I think. This means changing the Anki layout somewhat. Required changes here:
             #      * in get_table("en"): if no link was found, Ignore and dump an empty table / None to the DB
             # English verb w/o "to"
-            en = self.english[j].split()
+            en = english.split()
             if en[0] == "to":
                 en_verb = ' '.join(en[1:]).lower()
             else:
                 en_verb = ' '.join(en).lower()
-            regex = re.compile(f'<td(((?!>).)*)>(((?!</td>).)*)data-dz-flex-label-1="{ en_verb }( \(1\))?"(((?!</td>).)*)"Open verb table"(((?!</td>).)*)</td>')
-            while not conj_cell and i < len(self.html_verb_rows):
-                # Looking for conjugation tables (EN)
-                if conj_cell is None:
-                    conj_cell = regex.search(self.html_verb_rows[i][0])
-                if conj_cell:
-                    link = re.search(r'<a href="(((?!").)*)"', conj_cell.group())
-                    self.en_table_link = "https://dict.leo.org" + link.groups()[0]
-                    key= re.search(r'data-dz-flex-table-1="(((?!").)*)"', conj_cell.group())
-                    self.en_table_key = key.groups()[0]
-                i+=1
-            j+=1
+            conj = index.flex_labels.get(en_verb)
+            if conj:
+                link, self.en_table_key = conj
+                self.en_table_link = LEO_URL + link
+                break
 
     def get_info_link(self):
         # Get Info page
-        i = 0
-        info_cell = None
-        while not info_cell and i < len(self.html_verb_rows):
-            info_cell = None
-            info_cell = re.search(r'<td(((?!>).)*)>(((?!</td>).)*)data-dz-rel-aiid=(((?!</td>).)*)</td>', self.html_verb_rows[i][0])
-            i += 1
-        if not info_cell:
-            print("Information page not found on leo!")
-            exit()
-        info_key = re.search(r'data-dz-rel-aiid="(((?!").)*)"', info_cell.group())
-        self.info_leo = info_key.groups()[0]
-
-    def get_trans(self, interactive=True):
-        """
-        get_trans(interative: bool=True) -
+        info_key = self.get_row_index().info_key()
+        if info_key is None:
+            raise Exception(f"Information page not found on leo for { self.verb }!")
+        self.info_leo = info_key
+
+    @tracing.traced("leo.get_trans")
+    def get_trans(self, policy: translation.Policy=None):
+        """
+        get_trans(policy=None) -
             This needs to be broken up more:
                 * Grab the html document
                 * Get the important bits in separate methods
@@ -373,48 +644,37 @@ class LeoVerb:
         # C. Step through each row to get the info we need. Ask the user at each step
         #    User input is needed because multiple english translations exist for some verbs and different conjugation tables exist
         #    (though present tense is the same on all seen so far)
-        self.get_english_trans(interactive)
+        self.get_english_trans(policy)
         self.get_german_conj_link()
         self.get_english_conj_link()
         self.get_info_link()    
     
-    def get_table(self, lang):
+    @tracing.traced("leo.get_table")
+    def get_table(self, lang, text=None):
+        """
+        get_table(lang, text=None) - Parses the German ("de") or English ("en") conjugation table into
+                                     self.conjugations / self.en_conjugations. The table page is downloaded unless
+                                     its text is given.
+        """
         if lang == "en":
-            self.en_conjugations = {}
+            self.en_conjugations = Conjugation()
             tense_headers = EN_TENSE_HEADERS
             tenses = EN_TENSES
         else:
-            self.conjugations = {}
+            self.conjugations = Conjugation()
             tense_headers = TENSE_HEADERS
             tenses = TENSES
-        header = {'User-Agent': "Mozilla/5.0 (iPad; CPU OS 14_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/87.0.4280.77 Mobile/15E148 Safari/604.1"}
-        if lang == "en":
-            if self.en_table_link is None:
-                return
-            response = requests.get(self.en_table_link, headers=header)
-        else:
-            response = requests.get(self.table_link, headers=header)
-        # RegEx to grab all rows and all columns in each row using re.findall
-        conj = response.text
+        if lang == "en" and self.en_table_link is None:
+            return
+        if text is None:
+            link = self.en_table_link if lang == "en" else self.table_link
+            text = fetch_page(link, TABLE_REQUEST_HEADERS)
+        conj = text
         conj = conj.replace('<200b>','') # Remove zero width spaces if they exist
         conj = conj.replace('\u200b','') # Remove zero width spaces if they exist
-        conj_tab = []
-        rows_expr = re.compile("(<tr(((?!>).)*)>(((?!</tr>).)*)</tr>)")
-        head_expr = re.compile("(<th(((?!>).)*)>(((?!<th>).)*)</th>)")
-        cols_expr = re.compile("(<td(((?!>).)*)>(((?!</td>).)*)</td>)")
-        strip_expr = re.compile("<[^>]+>")
-        rows = rows_expr.findall(conj)
-        for row in rows:
-            row_text = row[0]
-            cols =  cols_expr.findall(row_text)
-            if len(cols) == 0:
-                cols = head_expr.findall(row_text)
-            row_tab = ""
-            for col in cols:
-                row_tab = strip_expr.sub('', col[0].lstrip().rstrip())
-            if row_tab:
-                conj_tab.append(row_tab)
+        conj_tab = leoparse.get_table_rows(conj)
 
+        conjugations = {}
         header = ""
         tense = ""
         head_dict = {}
@@ -424,12 +684,8 @@ class LeoVerb:
         for row in filter(lambda r: "#Search" not in r, conj_tab):
             if row in tense_headers:
                 if header:
-                    if lang == "en":
-                        if header not in self.en_conjugations:
-                            self.en_conjugations[header] = head_dict
-                    else:
-                        if header not in self.conjugations:
-                            self.conjugations[header] = head_dict
+                    if header not in conjugations:
+                        conjugations[header] = head_dict
                 header = row
                 head_dict = {}
                 if tense:
@@ -452,24 +708,50 @@ class LeoVerb:
                     print(row_parts)
                 #    tense_dict = row_parts[0]
         head_dict[tense] = tense_dict
+        if header not in conjugations.keys():
+            conjugations[header] = head_dict
         if lang == "en":
-            if header not in self.en_conjugations.keys():
-                self.en_conjugations[header] = head_dict
+            self.en_conjugations = Conjugation.from_dict(conjugations)
         else:
-            if header not in self.conjugations.keys():
-                self.conjugations[header] = head_dict
+            self.conjugations = Conjugation.from_dict(conjugations)
     
 if __name__ == "__main__":
     if len(sys.argv) <= 1:
         exit()
     verb_in = sys.argv[1]
+    if verb_in == "prefetch":
+        args = sys.argv[2:]
+        policy = None
+        if len(args) > 1 and args[0] == "--policy":
+            policy = translation.get_policy(args[1])
+            args = args[2:]
+        verbs = LeoVerb.prefetch(args, policy=policy)
+        print(f"Cached { len(verbs) } verbs: { ', '.join(verbs.keys()) }")
+        pending = len(verb_cache().pending_choices())
+        if pending:
+            print(f"{ pending } verbs waiting for translation review (python leoverb.py review)")
+        exit()
+    if verb_in == "review":
+        print(f"Reviewed { LeoVerb.review() } verbs")
+        exit()
+    if verb_in == "refresh":
+        counts = LeoVerb.refresh()
+        print(f"Refreshed { sum(counts.values()) } verbs: { counts['unchanged'] } unchanged, "
+              f"{ counts['updated'] } updated, { counts['failed'] } failed")
+        exit()
+    if verb_in == "migrate":
+        db = VerbDB(DATABASE)
+        path = sys.argv[2] if len(sys.argv) > 2 else DBM_DATABASE
+        print(f"Migrated { db.migrate_dbm(path) } verbs from { path } to { DATABASE }")
+        db.close()
+        exit()
     if verb_in == "del":
         verb_in = sys.argv[2]
         verb = LeoVerb(verb_in, delete=True)
         exit()
     verb = LeoVerb(verb_in)
-    print(verb.html_verb_rows)
+    print(verb.english)
     print("DEUTSCH")
-    print(json.dumps(verb.conjugations, indent = 4))
+    print(json.dumps(verb.conjugations.to_dict(), indent = 4))
     print("\n\nENGLISH")
-    print(json.dumps(verb.en_conjugations, indent = 4))
\ No newline at end of file
+    print(json.dumps(verb.en_conjugations.to_dict(), indent = 4))
\ No newline at end of file
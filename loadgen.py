@@ -0,0 +1,185 @@
+#
+# loadgen.py
+#    -- Load generator for the client code. Drives WPT, LeoVerb and Forvo against a local emulator (emulator.py) at a
+#       chosen concurrency and reports throughput and latency percentiles per scenario.
+#
+# Usage:
+#    python loadgen.py [options] [scenario ...]      - runs the named scenarios (default: all of them)
+#        --url URL            - use an emulator that is already running (default: start one in this process)
+#        --concurrency N      - operations in flight at once (default 8)
+#        --requests N         - operations per scenario (default 200)
+#        --latency, --jitter, --error-rate, --quota  - emulator settings, as for emulator.py
+#
+# Scenarios:
+#    wp_titles   - WPT.get_titles("Verbs"): a paged posts list (pages fetched concurrently)
+#    wp_search   - WPT._search_title_keyword(): one posts search
+#    wp_template - WPT.get_template(): template post revalidation (fields=modified)
+#    wp_post     - WPT._submit(): one new post
+#    leo         - LeoVerb(verb) for a verb not cached yet: search page, both verb tables and the cache write
+#    forvo       - Forvo.get_pronunciation(word) for a word not downloaded yet: API call and mp3 download
+#
+#   Everything the clients write (verb cache, post index, token file, template cache, mp3s) goes to a temporary
+#   directory. The shared HttpClient keeps httpclient.POOL_SIZE connections per host, so concurrency above that
+#   measures connection churn as well.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import leoverb
+import translation
+from leoverb import LeoVerb
+from wpt import WPT
+from forvo import Forvo
+from forvoledger import ForvoLedger
+from httpclient import get_client
+from emulator import Emulator, parse_settings, SITE, SEED_POSTS, TEMPLATE_ID
+
+CONCURRENCY = 8
+REQUESTS = 200
+PERCENTILES = [50, 90, 99]
+
+
+def point_clients(url: str):
+    """
+    point_clients(url) - Sends every WPT, LeoVerb and Forvo request to the emulator at url
+    """
+    leoverb.LEO_URL = url
+    WPT.oauth_url = f"{ url }/oauth2/token"
+    WPT.api_url = f"{ url }/rest/v1.1"
+    Forvo.api_url = f"{ url }/key"
+
+
+def make_wpt(workdir: str) -> WPT:
+    wpt = WPT("env")
+    # The emulator accepts any credentials, so none are read from the environment
+    wpt.wp_key = {"client_id": "loadgen", "client_secret": "loadgen", "username": "loadgen", "password": "loadgen"}
+    wpt.wp_site = {"url": SITE, "template": str(TEMPLATE_ID)}
+    wpt.token_file = os.path.join(workdir, "wp_token.json")
+    return wpt
+
+
+def make_forvo(workdir: str) -> Forvo:
+    forvo = Forvo("env")
+    forvo.api_key = "loadgen"
+    forvo.media_root = os.path.join(workdir, "media")
+    # Quotas are the emulator's business here: the local ledger never holds a lookup back
+    forvo.ledger = ForvoLedger(os.path.join(workdir, "forvo.sqlite"), quota=2 ** 31)
+    return forvo
+
+
+def scenarios(workdir: str) -> dict:
+    """
+    scenarios(workdir) -> dict - {name: operation(i)}. Each operation does one unit of client work.
+    """
+    wpt = make_wpt(workdir)
+    forvo = make_forvo(workdir)
+    run = int(time.time())
+    return {
+        "wp_titles": lambda i: list(wpt.get_titles("Verbs")),
+        "wp_search": lambda i: wpt._search_title_keyword(f"verb{ i % SEED_POSTS }en"),
+        "wp_template": lambda i: wpt.get_template(),
+        "wp_post": lambda i: wpt._submit(f"load{ run }x{ i }en &#8212; to load", "<p>loadgen</p>", ["Verbs"]),
+        "leo": lambda i: LeoVerb(f"lade{ run }x{ i }en", interactive=False, policy=translation.FirstN(1)),
+        "forvo": lambda i: forvo.get_pronunciation(f"wort{ run }x{ i }")
+    }
+
+
+def percentile(latencies: list, p: float) -> float:
+    if not latencies:
+        return 0.0
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+
+def drive(operation, requests: int, concurrency: int) -> dict:
+    """
+    drive(operation, requests, concurrency) -> dict
+        Runs operation(0 ... requests - 1) on concurrency threads. Returns the wall time, the sorted latencies of
+        the operations that succeeded and the errors by exception type.
+    """
+    latencies = []
+    errors = {}
+
+    def timed(i: int):
+        start = time.perf_counter()
+        try:
+            operation(i)
+        except Exception as e:
+            errors.setdefault(type(e).__name__, []).append(str(e))
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    return {"wall": time.perf_counter() - start, "latencies": sorted(latencies), "errors": errors}
+
+
+def report(name: str, result: dict) -> str:
+    latencies = result['latencies']
+    errors = sum(len(e) for e in result['errors'].values())
+    line = f"{ name:12s} { len(latencies) / result['wall']:8.1f}/s { errors:6d}"
+    for p in PERCENTILES:
+        line += f" { percentile(latencies, p) * 1000:9.1f}"
+    line += f" { (latencies[-1] if latencies else 0.0) * 1000:9.1f}"
+    for error, messages in result['errors'].items():
+        line += f"\n{ '':12s} { len(messages)} x { error }: { messages[0] }"
+    return line
+
+
+if __name__ == "__main__":
+    names = ["wp_titles", "wp_search", "wp_template", "wp_post", "leo", "forvo"]
+    parser = argparse.ArgumentParser(description="Drives WPT, LeoVerb and Forvo against the local emulator")
+    parser.add_argument("scenarios", nargs="*", help=f"any of { names }")
+    parser.add_argument("--url", help="running emulator (default: start one in this process)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--requests", type=int, default=REQUESTS)
+    parser.add_argument("--latency", action="append")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", action="append")
+    parser.add_argument("--quota", action="append")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in names]
+    if unknown:
+        parser.error(f"Unknown scenarios { unknown }. Available: { names }")
+
+    emulator = None
+    url = args.url
+    if url is None:
+        emulator = Emulator(latency=parse_settings(args.latency), jitter=args.jitter,
+                            error_rate=parse_settings(args.error_rate), quota=parse_settings(args.quota, int))
+        url = emulator.start()
+    point_clients(url)
+
+    workdir = tempfile.mkdtemp(prefix="votd_loadgen_")
+    cwd = os.getcwd()
+    try:
+        # Relative paths (post index, template cache) land in the work directory too
+        os.chdir(workdir)
+        leoverb.DATABASE = os.path.join(workdir, "verb.sqlite")
+        leoverb.DBM_DATABASE = os.path.join(workdir, "verb.dbm")
+        operations = scenarios(workdir)
+        print(f"{ url }: { args.requests } operations per scenario, concurrency { args.concurrency }")
+        print(f"{ 'scenario':12s} { 'throughput':>10s} { 'errors':>6s}"
+              + ''.join(f" { f'p{ p } ms':>9s}" for p in PERCENTILES) + f" { 'max ms':>9s}")
+        for name in args.scenarios or names:
+            print(report(name, drive(operations[name], args.requests, args.concurrency)))
+        print()
+        print(get_client().report())
+        if emulator is not None:
+            print()
+            print(emulator.report())
+    except Exception:
+        traceback.print_exc()
+        exit(1)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        if emulator is not None:
+            emulator.stop()
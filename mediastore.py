@@ -0,0 +1,155 @@
+#
+# Media store
+#   Content addressed storage for pronunciation audio. Each file is stored once under root/<first 2 hash
+#   characters>/<hash>.mp3, named by the SHA-256 of its bytes, so identical audio for two words (e.g. "sie gehen" and
+#   "Sie gehen") is kept once and file names never contain spaces, slashes or umlauts. The same name is used for the
+#   file in the Anki media folder.
+#
+#   An index (root/index.sqlite) maps each word to the hash of its audio. It is read into memory when the store is
+#   opened, so "which of these words already have audio" is a set lookup rather than a file system probe per word.
+#
+#   The root is MEDIA_ROOT, or the VOTD_MEDIA_ROOT environment variable when set.
+#
+#   python mediastore.py import <dir>   - adds the <word>.mp3 files of an old Forvo data_dir to the store
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import sys
+import shutil
+import hashlib
+import sqlite3
+import tempfile
+import threading
+
+MEDIA_ROOT = os.environ.get("VOTD_MEDIA_ROOT", "data/media")
+MEDIA_SUFFIX = ".mp3"
+HASH_CHUNK = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS words (
+    word        TEXT PRIMARY KEY,
+    hash        TEXT NOT NULL
+);
+"""
+
+
+def file_hash(path: str) -> str:
+    """
+    file_hash(path) -> str - Content hash used to key media files
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaStore:
+    """
+    MediaStore - Pronunciation files under root, indexed by word
+
+    Methods:
+        MediaStore(root=MEDIA_ROOT) - Opens (creating if needed) the store and reads its index
+        have(words) -> set - the words that have audio
+        get(word) -> str - path of the audio for word, or None
+        name(word) -> str - file name of the audio for word (<hash>.mp3), or None
+        put_file(word, path, key=None) -> str - moves the file at path into the store (dropping it when the same
+                                                audio is stored already) and indexes it for word. key is the
+                                                file's hash when the caller already computed it.
+        add_file(word, path) -> str - as put_file, copying the file instead of moving it
+        temp_file() -> (fd, path) - a temporary file on the store's file system, for downloads
+    """
+    root = None
+    conn = None
+    lock = None
+    words = None    # word --> hash, the in-memory manifest
+
+    def __init__(self, root: str=MEDIA_ROOT):
+        self.root = root
+        self.lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.words = dict(self.conn.execute("SELECT word, hash FROM words"))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + MEDIA_SUFFIX)
+
+    def have(self, words) -> set:
+        with self.lock:
+            return set(words) & self.words.keys()
+
+    def get(self, word: str) -> str:
+        with self.lock:
+            key = self.words.get(word)
+        return self._path(key) if key is not None else None
+
+    def name(self, word: str) -> str:
+        with self.lock:
+            key = self.words.get(word)
+        return key + MEDIA_SUFFIX if key is not None else None
+
+    def temp_file(self) -> tuple:
+        return tempfile.mkstemp(dir=self.root, suffix=".part")
+
+    def put_file(self, word: str, path: str, key: str=None) -> str:
+        key = key or file_hash(path)
+        target = self._path(key)
+        if os.path.exists(target):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO words (word, hash) VALUES (?, ?)", (word, key))
+            self.words[word] = key
+        return target
+
+    def add_file(self, word: str, path: str) -> str:
+        fd, tmp = self.temp_file()
+        with os.fdopen(fd, 'wb') as fp, open(path, 'rb') as src:
+            shutil.copyfileobj(src, fp)
+        return self.put_file(word, tmp)
+
+    def import_dir(self, directory: str) -> int:
+        """
+        import_dir(directory) -> int - Adds every <word>.mp3 file in directory (the old Forvo data_dir layout)
+        """
+        count = 0
+        for fname in os.listdir(directory):
+            if fname.endswith(MEDIA_SUFFIX):
+                self.add_file(fname[:-len(MEDIA_SUFFIX)], os.path.join(directory, fname))
+                count += 1
+        return count
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(root: str=MEDIA_ROOT) -> MediaStore:
+    """
+    get_store(root=MEDIA_ROOT) -> MediaStore - The process wide store at root, opened on first use
+    """
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = MediaStore(root)
+        return _stores[root]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "import":
+        print("Usage: python mediastore.py import <dir>")
+        exit(1)
+    store = get_store()
+    print(f"Imported { store.import_dir(sys.argv[2]) } files into { store.root } ({ len(store) } words)")
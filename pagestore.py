@@ -0,0 +1,61 @@
+#
+# Page store
+#   Compressed, content addressed storage for raw dict.leo.org pages. Pages are only needed when a verb has to be
+#   re-parsed, so they live outside the verb database: each page is zlib compressed into its own file named by the
+#   SHA-256 of its text, and verb records only keep that hash. Identical pages are stored once.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import zlib
+import hashlib
+import tempfile
+
+COMPRESSION_LEVEL = 9
+
+
+def page_hash(text: str) -> str:
+    """
+    page_hash(text) -> str - Content hash used to key pages
+    """
+    return hashlib.sha256(text.encode('UTF-8')).hexdigest()
+
+
+class PageStore:
+    """
+    PageStore - zlib compressed page files under root/<first 2 hash characters>/<hash>.z
+
+    Methods:
+        PageStore(root) - Constructor. root is created on first write.
+        put(text) -> hash - stores the page (once) and returns its content hash
+        get(hash) -> text - returns the page, or None if it is not stored
+    """
+    root = None
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".z")
+
+    def put(self, text: str) -> str:
+        key = page_hash(text)
+        path = self._path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial page
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(zlib.compress(text.encode('UTF-8'), COMPRESSION_LEVEL))
+            os.replace(tmp, path)
+        return key
+
+    def get(self, key: str) -> str:
+        if key is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as fp:
+                return zlib.decompress(fp.read()).decode('UTF-8')
+        except FileNotFoundError:
+            return None
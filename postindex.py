@@ -0,0 +1,251 @@
+#
+# Post index
+#   Local SQLite copy of the WordPress post list (ID, title, URL, date, modified, status and categories), indexed by
+#   the German verb each title starts with. Titles have the form "<verb> — <English>"; title_verb() reduces one
+#   to its verb and normalize_title() casefolds that into the index key, so duplicate checks are a single indexed
+#   lookup instead of a full text search on WordPress.
+#
+#   The index is filled by WPT.sync_posts(): incrementally with modified_after (only posts changed since the last
+#   sync), and completely every FULL_SYNC_INTERVAL so posts that were trashed or deleted drop out. modified_after is
+#   strictly after, so an incremental sync starts SYNC_OVERLAP seconds before the newest modified time it has seen:
+#   a post saved in the same second as that one is not skipped, and the posts received again replace themselves.
+#
+#   AnkiDeVotD reads its verb list (the published posts of the Verbs category, oldest first) from the index, so a run
+#   only downloads the posts changed since the previous one. WordPress publishes a scheduled ("future") post without
+#   changing its modified time, so an incremental sync never sees it flip to "publish"; verbs() counts scheduled
+#   posts whose date has passed as published.
+#
+#   The submissions table maps the idempotency key of every post WPT.post_many created to its post ID, so a batch
+#   that is run again skips what it already posted.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import re
+import html
+import time
+import sqlite3
+import threading
+import unicodedata
+from datetime import datetime, timedelta, timezone
+
+POST_INDEX = "data/posts.sqlite"
+FULL_SYNC_INTERVAL = 7 * 24 * 3600  # Seconds between complete re-syncs
+SYNC_OVERLAP = 5  # Seconds an incremental sync reaches back before the newest modified time already stored
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id          INTEGER PRIMARY KEY,
+    verb        TEXT NOT NULL,
+    title       TEXT NOT NULL,
+    url         TEXT,
+    date        TEXT,
+    modified    TEXT,
+    status      TEXT
+);
+CREATE TABLE IF NOT EXISTS post_categories (
+    id          INTEGER NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+    category    TEXT NOT NULL,
+    PRIMARY KEY (id, category)
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    key         TEXT PRIMARY KEY,
+    id          INTEGER NOT NULL,
+    title       TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key         TEXT PRIMARY KEY,
+    value       TEXT
+);
+CREATE INDEX IF NOT EXISTS posts_by_verb ON posts (verb, date);
+CREATE INDEX IF NOT EXISTS categories_by_name ON post_categories (category, id);
+"""
+
+POST_FIELDS = ["ID", "title", "URL", "date", "modified", "status"]
+
+# Separators between the verb and the English part of a title: em dash, en dash, or a spaced hyphen
+_TITLE_SPLIT = re.compile(r'\s*(?:—|–|\s-\s)\s*')
+
+
+def title_verb(title: str) -> str:
+    """
+    title_verb(title) -> str - The verb part of a post title as it is spelled
+                               ("Private: heißen &#8212; to be called" --> "heißen")
+    """
+    title = unicodedata.normalize("NFC", html.unescape(title or ""))
+    title = title.replace("Private: ", "")
+    return _TITLE_SPLIT.split(title.strip(), maxsplit=1)[0].strip()
+
+
+def normalize_title(title: str) -> str:
+    """
+    normalize_title(title) -> str - The verb part of a post title, casefolded, as used for index lookups
+                                    ("Heißen &#8212; to be called" --> "heissen")
+    """
+    return title_verb(title).casefold()
+
+
+def sync_start(modified: str, overlap: int=SYNC_OVERLAP) -> str:
+    """
+    sync_start(modified, overlap=SYNC_OVERLAP) -> str - The modified_after of an incremental sync: overlap seconds
+                                                         before modified ("2024-01-07T09:00:00+00:00")
+    """
+    try:
+        return (datetime.fromisoformat(modified) - timedelta(seconds=overlap)).isoformat()
+    except (TypeError, ValueError):
+        return modified
+
+
+def _is_due(date: str, now: datetime) -> bool:
+    """
+    _is_due(date, now) -> bool - Whether a post date ("2024-01-07T09:00:00+02:00") is not later than now
+    """
+    try:
+        when = datetime.fromisoformat(date)
+    except (TypeError, ValueError):
+        return False
+    return (when if when.tzinfo else when.replace(tzinfo=timezone.utc)) <= now
+
+
+class PostIndex:
+    """
+    PostIndex - Local index of WordPress posts
+
+    Methods:
+        PostIndex(path=POST_INDEX) - Opens (creating if needed) the index
+        find(verb) - the newest post whose title starts with verb, or None
+        find_title(title) - the newest post with exactly this title, or None
+        verbs(category, status="publish") - (verb, title) of every post in a category, oldest first. "publish"
+                                            includes scheduled posts that are due.
+        put_many(posts, full=False) - stores posts as returned by the posts API; full replaces the whole index
+        age() / full_age() - seconds since the last sync / complete sync
+        get_meta(key) / set_meta(key, value) - sync bookkeeping
+        get_submission(key) / set_submission(key, post) - post created for an idempotency key
+    """
+    path = None
+    conn = None
+    lock = None
+
+    def __init__(self, path: str=POST_INDEX):
+        self.path = path
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("PRAGMA foreign_keys=ON")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def get_meta(self, key: str) -> str:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def age(self) -> float:
+        synced = self.get_meta("synced_at")
+        return time.time() - float(synced) if synced else float("inf")
+
+    def full_age(self) -> float:
+        synced = self.get_meta("full_synced_at")
+        return time.time() - float(synced) if synced else float("inf")
+
+    def get_submission(self, key: str) -> dict:
+        """
+        get_submission(key) -> dict - The indexed post created for an idempotency key, {"ID": id} when the post is not
+                                      indexed (yet), or None when nothing was posted for the key
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT s.id, p.title, p.url, p.date, p.modified, p.status FROM submissions s "
+                "LEFT JOIN posts p ON p.id = s.id WHERE s.key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(POST_FIELDS, row)) if row[1] is not None else {"ID": row[0]}
+
+    def set_submission(self, key: str, post: dict):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO submissions (key, id, title) VALUES (?, ?, ?)",
+                              (key, post['ID'], post.get('title')))
+
+    def find_title(self, title: str) -> dict:
+        """
+        find_title(title) -> dict - The newest post with exactly this title, or None
+        """
+        title = html.unescape(title)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, title, url, date, modified, status FROM posts WHERE verb = ? AND title = ? "
+                "ORDER BY date DESC LIMIT 1", (normalize_title(title), title)).fetchone()
+        return dict(zip(POST_FIELDS, row)) if row else None
+
+    def find(self, verb: str) -> dict:
+        """
+        find(verb) -> dict - The newest post for verb with the posts API field names (ID, title, URL, ...), or None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, title, url, date, modified, status FROM posts WHERE verb = ? ORDER BY date DESC LIMIT 1",
+                (normalize_title(verb),)).fetchone()
+        return dict(zip(POST_FIELDS, row)) if row else None
+
+    def verbs(self, category: str, status: str="publish") -> list:
+        """
+        verbs(category, status="publish") -> list of (verb, title) for the posts in a category, oldest first
+        """
+        statuses = [status, "future"] if status == "publish" else [status]
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT p.verb, p.title, p.date, p.status FROM posts p JOIN post_categories c ON c.id = p.id "
+                f"WHERE c.category = ? AND p.status IN ({ ', '.join(['?'] * len(statuses)) }) ORDER BY p.date, p.id",
+                [category] + statuses).fetchall()
+        now = datetime.now(timezone.utc)
+        return [(verb, title) for verb, title, date, post_status in rows
+                if post_status == status or _is_due(date, now)]
+
+    def put_many(self, posts: list, full: bool=False):
+        """
+        put_many(posts, full=False) - Stores posts from the posts API (fields ID, title, URL, date, modified, status,
+                                      categories) in one transaction, the last one of each ID. With full=True
+                                      every other post is removed.
+        """
+        # A post listed twice in one batch (edited while the pages were being read) is stored once
+        posts = {post['ID']: post for post in posts}.values()
+        with self.lock, self.conn:
+            if full:
+                self.conn.execute("DELETE FROM posts")
+            for post in posts:
+                title = html.unescape(post['title'])
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO posts (id, verb, title, url, date, modified, status) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (post['ID'], normalize_title(title), title, post.get('URL'), post.get('date'),
+                     post.get('modified'), post.get('status')))
+                self.conn.execute("DELETE FROM post_categories WHERE id = ?", (post['ID'],))
+                self.conn.executemany("INSERT INTO post_categories (id, category) VALUES (?, ?)",
+                                      [(post['ID'], category) for category in (post.get('categories') or {})])
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(path: str=POST_INDEX) -> PostIndex:
+    """
+    get_index(path=POST_INDEX) -> PostIndex - The process wide index at path, opened on first use
+    """
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = PostIndex(path)
+        return _indexes[path]
@@ -1,73 +1,224 @@
-# Secrets retrieval 
-#   Returns a dictionary of secrets based on application. Secrets stored in AWS SSM Parameter Store
-# 
+# Secrets retrieval
+#   Returns a dictionary of secrets based on application. Secrets are read from one of the TYPES of storage:
+#       ssm  - AWS SSM Parameter Store (the parameter names below)
+#       file - a JSON file of {parameter name: value} (default SECRETS_FILE)
+#       env  - environment variables named after the parameters ("/keys/wp/client_id" --> VOTD_KEYS_WP_CLIENT_ID)
+#   One SecretsProvider per storage is shared by the whole process (get_provider). It reads every parameter in a
+#   single batched call (one SSM get_parameters request instead of one request per secret) and keeps the values in
+#   memory for SECRETS_TTL seconds. With cache=<file> the values are also kept in a local file encrypted with the
+#   Fernet key in VOTD_SECRETS_KEY (needs the optional cryptography package), so a new process skips SSM too.
+#
+#   In fixture record / replay mode (fixtures.py) secrets are saved to, or answered from, the fixture directory.
+#
 # Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
 #
 
-import boto3
+import os
+import json
+import time
+import tempfile
+import threading
+import fixtures
+import tracing
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
 
 TYPES = [
-    "ssm"
+    "ssm",
+    "file",
+    "env"
 ]
 
+SECRETS_TTL = 3600                  # Seconds the values are kept before they are read again
+SECRETS_FILE = "auth/secrets.json"  # Default file for the "file" storage
+ENV_PREFIX = "VOTD"                 # Prefix of the variables for the "env" storage
+KEY_VARIABLE = "VOTD_SECRETS_KEY"   # Fernet key of the encrypted local cache
+
+WP_KEY = ["client_id", "client_secret", "username", "password"]
+WP_SITE = ["url", "template"]
+PARAMETERS = ([f"/keys/wp/{ name }" for name in WP_KEY] + [f"/site/{ name }" for name in WP_SITE]
+              + ["/keys/forvo"])
+
+
+def env_name(parameter: str, prefix: str=ENV_PREFIX) -> str:
+    """
+    env_name(parameter, prefix=ENV_PREFIX) -> str - "/keys/wp/client_id" --> "VOTD_KEYS_WP_CLIENT_ID"
+    """
+    return '_'.join([prefix] + parameter.strip('/').split('/')).upper()
+
+
+class SecretsProvider:
+    """
+    SecretsProvider - Every parameter of one secrets storage, read in one batch and cached
+
+    Methods:
+        SecretsProvider(type="ssm", ttl=SECRETS_TTL, cache=None, **kwargs) - Constructor. kwargs: region (ssm),
+                                                                            path (file), prefix (env)
+        get(parameter) -> str - one parameter (all of them are read when the cached values are missing or stale)
+        values() -> dict - every parameter that was found
+        clear() - forgets the cached values (in memory and in the local cache file)
+    """
+    type = None
+    kwargs = None
+    ttl = None
+    cache = None
+    ssm = None
+    lock = None
+    _values = None
+    fetched_at = None
+
+    def __init__(self, type: str="ssm", ttl: float=SECRETS_TTL, cache: str=None, **kwargs):
+        if type not in TYPES:
+            raise Exception(f"Type must be one of { TYPES }")
+        if type == "ssm" and "region" not in kwargs.keys():
+            raise Exception(f"AWS Region required for SSM stored secrets. Set `region='us-east-2'")
+        if cache is not None and Fernet is None:
+            raise Exception("The encrypted secrets cache needs the cryptography package (pip install cryptography)")
+        self.type = type
+        self.ttl = ttl
+        self.cache = cache
+        self.kwargs = kwargs
+        self.lock = threading.Lock()
+
+    def get(self, parameter: str) -> str:
+        values = self.values()
+        if parameter not in values:
+            raise Exception(f"Secret { parameter } not found in { self.type } storage")
+        return values[parameter]
+
+    def values(self) -> dict:
+        with self.lock:
+            if self._values is None or time.time() - self.fetched_at > self.ttl:
+                values = self._read_cache()
+                if values is None:
+                    with tracing.span("secrets.fetch", "network", host=self.type, count=len(PARAMETERS)):
+                        values = self._fetch()
+                    self._write_cache(values)
+                self._values = values
+                self.fetched_at = time.time()
+            return self._values
+
+    def clear(self):
+        with self.lock:
+            self._values = None
+            if self.cache is not None and os.path.exists(self.cache):
+                os.remove(self.cache)
+
+    def _fetch(self) -> dict:
+        if self.type == "ssm":
+            return self._fetch_ssm()
+        if self.type == "file":
+            return self._fetch_file()
+        return self._fetch_env()
+
+    def _fetch_ssm(self) -> dict:
+        if self.ssm is None:
+            import boto3
+            self.ssm = boto3.client('ssm', region_name=self.kwargs['region'])
+        # Parameters that do not exist come back in InvalidParameters rather than failing the whole call
+        response = self.ssm.get_parameters(Names=PARAMETERS, WithDecryption=True)
+        return {parameter['Name']: parameter['Value'] for parameter in response['Parameters']}
+
+    def _fetch_file(self) -> dict:
+        with open(self.kwargs.get("path", SECRETS_FILE)) as fp:
+            stored = json.load(fp)
+        return {name: str(stored[name]) for name in PARAMETERS if name in stored}
+
+    def _fetch_env(self) -> dict:
+        prefix = self.kwargs.get("prefix", ENV_PREFIX)
+        return {name: os.environ[env_name(name, prefix)] for name in PARAMETERS if env_name(name, prefix) in os.environ}
+
+    def _fernet(self):
+        key = os.environ.get(KEY_VARIABLE)
+        if not key:
+            raise Exception(f"Set { KEY_VARIABLE } (Fernet.generate_key()) to use the encrypted secrets cache")
+        return Fernet(key.encode('ascii'))
+
+    def _read_cache(self) -> dict:
+        if self.cache is None or not os.path.exists(self.cache):
+            return None
+        with open(self.cache, 'rb') as fp:
+            token = fp.read()
+        try:
+            # Fernet tokens carry their creation time, so the TTL is checked on decryption
+            return json.loads(self._fernet().decrypt(token, ttl=int(self.ttl)))
+        except InvalidToken:
+            return None
+
+    def _write_cache(self, values: dict):
+        if self.cache is None:
+            return
+        directory = os.path.dirname(self.cache) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(self._fernet().encrypt(json.dumps(values).encode('UTF-8')))
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, self.cache)
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+def get_provider(type: str="ssm", **kwargs) -> SecretsProvider:
+    """
+    get_provider(type="ssm", **kwargs) -> SecretsProvider - The process wide provider for a storage and its settings
+    """
+    key = (type, tuple(sorted(kwargs.items())))
+    with _providers_lock:
+        if key not in _providers:
+            _providers[key] = SecretsProvider(type, **kwargs)
+        return _providers[key]
+
+
 class Secrets:
     type = ""
-    ssm = None
-    ssm_wp_key = "/keys/wp/"
-    ssm_wp_site = "/site/"
-    ssm_forvo_key = "/keys/forvo"
-   
+    provider = None
+
     def __init__(self, type: str = "ssm", **kwargs):
         if type not in TYPES:
             raise Exception(f"Type must be one of { TYPES }")
         self.type = type
-        if type == "ssm":
-            if "region" not in kwargs.keys():
-                raise Exception(f"AWS Region required for SSM stored secrets. Set `region='us-east-2'")
-            self.ssm = boto3.client('ssm', region_name=kwargs['region'])
-    
+        if fixtures.replaying():
+            return
+        self.provider = get_provider(type, **kwargs)
+
+    def _fixture(self, name: str, get):
+        """
+        _fixture(name, get) - Runs get() unless replaying fixtures; records its result when recording
+        """
+        with tracing.span(f"secrets.{ name }", "network", host=self.type):
+            if fixtures.replaying():
+                return fixtures.replay("secrets", [self.type, name], name)
+            value = get()
+            if fixtures.recording():
+                fixtures.record("secrets", [self.type, name], value)
+            return value
+
     def get_wp_key(self) -> dict:
         """
         get_wp_key() - returns dictionary of wordpress API credentials from secrets storage.
-                     - defers to secrets storage routines based on storage type
         """
-        if self.type == "ssm":
-            return self.get_wp_key_ssm()
-    
-    def get_wp_key_ssm(self) -> dict:
-        wp_ssm = self.ssm.get_parameters_by_path(Path=self.ssm_wp_key, WithDecryption=True)['Parameters']
-        wp = {}
-        for parameter in wp_ssm:
-            name = parameter['Name'].split('/')[3]
-            wp[name] = parameter['Value']
+        return self._fixture("wp_key", self._wp_key)
+
+    def _wp_key(self) -> dict:
+        wp = {name: self.provider.get(f"/keys/wp/{ name }") for name in WP_KEY}
         wp['client_id'] = int(wp['client_id'])
         return wp
-        
+
     def get_wp_site(self) -> dict:
         """
         get_wp_site() - returns dictionary of wordpress Site and Template information from secrets storage.
-                      - defers to secrets storage routines based on storage type
         """
-        if self.type == "ssm":
-            return self.get_wp_site_ssm()
-    
-    def get_wp_site_ssm(self) -> dict:
-        site_ssm = self.ssm.get_parameters_by_path(Path=self.ssm_wp_site, WithDecryption=True)['Parameters']
-        site_info = {}
-        for parameter in site_ssm:
-            name = parameter['Name'].split('/')[2]
-            site_info[name] = parameter['Value']
-        return site_info
-    
-    def get_forvo_key(self) -> dict:
+        return self._fixture("wp_site", self._wp_site)
+
+    def _wp_site(self) -> dict:
+        return {name: self.provider.get(f"/site/{ name }") for name in WP_SITE}
+
+    def get_forvo_key(self) -> str:
         """
-        get_forvo_key() - returns dictionary of Forvo API credentials from secrets storage.
-                        - defers to secrets storage routines based on storage type
+        get_forvo_key() - returns the Forvo API key from secrets storage.
         """
-        if self.type == "ssm":
-            return self.get_forvo_key_ssm()
-    
-    def get_forvo_key_ssm(self) -> str:
-        forvo_ssm = self.ssm.get_parameter(Name=self.ssm_forvo_key, WithDecryption=True)['Parameter']
-        forvo_key = forvo_ssm['Value']
-        return forvo_key 
\ No newline at end of file
+        return self._fixture("forvo_key", lambda: self.provider.get("/keys/forvo"))
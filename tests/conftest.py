@@ -0,0 +1,11 @@
+#
+# Test configuration
+#   The modules under test live in the repository root and are imported by name, as the scripts there import them.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,117 @@
+#
+# Tests for forvoledger.py - negative cache TTL and the conditional quota booking
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import time
+import threading
+import forvoledger
+from forvoledger import ForvoLedger
+
+
+def test_take_books_until_the_limit(tmp_path):
+    ledger = ForvoLedger(str(tmp_path / "forvo.sqlite"), quota=3)
+    assert [ledger.take() for i in range(5)] == [True, True, True, False, False]
+    assert ledger.used() == 3
+    assert ledger.remaining() == 0
+
+
+def test_take_with_a_lower_limit_keeps_the_reserve(tmp_path):
+    ledger = ForvoLedger(str(tmp_path / "forvo.sqlite"), quota=5)
+    assert [ledger.take(3) for i in range(4)] == [True, True, True, False]
+    # The reserve is still there for a lookup allowed the full quota
+    assert ledger.take() and ledger.take() and not ledger.take()
+    assert ledger.used() == 5
+
+
+def test_take_with_no_limit_left_books_nothing(tmp_path):
+    ledger = ForvoLedger(str(tmp_path / "forvo.sqlite"), quota=5)
+    assert not ledger.take(0)
+    assert not ledger.take(-2)
+    assert ledger.used() == 0
+
+
+def test_take_never_overspends_across_threads(tmp_path):
+    ledger = ForvoLedger(str(tmp_path / "forvo.sqlite"), quota=50)
+    booked = []
+
+    def worker():
+        for i in range(20):
+            if ledger.take():
+                booked.append(1)
+
+    threads = [threading.Thread(target=worker) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(booked) == 50
+    assert ledger.used() == 50
+
+
+def test_take_never_overspends_across_connections(tmp_path):
+    path = str(tmp_path / "forvo.sqlite")
+    first = ForvoLedger(path, quota=4)
+    second = ForvoLedger(path, quota=4)
+    results = [ledger.take() for i in range(4) for ledger in (first, second)]
+    assert results.count(True) == 4
+    assert first.used() == second.used() == 4
+
+
+def test_counts_are_per_day(tmp_path, monkeypatch):
+    ledger = ForvoLedger(str(tmp_path / "forvo.sqlite"), quota=1)
+    monkeypatch.setattr(forvoledger, "today", lambda: "2030-01-01")
+    assert ledger.take() and not ledger.take()
+    monkeypatch.setattr(forvoledger, "today", lambda: "2030-01-02")
+    assert ledger.used() == 0
+    assert ledger.take()
+
+
+def test_exhaust_uses_up_today(tmp_path):
+    ledger = ForvoLedger(str(tmp_path / "forvo.sqlite"), quota=10)
+    ledger.take()
+    ledger.exhaust()
+    assert ledger.used() == 10
+    assert not ledger.take()
+    # A count already above the quota is kept
+    ledger.quota = 5
+    ledger.exhaust()
+    assert ledger.used() == 10
+
+
+def test_negative_cache(tmp_path):
+    ledger = ForvoLedger(str(tmp_path / "forvo.sqlite"))
+    assert not ledger.is_negative("gehst")
+    ledger.set_negative("gehst")
+    assert ledger.is_negative("gehst")
+    assert not ledger.is_negative("geht")
+    ledger.clear_negative("gehst")
+    assert not ledger.is_negative("gehst")
+
+
+def test_negative_cache_entries_expire(tmp_path, monkeypatch):
+    ledger = ForvoLedger(str(tmp_path / "forvo.sqlite"), negative_ttl=60)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    ledger.set_negative("gehst")
+    monkeypatch.setattr(time, "time", lambda: now + 59)
+    assert ledger.is_negative("gehst")
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert not ledger.is_negative("gehst")
+
+
+def test_ledger_persists(tmp_path):
+    path = str(tmp_path / "data" / "forvo.sqlite")
+    ledger = ForvoLedger(path, quota=10)
+    ledger.take()
+    ledger.set_negative("gehst")
+    ledger.close()
+    reopened = ForvoLedger(path, quota=10)
+    assert reopened.used() == 1
+    assert reopened.is_negative("gehst")
+
+
+def test_get_ledger_is_shared(tmp_path):
+    path = str(tmp_path / "forvo.sqlite")
+    assert forvoledger.get_ledger(path) is forvoledger.get_ledger(path)
@@ -0,0 +1,116 @@
+#
+# Tests for mediastore.py - content addressed storage, dedup and the word index
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import hashlib
+import mediastore
+from mediastore import MediaStore, file_hash
+
+
+def write(path, data: bytes) -> str:
+    with open(path, 'wb') as fp:
+        fp.write(data)
+    return str(path)
+
+
+def files(root) -> list:
+    return sorted(name for directory, dirs, names in os.walk(root) for name in names
+                  if name.endswith(mediastore.MEDIA_SUFFIX))
+
+
+def test_file_hash(tmp_path):
+    path = write(tmp_path / "a.mp3", b"ID3 gehen" * 10000)
+    assert file_hash(path) == hashlib.sha256(b"ID3 gehen" * 10000).hexdigest()
+
+
+def test_put_file_moves_into_the_store(tmp_path):
+    store = MediaStore(str(tmp_path / "media"))
+    source = write(tmp_path / "download.part", b"ID3 gehen")
+    key = file_hash(source)
+    path = store.put_file("gehen", source)
+    assert not os.path.exists(source)
+    assert path == os.path.join(store.root, key[:2], key + ".mp3")
+    assert store.get("gehen") == path
+    assert store.name("gehen") == key + ".mp3"
+    with open(path, 'rb') as fp:
+        assert fp.read() == b"ID3 gehen"
+
+
+def test_identical_audio_is_stored_once(tmp_path):
+    store = MediaStore(str(tmp_path / "media"))
+    first = store.put_file("sie gehen", write(tmp_path / "1.part", b"ID3 gehen"))
+    second = store.put_file("Sie gehen", write(tmp_path / "2.part", b"ID3 gehen"))
+    other = store.put_file("gehe", write(tmp_path / "3.part", b"ID3 gehe"))
+    assert first == second != other
+    assert len(files(store.root)) == 2
+    assert len(store) == 3
+
+
+def test_add_file_copies(tmp_path):
+    store = MediaStore(str(tmp_path / "media"))
+    source = write(tmp_path / "gehen.mp3", b"ID3 gehen")
+    store.add_file("gehen", source)
+    assert os.path.exists(source)
+    assert store.get("gehen") is not None
+
+
+def test_names_are_safe_for_any_word(tmp_path):
+    store = MediaStore(str(tmp_path / "media"))
+    store.put_file("er/sie/es geht", write(tmp_path / "1.part", b"ID3 geht"))
+    assert "/" not in store.name("er/sie/es geht")
+    assert " " not in store.name("er/sie/es geht")
+
+
+def test_have_and_missing_words(tmp_path):
+    store = MediaStore(str(tmp_path / "media"))
+    store.put_file("gehen", write(tmp_path / "1.part", b"ID3 gehen"))
+    assert store.have(["gehen", "kommen"]) == {"gehen"}
+    assert store.get("kommen") is None
+    assert store.name("kommen") is None
+
+
+def test_index_is_reloaded(tmp_path):
+    root = str(tmp_path / "media")
+    store = MediaStore(root)
+    path = store.put_file("gehen", write(tmp_path / "1.part", b"ID3 gehen"))
+    store.close()
+    reopened = MediaStore(root)
+    assert reopened.get("gehen") == path
+    assert reopened.have(["gehen"]) == {"gehen"}
+
+
+def test_a_word_can_be_replaced(tmp_path):
+    store = MediaStore(str(tmp_path / "media"))
+    store.put_file("gehen", write(tmp_path / "1.part", b"ID3 old"))
+    store.put_file("gehen", write(tmp_path / "2.part", b"ID3 new"))
+    with open(store.get("gehen"), 'rb') as fp:
+        assert fp.read() == b"ID3 new"
+    assert len(store) == 1
+
+
+def test_temp_file_is_on_the_store_file_system(tmp_path):
+    store = MediaStore(str(tmp_path / "media"))
+    fd, path = store.temp_file()
+    os.close(fd)
+    assert os.path.dirname(path) == store.root
+
+
+def test_import_dir(tmp_path):
+    old = tmp_path / "forvo"
+    old.mkdir()
+    write(old / "gehen.mp3", b"ID3 gehen")
+    write(old / "sie gehen.mp3", b"ID3 gehen")
+    write(old / "notes.txt", b"not audio")
+    store = MediaStore(str(tmp_path / "media"))
+    assert store.import_dir(str(old)) == 2
+    assert store.have(["gehen", "sie gehen"]) == {"gehen", "sie gehen"}
+    assert len(files(store.root)) == 1
+    assert os.path.exists(old / "gehen.mp3")
+
+
+def test_get_store_is_shared(tmp_path):
+    root = str(tmp_path / "media")
+    assert mediastore.get_store(root) is mediastore.get_store(root)
@@ -0,0 +1,215 @@
+#
+# Tests for postindex.py - title normalization, lookups, scheduled posts and full / incremental syncs
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import time
+import pytest
+import postindex
+from postindex import PostIndex, normalize_title, title_verb
+
+
+def post(id: int, title: str, date: str="2024-01-01T09:00:00+00:00", status: str="publish",
+         modified: str=None, categories: list=("Verbs",)) -> dict:
+    return {"ID": id, "title": title, "URL": f"https://example.com/{ id }/", "date": date,
+            "modified": modified or date, "status": status, "categories": {name: {} for name in categories}}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return PostIndex(str(tmp_path / "posts.sqlite"))
+
+
+def test_normalize_title():
+    assert normalize_title("gehen &#8212; to go") == "gehen"
+    assert normalize_title("Private: Gehen — to go") == "gehen"
+    assert normalize_title("gehen – to go") == "gehen"
+    assert normalize_title("gehen - to go") == "gehen"
+    assert normalize_title("vor-gehen") == "vor-gehen"
+    assert normalize_title("ge\u0308hen — to go") == "g\u00ebhen"
+    assert normalize_title(None) == ""
+    assert normalize_title("Heißen — to be called") == "heissen"
+
+
+def test_title_verb_keeps_the_spelling():
+    assert title_verb("heißen &#8212; to be called") == "heißen"
+    assert title_verb("Private: Essen — to eat") == "Essen"
+    assert title_verb("ge\u0308hen — to go") == "g\u00ebhen"
+    assert title_verb(None) == ""
+
+
+def test_find_returns_the_newest_post(index):
+    index.put_many([post(1, "gehen &#8212; to go", "2023-01-01T09:00:00+00:00"),
+                    post(2, "gehen — to walk", "2024-01-01T09:00:00+00:00"),
+                    post(3, "kommen — to come")])
+    assert index.find("gehen")['ID'] == 2
+    assert index.find("Gehen")['ID'] == 2
+    assert index.find("sehen") is None
+    assert index.find_title("gehen &#8212; to go")['ID'] == 1
+    assert index.find_title("gehen — to run") is None
+
+
+def test_verbs_by_category_and_status_oldest_first(index):
+    index.put_many([post(1, "kommen — to come", "2024-01-02T09:00:00+00:00"),
+                    post(2, "gehen — to go", "2024-01-01T09:00:00+00:00"),
+                    post(3, "sehen — to see", status="draft"),
+                    post(4, "Private: template", categories=())])
+    assert index.verbs("Verbs") == [("gehen", "gehen — to go"), ("kommen", "kommen — to come")]
+    assert index.verbs("Verbs", "draft") == [("sehen", "sehen — to see")]
+
+
+def test_anki_verb_list_matches_the_card_verbs(index):
+    ankidevotd = pytest.importorskip("ankidevotd")
+
+    class IndexWPT:
+        def posted_titles(self, category):
+            return [title for verb, title in index.verbs(category)]
+
+    index.put_many([post(1, "heißen &#8212; to be called", "2024-01-01T09:00:00+00:00"),
+                    post(2, "Essen — to eat", "2024-01-02T09:00:00+00:00"),
+                    post(3, "gehen — to go", "2024-01-03T09:00:00+00:00")])
+    advd = ankidevotd.AnkiDeVotD(IndexWPT())
+    assert advd.verb_list == ["heißen", "Essen", "gehen"]
+    # Card verbs are read from the card back as they are spelled
+    advd.decks = {1: {'verbs': {"heißen", "Essen"}}}
+    assert advd.get_missing_verbs() == {"gehen"}
+
+
+def test_due_scheduled_posts_count_as_published(index):
+    index.put_many([post(1, "gehen — to go", "2024-01-01T09:00:00+00:00"),
+                    post(2, "kommen — to come", "2024-01-02T09:00:00+02:00", status="future"),
+                    post(3, "sehen — to see", "2999-01-01T09:00:00+00:00", status="future")])
+    assert [verb for verb, title in index.verbs("Verbs")] == ["gehen", "kommen"]
+    assert [verb for verb, title in index.verbs("Verbs", "future")] == ["kommen", "sehen"]
+
+
+def test_put_many_replaces_a_changed_post(index):
+    index.put_many([post(1, "gehen — to go", categories=("Verbs", "Präsens"))])
+    index.put_many([post(1, "gehen — to walk", status="trash", categories=("Verbs",))])
+    assert len(index) == 1
+    assert index.find("gehen")['title'] == "gehen — to walk"
+    assert index.verbs("Verbs") == []
+    assert index.verbs("Präsens", "trash") == []
+
+
+def test_put_many_stores_a_repeated_post_once(index):
+    index.put_many([post(1, "gehen — to go", modified="2024-01-01T09:00:00+00:00"),
+                    post(1, "gehen — to walk", modified="2024-01-01T09:00:05+00:00")])
+    assert len(index) == 1
+    assert index.find("gehen")['title'] == "gehen — to walk"
+
+
+def test_incremental_put_keeps_other_posts(index):
+    index.put_many([post(1, "gehen — to go"), post(2, "kommen — to come")], full=True)
+    index.put_many([post(3, "sehen — to see")])
+    assert len(index) == 3
+
+
+def test_full_put_drops_posts_not_listed(index):
+    index.put_many([post(1, "gehen — to go"), post(2, "kommen — to come")])
+    index.put_many([post(2, "kommen — to come")], full=True)
+    assert len(index) == 1
+    assert index.find("gehen") is None
+    assert index.verbs("Verbs") == [("kommen", "kommen — to come")]
+
+
+def test_submissions(index):
+    assert index.get_submission("site:gehen") is None
+    index.set_submission("site:gehen", {"ID": 7, "title": "gehen — to go"})
+    assert index.get_submission("site:gehen") == {"ID": 7}
+    index.put_many([post(7, "gehen — to go")])
+    assert index.get_submission("site:gehen")['title'] == "gehen — to go"
+
+
+def test_meta_and_age(index):
+    assert index.age() == float("inf")
+    assert index.full_age() == float("inf")
+    index.set_meta("synced_at", str(time.time() - 10))
+    assert 10 <= index.age() < 20
+    assert index.get_meta("missing") is None
+
+
+def test_index_persists(tmp_path):
+    path = str(tmp_path / "data" / "posts.sqlite")
+    index = PostIndex(path)
+    index.put_many([post(1, "gehen — to go")])
+    index.close()
+    assert PostIndex(path).find("gehen")['ID'] == 1
+
+
+def test_get_index_is_shared(tmp_path):
+    path = str(tmp_path / "posts.sqlite")
+    assert postindex.get_index(path) is postindex.get_index(path)
+
+
+class SyncWPT:
+    """
+    SyncWPT - WPT whose posts queries are answered from a list, recording the parameters asked for
+    """
+    def __new__(cls, posts: list):
+        wpt_module = pytest.importorskip("wpt")
+
+        class Fake(wpt_module.WPT):
+            def __init__(self):
+                self.wp_site = {"url": "example.com", "template": "1"}
+                self.posts = posts
+                self.queries = []
+
+            def _get_posts(self, url: str, params: dict):
+                self.queries.append(dict(params))
+                after = params.get('modified_after')
+                return [p for p in self.posts if after is None or p['modified'] > after]
+
+        return Fake()
+
+
+def test_sync_posts_full_then_delta(index):
+    wpt = SyncWPT([post(1, "gehen — to go", modified="2024-01-01T09:00:00+00:00"),
+                   post(2, "kommen — to come", modified="2024-01-02T09:00:00+00:00")])
+    assert wpt.sync_posts(index) == 2
+    assert "modified_after" not in wpt.queries[-1]
+    assert index.full_age() < 60
+    assert index.get_meta("modified_after") == "2024-01-02T09:00:00+00:00"
+
+    wpt.posts.append(post(3, "sehen — to see", modified="2024-01-03T09:00:00+00:00"))
+    # The window starts SYNC_OVERLAP seconds early, so the newest post already stored comes again
+    assert wpt.sync_posts(index) == 2
+    assert wpt.queries[-1]['modified_after'] == "2024-01-02T08:59:55+00:00"
+    assert index.get_meta("modified_after") == "2024-01-03T09:00:00+00:00"
+    assert len(index) == 3
+
+
+def test_sync_posts_keeps_a_post_saved_in_the_same_second(index):
+    wpt = SyncWPT([post(1, "gehen — to go", modified="2024-01-02T09:00:00+00:00")])
+    wpt.sync_posts(index)
+    # Saved in the same second as the sync cursor, but not seen by the first sync
+    wpt.posts.append(post(2, "kommen — to come", modified="2024-01-02T09:00:00+00:00"))
+    wpt.sync_posts(index)
+    assert index.find("kommen")['ID'] == 2
+    assert len(index) == 2
+
+
+def test_sync_start():
+    assert postindex.sync_start("2024-01-02T09:00:00+00:00") == "2024-01-02T08:59:55+00:00"
+    assert postindex.sync_start("2024-01-02T09:00:00+02:00", 60) == "2024-01-02T08:59:00+02:00"
+    assert postindex.sync_start("yesterday") == "yesterday"
+
+
+def test_sync_posts_full_drops_deleted_posts(index):
+    wpt = SyncWPT([post(1, "gehen — to go"), post(2, "kommen — to come")])
+    wpt.sync_posts(index)
+    wpt.posts.pop(0)
+    # A delta sync cannot see the deletion
+    wpt.sync_posts(index)
+    assert index.find("gehen") is not None
+    wpt.sync_posts(index, full=True)
+    assert index.find("gehen") is None
+
+
+def test_sync_posts_goes_full_when_the_last_full_sync_is_old(index):
+    wpt = SyncWPT([post(1, "gehen — to go")])
+    wpt.sync_posts(index)
+    index.set_meta("full_synced_at", str(time.time() - postindex.FULL_SYNC_INTERVAL - 1))
+    wpt.sync_posts(index)
+    assert "modified_after" not in wpt.queries[-1]
@@ -0,0 +1,70 @@
+#
+# Tests for tracing.py - spans, wait spans and the summary
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import time
+import threading
+import pytest
+import tracing
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(tracing, "_enabled", True)
+    monkeypatch.setattr(tracing, "_events", [])
+
+
+def by_name() -> dict:
+    return {event['name']: event for event in tracing.events()}
+
+
+def test_spans_are_off_by_default(monkeypatch):
+    monkeypatch.setattr(tracing, "_enabled", False)
+    monkeypatch.setattr(tracing, "_events", [])
+    with tracing.span("leo.verb") as span:
+        span.set(cache="hit")
+    assert tracing.events() == []
+
+
+def test_span_records_args_and_errors(enabled):
+    with tracing.span("leo.verb", verb="gehen") as span:
+        span.set(cache="miss")
+    with pytest.raises(ValueError):
+        with tracing.span("leo.get_table"):
+            raise ValueError()
+    events = by_name()
+    assert events['leo.verb']['args'] == {"verb": "gehen", "cache": "miss"}
+    assert events['leo.get_table']['args']['error'] == "ValueError"
+
+
+def test_wait_is_left_out_of_the_enclosing_spans(enabled):
+    with tracing.span("votd.lookup"):
+        with tracing.span("leo.verb"):
+            with tracing.wait("translation.prompt"):
+                time.sleep(0.05)
+    with tracing.span("votd.find_post"):
+        pass
+    events = by_name()
+    assert events['translation.prompt']['cat'] == tracing.WAIT
+    assert events['votd.lookup']['args']['wait_ms'] >= 50
+    assert events['leo.verb']['args']['wait_ms'] >= 50
+    # The trace keeps wall time, the summary leaves the wait out
+    assert events['votd.lookup']['dur'] >= 50000
+    assert "wait_ms" not in events['votd.find_post']['args']
+    lines = {line.split()[0]: line.split() for line in tracing.summary().splitlines()[1:]}
+    assert float(lines['votd.lookup'][2]) < 50
+    assert float(lines['translation.prompt'][2]) >= 50
+
+
+def test_wait_on_another_thread_is_not_subtracted(enabled):
+    def prompt():
+        with tracing.wait("translation.prompt"):
+            time.sleep(0.01)
+
+    with tracing.span("votd.lookup"):
+        thread = threading.Thread(target=prompt)
+        thread.start()
+        thread.join()
+    assert "wait_ms" not in by_name()['votd.lookup']['args']
@@ -0,0 +1,78 @@
+#
+# Tests for verbcache.py - write-behind, the LRU and verbs written by other processes
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import pytest
+import verbcache
+from verbcache import VerbCache
+
+RECORD = {"english": ["to go"], "conjugations": {"Indikativ": {"Präsens": {"ich": "gehe"}}}}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "verb.sqlite")
+
+
+def test_writes_are_buffered_until_flush(path):
+    cache = VerbCache(path, batch=10)
+    cache.put("gehen", RECORD)
+    assert "gehen" in cache
+    assert cache.get("gehen")['english'] == ["to go"]
+    assert "gehen" not in cache.db
+    cache.flush()
+    assert cache.db.get("gehen")['english'] == ["to go"]
+
+
+def test_batch_flushes(path):
+    cache = VerbCache(path, batch=2)
+    cache.put_many({"gehen": RECORD, "kommen": RECORD})
+    assert not cache.pending
+    assert sorted(cache.db.keys()) == ["gehen", "kommen"]
+
+
+def test_lru_is_bounded(path):
+    cache = VerbCache(path, size=2, batch=1)
+    cache.put_many({"gehen": RECORD, "kommen": RECORD, "sehen": RECORD})
+    assert list(cache.lru) == ["kommen", "sehen"]
+    assert cache.get("gehen")['english'] == ["to go"]
+    assert list(cache.lru) == ["sehen", "gehen"]
+
+
+def test_verbs_written_by_another_process_are_found(path):
+    cache = VerbCache(path)
+    other = VerbCache(path, batch=1)
+    other.put("gehen", RECORD)
+    assert "gehen" in cache
+    assert cache.get("gehen")['english'] == ["to go"]
+    other.put("kommen", RECORD)
+    cache.put("sehen", RECORD)
+    assert len(cache) == 3
+    assert sorted(cache.keys()) == ["gehen", "kommen", "sehen"]
+    assert "laufen" not in cache
+
+
+def test_verbs_deleted_by_another_process_are_dropped(path):
+    cache = VerbCache(path, batch=1)
+    cache.put("gehen", RECORD)
+    cache.lru.clear()
+    VerbCache(path).delete("gehen")
+    assert cache.get("gehen") is None
+    assert "gehen" not in cache
+    assert len(cache) == 0
+
+
+def test_delete(path):
+    cache = VerbCache(path)
+    cache.put("gehen", RECORD)
+    cache.delete("gehen")
+    assert "gehen" not in cache
+    assert cache.get("gehen") is None
+    cache.flush()
+    assert "gehen" not in cache.db
+
+
+def test_get_cache_is_shared(path):
+    assert verbcache.get_cache(path) is verbcache.get_cache(path)
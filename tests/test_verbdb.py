@@ -0,0 +1,172 @@
+#
+# Tests for verbdb.py - record round trip, page store, indexed tense queries, validators, choices and dbm migration
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import dbm
+import json
+import pytest
+from verbdb import VerbDB
+from conjugation import Conjugation
+
+CONJUGATIONS = {
+    "Indikativ": {
+        "Präsens": {"ich": "gehe", "du": "gehst", "er/sie/es": "geht"},
+        "Präteritum": {"ich": "ging", "du": "gingst", "er/sie/es": "ging"}
+    },
+    "Konjunktiv": {
+        "Präsens": {"ich": "gehe", "du": "gehest"}
+    }
+}
+EN_CONJUGATIONS = {"Indicative": {"Simple present": {"I": "go", "he/she/it": "goes"}}}
+
+
+def record(**fields) -> dict:
+    base = {
+        "english": ["to go", "to walk"],
+        "table_link": "https://dict.leo.org/pages/flecttab/flectionTable.php?kx=k1",
+        "table_key": "k1",
+        "info_leo": "AIID1",
+        "en_table_link": "https://dict.leo.org/pages/flecttab/flectionTable.php?kx=e1",
+        "en_table_key": "e1",
+        "conjugations": CONJUGATIONS,
+        "en_conjugations": EN_CONJUGATIONS
+    }
+    base.update(fields)
+    return base
+
+
+@pytest.fixture
+def db(tmp_path):
+    return VerbDB(str(tmp_path / "verb.sqlite"))
+
+
+def test_round_trip(db):
+    db.put("gehen", record())
+    stored = db.get("gehen")
+    assert stored['english'] == ["to go", "to walk"]
+    assert stored['table_link'].endswith("kx=k1")
+    assert stored['info_leo'] == "AIID1"
+    assert stored['en_table_key'] == "e1"
+    assert stored['conjugations'] == CONJUGATIONS
+    assert stored['en_conjugations'] == EN_CONJUGATIONS
+    assert stored['conjugations'].forms("Indikativ", "Präteritum") == (
+        ("ich", "ging"), ("du", "gingst"), ("er/sie/es", "ging"))
+    assert db.get("kommen") is None
+
+
+def test_conjugation_objects_are_accepted(db):
+    db.put("gehen", record(conjugations=Conjugation.from_dict(CONJUGATIONS)))
+    assert db.get("gehen")['conjugations'] == CONJUGATIONS
+
+
+def test_table_order_is_kept(db):
+    reordered = {"Konjunktiv": CONJUGATIONS["Konjunktiv"], "Indikativ": CONJUGATIONS["Indikativ"]}
+    db.put("gehen", record(conjugations=reordered))
+    assert list(db.get("gehen")['conjugations'].to_dict().keys()) == ["Konjunktiv", "Indikativ"]
+
+
+def test_empty_tenses_survive_the_round_trip(db):
+    conjugations = {"Indikativ": {"Präsens": {"ich": "gehe"}, "Futur I": {}}, "": {"": {}}}
+    db.put("gehen", record(conjugations=conjugations, en_conjugations={}))
+    stored = db.get("gehen")
+    assert stored['conjugations'] == conjugations
+    assert stored['conjugations'].forms("Indikativ", "Futur I") == ()
+    assert ("", "") in stored['conjugations']
+    assert not stored['en_conjugations']
+
+
+def test_empty_english_is_kept(db):
+    db.put("gehen", record(english=[]))
+    assert db.get("gehen")['english'] == []
+
+
+def test_fields_never_stored_are_left_out(db):
+    db.put("gehen", record(english=None, conjugations=None, en_conjugations=None))
+    stored = db.get("gehen")
+    assert "english" not in stored
+    assert "conjugations" not in stored
+    assert "en_conjugations" not in stored
+
+
+def test_put_replaces_the_record(db):
+    db.put("gehen", record())
+    db.put("gehen", record(english=["to leave"], conjugations={"Indikativ": {"Präsens": {"ich": "gehe"}}}))
+    stored = db.get("gehen")
+    assert stored['english'] == ["to leave"]
+    assert stored['conjugations'] == {"Indikativ": {"Präsens": {"ich": "gehe"}}}
+
+
+def test_pages_go_to_the_page_store(db):
+    db.put("gehen", record(html="<html>gehen</html>"))
+    stored = db.get("gehen")
+    assert "html" not in stored
+    assert stored['html_hash'] is not None
+    assert db.get_page(stored) == "<html>gehen</html>"
+    assert db.get_page({}) is None
+
+
+def test_delete_removes_everything(db):
+    db.put("gehen", record())
+    db.delete("gehen")
+    assert "gehen" not in db
+    assert db.get("gehen") is None
+    for table in ("translations", "conjugations", "layouts"):
+        assert db.conn.execute(f"SELECT COUNT(*) FROM { table }").fetchone()[0] == 0
+
+
+def test_keys_and_membership(db):
+    db.put_many({"gehen": record(), "kommen": record(), "sehen": record()})
+    assert db.keys() == ["gehen", "kommen", "sehen"]
+    assert "kommen" in db
+    assert "laufen" not in db
+
+
+def test_forms_of_one_tense_for_many_verbs(db):
+    db.put_many({"gehen": record(), "kommen": record(conjugations={"Indikativ": {"Präsens": {"ich": "komme"}}})})
+    assert db.forms(["gehen", "kommen", "laufen"], "Indikativ", "Präsens") == {
+        "gehen": {"ich": "gehe", "du": "gehst", "er/sie/es": "geht"},
+        "kommen": {"ich": "komme"}
+    }
+    assert db.forms(["gehen"], "Simple present", "Indicative", lang="en") == {}
+    assert db.forms(["gehen"], "Indicative", "Simple present", lang="en") == {"gehen": {"I": "go", "he/she/it": "goes"}}
+
+
+def test_validators(db):
+    url = "https://dict.leo.org/german-english/gehen"
+    assert db.get_validators(url) is None
+    db.set_validators(url, '"etag"', "Mon, 01 Jan 2024 00:00:00 GMT", "abc")
+    assert db.get_validators(url) == {"etag": '"etag"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+                                      "page_hash": "abc"}
+
+
+def test_choices_outlive_the_record(db):
+    db.put("gehen", record())
+    db.set_choice("gehen", ["to go", "to walk"], ["to walk"], status="pending")
+    db.set_choice("kommen", ["to come"], ["to come"])
+    assert db.pending_choices() == {"gehen": {"candidates": ["to go", "to walk"], "english": ["to walk"],
+                                              "status": "pending"}}
+    db.delete("gehen")
+    assert db.get_choice("gehen")['english'] == ["to walk"]
+    assert db.get_choice("laufen") is None
+
+
+def test_database_persists(tmp_path):
+    path = str(tmp_path / "verb.sqlite")
+    first = VerbDB(path)
+    first.put("gehen", record(english=[], html="<html>gehen</html>"))
+    first.close()
+    stored = VerbDB(path).get("gehen")
+    assert stored['english'] == []
+    assert stored['conjugations'] == CONJUGATIONS
+
+
+def test_migrate_dbm(tmp_path):
+    old = str(tmp_path / "verb.dbm")
+    with dbm.open(old, 'c') as cache:
+        cache[b"gehen"] = json.dumps(record()).encode('UTF-8')
+        cache[b"deleted"] = b"{}"
+    db = VerbDB(str(tmp_path / "verb.sqlite"), migrate_from=old)
+    assert db.keys() == ["gehen"]
+    assert db.get("gehen")['conjugations'] == CONJUGATIONS
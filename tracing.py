@@ -0,0 +1,191 @@
+#
+# Tracing
+#   Opt-in timed spans around the stages of a run (SSM, OAuth, Leo lookups and parsing, Drive downloads, apkg import,
+#   Forvo, ...). Spans carry arguments such as host, bytes transferred and cache hit / miss. When tracing is off a
+#   span is a shared no-op object, so instrumented code pays one flag check.
+#
+#   Enable with the environment variable VOTD_TRACE=<file> or enable(file). The run is written as a Chrome trace
+#   (JSON Trace Event format, opens in chrome://tracing and ui.perfetto.dev) when the process exits, and summary()
+#   gives one line per span name.
+#
+#   Time spent waiting on the user (interactive prompts) goes in a wait() span. The trace keeps the wall time of the
+#   spans around it, but summary() leaves the wait out of their totals so think time is not counted as latency.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+
+WAIT = "wait"  # Category of spans spent waiting on the user
+
+_enabled = False
+_path = None
+_events = []
+_lock = threading.Lock()
+_local = threading.local()  # Open spans of each thread, innermost last
+_start = time.perf_counter()
+
+
+class Span:
+    """
+    Span - One timed stage. Use as a context manager; set(**args) adds arguments (host, bytes, cache, ...)
+    """
+    __slots__ = ("name", "cat", "args", "begin", "waited")
+
+    def __init__(self, name: str, cat: str, args: dict):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.begin = None
+        self.waited = 0.0
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        _open_spans().append(self)
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        stack = _open_spans()
+        if self in stack:
+            stack.remove(self)
+        if self.cat == WAIT:
+            for outer in stack:
+                outer.waited += end - self.begin
+        if self.waited:
+            self.args['wait_ms'] = round(self.waited * 1000, 1)
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        event = {
+            "name": self.name,
+            "cat": self.cat,
+            "ph": "X",
+            "ts": round((self.begin - _start) * 1e6, 1),
+            "dur": round((end - self.begin) * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": self.args
+        }
+        with _lock:
+            _events.append(event)
+        return False
+
+
+def _open_spans() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+def enable(path: str=None):
+    """
+    enable(path=None) - Starts recording spans. With a path the trace is written there when the process exits.
+    """
+    global _enabled, _path
+    if path is not None and _path is None:
+        atexit.register(_write_at_exit)
+    _enabled = True
+    _path = path or _path
+
+def enabled() -> bool:
+    return _enabled
+
+
+def span(name: str, cat: str="votd", **args):
+    """
+    span(name, cat="votd", **args) - Context manager timing one stage, or a no-op when tracing is off
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, cat, args)
+
+
+def wait(name: str, **args):
+    """
+    wait(name, **args) - span() for time spent waiting on the user, left out of the summary of the spans around it
+    """
+    return span(name, WAIT, **args)
+
+
+def traced(name: str, cat: str="votd"):
+    """
+    @traced(name, cat="votd") - Wraps every call of the decorated function in a span
+    """
+    def wrap(func):
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(name, cat, {}):
+                return func(*args, **kwargs)
+        return call
+    return wrap
+
+
+def events() -> list:
+    with _lock:
+        return list(_events)
+
+
+def write(path: str):
+    """
+    write(path) - Writes the recorded spans as a Chrome trace / Perfetto JSON file
+    """
+    with open(path, 'w') as fp:
+        json.dump({"traceEvents": events(), "displayTimeUnit": "ms"}, fp)
+
+
+def summary() -> str:
+    """
+    summary() -> str - One line per span name: calls, total and longest time (less nested wait() spans), bytes and
+                       cache hits / misses
+    """
+    rows = {}
+    for event in events():
+        row = rows.setdefault(event['name'], {"calls": 0, "total": 0.0, "max": 0.0, "bytes": 0, "hit": 0, "miss": 0})
+        duration = event['dur'] / 1000 - event['args'].get('wait_ms', 0)
+        row['calls'] += 1
+        row['total'] += duration
+        row['max'] = max(row['max'], duration)
+        row['bytes'] += event['args'].get('bytes') or 0
+        if event['args'].get('cache') in ("hit", "miss"):
+            row[event['args']['cache']] += 1
+    lines = [f"{ 'span':24s} { 'calls':>6s} { 'total ms':>10s} { 'max ms':>10s} { 'bytes':>10s} { 'hit':>5s} { 'miss':>5s}"]
+    for name, r in sorted(rows.items(), key=lambda item: -item[1]['total']):
+        lines.append(f"{ name:24s} { r['calls']:6d} { r['total']:10.1f} { r['max']:10.1f} { r['bytes']:10d}"
+                     f" { r['hit']:5d} { r['miss']:5d}")
+    return '\n'.join(lines)
+
+
+def _write_at_exit():
+    if _path is not None and _events:
+        write(_path)
+        print(summary())
+        print(f"Trace written to { _path }")
+
+
+if os.environ.get("VOTD_TRACE"):
+    enable(os.environ["VOTD_TRACE"])
@@ -0,0 +1,126 @@
+#
+# Translation selection policies
+#   A dict.leo.org search lists several English translations for most verbs. LeoVerb.get_english_trans() hands the
+#   candidates (in page order) to a policy, which returns the translations to keep:
+#       Interactive()               - asks on stdin, one candidate at a time (the original behaviour)
+#       FirstN(n)                   - the first n candidates
+#       Preferred(words, fallback)  - the candidates found in a preferred list (or {verb: list}), else the fallback.
+#                                     Without words the list is read from PREFERRED_FILE (JSON).
+#       Reuse(fallback)             - the choice made for this verb before (kept in the verb cache), else the fallback
+#       Review(fallback)            - takes the fallback's choice, but queues verbs with more than one candidate for
+#                                     a human to confirm later (python leoverb.py review)
+#   Only Interactive reads stdin, so every other policy can run unattended and off the main thread.
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import sys
+import json
+import tracing
+from abc import ABC, abstractmethod
+
+PREFERRED_FILE = "data/preferred.json"  # Preferred translations used by Preferred() when no words are given
+
+
+class Policy(ABC):
+    """
+    Policy - Base class. choose(leo, candidates) -> list of the candidates to keep
+    """
+    interactive = False
+
+    @abstractmethod
+    def choose(self, leo, candidates: list) -> list:
+        pass
+
+
+class Interactive(Policy):
+    interactive = True
+
+    def choose(self, leo, candidates: list) -> list:
+        english = []
+        for trans in candidates:
+            print(f"English translation found: { trans }")
+            answer = ""
+            # Think time is not lookup latency: the wait is left out of the spans around it (votd.lookup, leo.verb)
+            with tracing.wait("translation.prompt", verb=leo.verb):
+                while answer.upper() not in ["Y", "N", "Q"]:
+                    print("Add / Quit (Y/n/Q)?")
+                    answer = sys.stdin.read(1)
+                    sys.stdin.readline()
+            if answer.upper() == "Y":
+                english.append(trans)
+                print(f"English translation now: { english }")
+            if answer.upper() == "Q":
+                break
+        if english:
+            leo.db.set_choice(leo.verb, candidates, english)
+        return english
+
+
+class FirstN(Policy):
+    def __init__(self, n: int=1):
+        self.n = n
+
+    def choose(self, leo, candidates: list) -> list:
+        return candidates[:self.n]
+
+
+class Preferred(Policy):
+    def __init__(self, words=None, fallback: Policy=None):
+        """
+        Preferred(words=None, fallback=FirstN(1)) - words is a list of preferred translations, or {verb: list}. The
+                                                   default reads them from PREFERRED_FILE.
+        """
+        if words is None:
+            try:
+                with open(PREFERRED_FILE) as fp:
+                    words = json.load(fp)
+            except OSError:
+                raise Exception(f"The preferred policy needs a list of translations in { PREFERRED_FILE }")
+        self.words = words
+        self.fallback = fallback or FirstN(1)
+
+    def choose(self, leo, candidates: list) -> list:
+        words = self.words.get(leo.verb, []) if isinstance(self.words, dict) else self.words
+        english = [trans for trans in candidates if trans in words]
+        return english or self.fallback.choose(leo, candidates)
+
+
+class Reuse(Policy):
+    def __init__(self, fallback: Policy=None):
+        self.fallback = fallback or Review()
+        self.interactive = self.fallback.interactive
+
+    def choose(self, leo, candidates: list) -> list:
+        choice = leo.db.get_choice(leo.verb)
+        if choice is not None:
+            english = [trans for trans in choice['english'] if trans in candidates]
+            if english:
+                return english
+        return self.fallback.choose(leo, candidates)
+
+
+class Review(Policy):
+    def __init__(self, fallback: Policy=None):
+        self.fallback = fallback or FirstN(1)
+
+    def choose(self, leo, candidates: list) -> list:
+        english = self.fallback.choose(leo, candidates)
+        if len(candidates) > 1:
+            leo.db.set_choice(leo.verb, candidates, english, status="pending")
+        return english
+
+
+# Policies selectable by name (CLI --policy)
+POLICIES = {
+    "interactive": Interactive,
+    "first": FirstN,
+    "preferred": Preferred,
+    "reuse": Reuse,
+    "review": Review
+}
+
+def get_policy(name: str) -> Policy:
+    if name not in POLICIES:
+        raise Exception(f"Translation policy must be one of { list(POLICIES.keys()) }")
+    return POLICIES[name]()
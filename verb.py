@@ -14,43 +14,63 @@
 #                         - Yearly packages should all have the same main folder (German VotD)
 #    - Anki decks uploaded to Google Drive for distribution 
 #
+# Start up is kept short: the CLI arguments are checked before anything is built, and the WordPress, Anki, Google
+# Drive and Forvo clients (and the libraries behind them) are only imported and constructed when a command first
+# needs them. bench_cli.py measures import time and cold start for each command.
+#
 # Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
 #
 
 import sys
-from leoverb import LeoVerb
-from wpt import WPT
-from ankidevotd import AnkiDeVotD
+import datetime
+import fixtures
+import tracing
+
+POST_HOUR = 6   # Local hour at which scheduled verbs of the day are published
 
 class VerbRunner:
     """
     VerbRunner(?, ?)
         Orchestrator for other moving parts. Can take in a single verb or operate against multiple gleaned verbs
     """
-    # Wordpress object
-    wpt = None
+    # Wordpress object (created on first use)
+    _wpt = None
     # LeoVerb object
     current_verb = None
     # Dictionary cache of LeoVerb objects keyed on German verb
     leo_verbs = None
-    # Anki object
-    anki = None
+    # Anki object (created on first use)
+    _anki = None
     
     def __init__(self):
         """
-        VerbRunner() - Constructor. Empty for now.
+        VerbRunner() - Constructor. The WordPress and Anki objects are built when first used.
         """
         self.leo_verbs = {}
-        self._set_wpt()
-        self.anki = AnkiDeVotD(self.wpt)
+
+    @property
+    def wpt(self):
+        if self._wpt is None:
+            self._set_wpt()
+        return self._wpt
+
+    @property
+    def anki(self):
+        if self._anki is None:
+            from ankidevotd import AnkiDeVotD
+            with tracing.span("votd.anki_init"):
+                self._anki = AnkiDeVotD(self.wpt)
+        return self._anki
     
     def _set_wpt(self):
-        self.wpt = WPT(secret_store="ssm", region="us-east-2")
+        from wpt import WPT
+        self._wpt = WPT(secret_store="ssm", region="us-east-2")
     
     def _save_current(self, leo_verb):
         """
         self._save_current(leo_verb) - Private method to update current leo_verb and update cache
         """
+        leo_verb.release_pages()
         self.current_verb = leo_verb
         self.leo_verbs[leo_verb.verb] = leo_verb
     
@@ -67,16 +87,22 @@ class VerbRunner:
           - Runs an interactive session to generate and post the verb of the day. Saves a LeoVerb object into
             current_verb
         """
-        leo_verb = LeoVerb(verb)
+        from leoverb import LeoVerb
+        from httpclient import get_client
+        from forvo import LookupDeferred
+        with tracing.span("votd.lookup", verb=verb):
+            leo_verb = LeoVerb(verb)
         self._save_current(leo_verb)
-        found_post = self.wpt.find_title_keyword(verb)
+        with tracing.span("votd.find_post", verb=verb):
+            found_post = self.wpt.find_title_keyword(verb)
         if found_post is not None:
             print(f"Verb { verb } already used in post { found_post['title'] }")
             print(f"   Traceback URL: { found_post['URL'] }")
             exit(1)
-        template_vars = leo_verb.template_vars("Indikativ", "Präsens")
-        self.wpt.set_template_vars(template_vars)
-        title = self.wpt.get_title()
+        with tracing.span("votd.template"):
+            template_vars = leo_verb.template_vars("Indikativ", "Präsens")
+            self.wpt.set_template_vars(template_vars)
+            title = self.wpt.get_title()
         print(f"Title: { title }")
         print()
         for key in template_vars.keys():
@@ -92,22 +118,96 @@ class VerbRunner:
             exit()
         
         # Post to Wordpress
-        self.wpt.post(["Verbs"], ["Indikativ", "Präsens"])
+        with tracing.span("votd.post"):
+            self.wpt.post(["Verbs"], ["Indikativ", "Präsens"])
         
         # Update Anki
-        if not self.anki.is_up_to_date():
-            self.anki.run()
-        self.anki.add_verb(verb)
-        self.anki.package_full()
+        with tracing.span("votd.anki"):
+            if not self.anki.is_up_to_date():
+                self.anki.run()
+            try:
+                # The verb of the day may use the Forvo requests batch lookups leave in reserve
+                self.anki.add_verb(verb, reserve=0)
+            except LookupDeferred as e:
+                print(f"{ verb } not added to Anki yet ({ e }); the next anki run adds it")
+            self.anki.package_full()
+        
+        # Connection reuse and Forvo lookups for this run
+        print(get_client().report())
+        print(self.anki.forvo.report())
+
+    def votd_week(self, start: str, verbs: list):
+        """
+        VerbRunner.votd_week(start, verbs)
+          - Looks up a week of verbs and schedules them in one session: one post per day from the start date
+            (YYYY-MM-DD) on, published at POST_HOUR local time. The Anki decks pick the verbs up once they are
+            published (anki run).
+        """
+        from leoverb import LeoVerb
+        from httpclient import get_client
+        LeoVerb.prefetch(verbs)
+        found_posts = self.wpt.find_titles(verbs)
+        for verb, found_post in found_posts.items():
+            if found_post is not None:
+                print(f"Verb { verb } already used in post { found_post['title'] }")
+                print(f"   Traceback URL: { found_post['URL'] }")
+        if any(found_posts.values()):
+            exit(1)
+
+        day = datetime.date.fromisoformat(start)
+        posts = []
+        for i, verb in enumerate(verbs):
+            leo_verb = LeoVerb(verb)
+            self._save_current(leo_verb)
+            when = datetime.datetime.combine(day + datetime.timedelta(days=i), datetime.time(POST_HOUR))
+            posts.append({"template_vars": leo_verb.template_vars("Indikativ", "Präsens"),
+                          "date": when.astimezone().isoformat()})
+            print(f"{ posts[-1]['date'] }: { self.wpt.render(posts[-1]['template_vars'])[0] }")
+        print()
+        answer = ""
+        while answer.upper() not in ["Y", "N"]:
+            print("Schedule these posts? (Y/n)")
+            answer = sys.stdin.read(1)
+        if answer.upper() == "N":
+            print("Ok, exiting.")
+            exit()
+
+        results = self.wpt.post_many(posts, ["Verbs"], ["Indikativ", "Präsens"])
+        for verb, result in zip(verbs, results):
+            if isinstance(result, Exception):
+                print(f"{ verb }: FAILED - { result }")
+            else:
+                print(f"{ verb }: { result.get('URL') } ({ result.get('date') })")
+        print(get_client().report())
+        if any(isinstance(result, Exception) for result in results):
+            exit(1)
 
 # CLI arguments and number of total arguments required (must be at least 1)
 CLI = {
     "votd": 2,
+    "week": 9,
     "anki": 1
 }
+# Optional flags selecting the fixture mode (see fixtures.py). They may appear anywhere on the command line.
+FIXTURE_FLAGS = {
+    "--record": "record",
+    "--replay": "replay"
+}
+# Optional flag writing a Chrome trace of the run to the file that follows it (see tracing.py)
+TRACE_FLAG = "--trace"
      
 if __name__ == "__main__":
-    vr = VerbRunner()
+    for flag, mode in FIXTURE_FLAGS.items():
+        if flag in sys.argv:
+            sys.argv.remove(flag)
+            fixtures.configure(mode=mode)
+    if TRACE_FLAG in sys.argv:
+        i = sys.argv.index(TRACE_FLAG)
+        if i + 1 >= len(sys.argv):
+            print(f"{ TRACE_FLAG } requires an output file")
+            exit(1)
+        tracing.enable(sys.argv[i + 1])
+        del sys.argv[i:i + 2]
     if len(sys.argv) < 2:
         print(f"At least one keyword argument is required from:")
         for arg in CLI.keys():
@@ -121,8 +221,17 @@ if __name__ == "__main__":
     if len(sys.argv) != CLI[sys.argv[1]] + 1:
         print(f"Argument { sys.argv[1] } requires { CLI[sys.argv[1]] - 1 } additional arguments.")
         exit(1)
+    if sys.argv[1] == "week":
+        try:
+            datetime.date.fromisoformat(sys.argv[2])
+        except ValueError:
+            print(f"Argument week requires a start date (YYYY-MM-DD), not { sys.argv[2] }")
+            exit(1)
+    vr = VerbRunner()
     if sys.argv[1] == "votd":
         verb = sys.argv[2]
         vr.votd(verb)
+    if sys.argv[1] == "week":
+        vr.votd_week(sys.argv[2], sys.argv[3:])
     if sys.argv[1] == "anki":
         vr.anki_run()
\ No newline at end of file
@@ -0,0 +1,161 @@
+#
+# Verb cache
+#   Process wide manager in front of the verb database (verbdb.py). One database handle is opened per process and
+#   shared by every LeoVerb, AnkiDeVotD and VerbRunner in it. On top of the database it keeps:
+#       * the set of cached verbs, so membership checks are a set lookup. The set is only what this process has
+#         seen: a verb missing from it is looked up in the database, which other processes may have written to
+#       * an in-memory LRU of parsed verb records
+#       * write-behind: new records are buffered and written to the database in batches (and at exit)
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import atexit
+import threading
+from collections import OrderedDict
+from verbdb import VerbDB
+
+CACHE_SIZE = 256    # Parsed verb records kept in memory
+FLUSH_BATCH = 32    # Buffered writes that trigger a flush to the database
+
+
+class VerbCache:
+    """
+    VerbCache - LRU and write-behind cache over a VerbDB
+
+    Methods:
+        VerbCache(path, migrate_from=None, size=CACHE_SIZE, batch=FLUSH_BATCH) - Constructor. batch=1 writes through.
+        verb in cache - membership check (set lookup, the database on a miss)
+        len(cache) / keys() - verbs in the database and buffered writes
+        get(verb) / put(verb, record) / put_many(records) / delete(verb) - record access (see verbdb.py)
+        get_page(record) - raw page of a record
+        get_validators(url) / set_validators(url, ...) - HTTP validators of Leo pages (written through)
+        get_choice(verb) / set_choice(verb, ...) / pending_choices() - translation choices (written through)
+        flush() - writes buffered records to the database
+    """
+    db = None
+    size = None
+    batch = None
+    verbs = None
+    lru = None
+    pending = None
+    lock = None
+
+    def __init__(self, path: str, migrate_from: str=None, size: int=CACHE_SIZE, batch: int=FLUSH_BATCH):
+        self.db = VerbDB(path, migrate_from=migrate_from)
+        self.size = size
+        self.batch = batch
+        self.verbs = set(self.db.keys())
+        self.lru = OrderedDict()
+        self.pending = {}
+        self.lock = threading.RLock()
+
+    def __contains__(self, verb: str) -> bool:
+        with self.lock:
+            if verb in self.verbs:
+                return True
+            # Another process may have cached it since this one started
+            if verb in self.db:
+                self.verbs.add(verb)
+                return True
+            return False
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def keys(self) -> list:
+        with self.lock:
+            self.verbs = set(self.db.keys()) | set(self.pending)
+            return list(self.verbs)
+
+    def _remember(self, verb: str, record: dict):
+        self.lru[verb] = record
+        self.lru.move_to_end(verb)
+        while len(self.lru) > self.size:
+            self.lru.popitem(last=False)
+
+    def get(self, verb: str) -> dict:
+        with self.lock:
+            if verb not in self:
+                return None
+            record = self.lru.get(verb) or self.pending.get(verb)
+            if record is None:
+                record = self.db.get(verb)
+            if record is not None:
+                self._remember(verb, record)
+            else:
+                # Deleted by another process
+                self.verbs.discard(verb)
+            return record
+
+    def get_page(self, record: dict) -> str:
+        return self.db.get_page(record)
+
+    def get_validators(self, url: str) -> dict:
+        return self.db.get_validators(url)
+
+    def set_validators(self, url: str, etag: str, last_modified: str, page_hash: str):
+        self.db.set_validators(url, etag, last_modified, page_hash)
+
+    def get_choice(self, verb: str) -> dict:
+        return self.db.get_choice(verb)
+
+    def set_choice(self, verb: str, candidates: list, english: list, status: str="confirmed"):
+        self.db.set_choice(verb, candidates, english, status)
+
+    def pending_choices(self) -> dict:
+        return self.db.pending_choices()
+
+    def put_many(self, records: dict):
+        """
+        put_many(records) - Caches a dictionary of records keyed by verb. Raw pages go straight to the page store so
+                            only the parsed fields are held in memory until the next flush.
+        """
+        with self.lock:
+            for verb, record in records.items():
+                record = dict(record)
+                html = record.pop('html', None)
+                if html is not None:
+                    record['html_hash'] = self.db.pages.put(html)
+                self.verbs.add(verb)
+                self.pending[verb] = record
+                self._remember(verb, record)
+            if len(self.pending) >= self.batch:
+                self.flush()
+
+    def put(self, verb: str, record: dict):
+        self.put_many({verb: record})
+
+    def delete(self, verb: str):
+        with self.lock:
+            self.verbs.discard(verb)
+            self.lru.pop(verb, None)
+            self.pending.pop(verb, None)
+            self.db.delete(verb)
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                self.db.put_many(self.pending)
+                self.pending = {}
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.db.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(path: str, migrate_from: str=None) -> VerbCache:
+    """
+    get_cache(path, migrate_from=None) -> VerbCache
+        Returns the process wide cache for the database at path, opening it on first use. Buffered writes are
+        flushed when the process exits.
+    """
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = VerbCache(path, migrate_from=migrate_from)
+            atexit.register(_caches[path].flush)
+        return _caches[path]
@@ -0,0 +1,282 @@
+#
+# Verb database
+#   SQLite (WAL) store for LeoVerb lookups. Translations and conjugations are kept in their own indexed tables so a
+#   single query can answer e.g. "all Präsens forms for these 200 verbs", and WAL mode lets several processes read
+#   and write the cache at the same time.
+#
+#   Records passed in and out of VerbDB have the same fields as the JSON blobs the old dbm cache held:
+#       english, table_link, table_key, info_leo, en_table_link, en_table_key,
+#       conjugations / en_conjugations - Conjugation tables (conjugation.py). Nested dictionaries
+#                                        ({mood: {tense: {pronoun: form}}}) are accepted when writing.
+#   except for the raw page. Records read back only hold html_hash, the key of the page in the PageStore kept next
+#   to the database. A record written with an html field has that page moved into the PageStore.
+#
+#   The layouts table records the shape of each stored field, so a record reads back exactly as it was written:
+#   english --> the number of translations (an empty list stays an empty list), conjugations / en_conjugations -->
+#   [[mood, [tense, ...]], ...] (moods and tenses without forms are kept; the conjugations table only has forms).
+#
+# Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
+#
+
+import os
+import dbm
+import json
+import sqlite3
+import threading
+from pagestore import PageStore
+from conjugation import Conjugation
+
+VERBS_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    verb            TEXT PRIMARY KEY,
+    table_link      TEXT,
+    table_key       TEXT,
+    info_leo        TEXT,
+    en_table_link   TEXT,
+    en_table_key    TEXT,
+    html_hash       TEXT
+)"""
+SCHEMA = VERBS_TABLE.format(name="verbs") + """;
+CREATE TABLE IF NOT EXISTS translations (
+    verb        TEXT NOT NULL REFERENCES verbs(verb) ON DELETE CASCADE,
+    position    INTEGER NOT NULL,
+    english     TEXT NOT NULL,
+    PRIMARY KEY (verb, position)
+);
+CREATE TABLE IF NOT EXISTS conjugations (
+    verb        TEXT NOT NULL REFERENCES verbs(verb) ON DELETE CASCADE,
+    lang        TEXT NOT NULL,
+    mood        TEXT NOT NULL,
+    tense       TEXT NOT NULL,
+    pronoun     TEXT NOT NULL,
+    form        TEXT NOT NULL,
+    PRIMARY KEY (verb, lang, mood, tense, pronoun)
+);
+CREATE TABLE IF NOT EXISTS layouts (
+    verb        TEXT NOT NULL REFERENCES verbs(verb) ON DELETE CASCADE,
+    field       TEXT NOT NULL,
+    layout      TEXT NOT NULL,
+    PRIMARY KEY (verb, field)
+);
+CREATE TABLE IF NOT EXISTS validators (
+    url             TEXT PRIMARY KEY,
+    etag            TEXT,
+    last_modified   TEXT,
+    page_hash       TEXT
+);
+CREATE TABLE IF NOT EXISTS choices (
+    verb        TEXT PRIMARY KEY,
+    candidates  TEXT NOT NULL,
+    english     TEXT NOT NULL,
+    status      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conjugations_by_tense ON conjugations (lang, mood, tense, verb);
+CREATE INDEX IF NOT EXISTS translations_by_english ON translations (english);
+"""
+
+VERB_COLUMNS = ["table_link", "table_key", "info_leo", "en_table_link", "en_table_key", "html_hash"]
+LANGS = {"de": "conjugations", "en": "en_conjugations"}
+
+# SQLite limits the number of bound parameters per statement
+QUERY_CHUNK = 500
+
+
+class VerbDB:
+    """
+    VerbDB - SQLite verb cache
+
+    Methods:
+        VerbDB(path, migrate_from=None, pages_dir=None) - Opens (creating if needed) the database. A new database is
+                                          filled from the dbm cache at migrate_from when one exists. Pages are kept
+                                          in pages_dir (default: "<path without extension>_pages").
+        verb in db / keys() - membership and all cached verbs
+        get(verb) / put(verb, record) / put_many(records) / delete(verb) - record access
+        get_page(record) - loads the raw page of a record from the PageStore
+        forms(verbs, mood, tense, lang) - one indexed query for one tense of many verbs
+        get_validators(url) / set_validators(url, ...) - HTTP validators of the last download of a page
+        get_choice(verb) / set_choice(verb, ...) / pending_choices() - English translation choices and the review
+                                          queue (kept when a verb is deleted, so a new lookup can reuse them)
+        migrate_dbm(path) - copies every record of an old dbm cache into this database
+    """
+    path = None
+    conn = None
+    lock = None
+    pages = None
+
+    def __init__(self, path: str, migrate_from: str=None, pages_dir: str=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.pages = PageStore(pages_dir or os.path.splitext(path)[0] + "_pages")
+        new = not os.path.exists(path)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        if new and migrate_from is not None and dbm.whichdb(migrate_from):
+            count = self.migrate_dbm(migrate_from)
+            print(f"Migrated { count } verbs from { migrate_from } to { path }")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __contains__(self, verb: str) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM verbs WHERE verb = ?", (verb,)).fetchone() is not None
+
+    def keys(self) -> list:
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT verb FROM verbs ORDER BY rowid")]
+
+    def get(self, verb: str) -> dict:
+        """
+        get(verb) -> dict - Returns the cached record for the verb, or None. english and conjugations are left out
+                            when they were never stored, so callers know to look them up again. Fields stored empty
+                            come back empty.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT { ', '.join(VERB_COLUMNS) } FROM verbs WHERE verb = ?", (verb,)).fetchone()
+            if row is None:
+                return None
+            record = dict(zip(VERB_COLUMNS, row))
+            layouts = {field: json.loads(layout) for field, layout in self.conn.execute(
+                "SELECT field, layout FROM layouts WHERE verb = ?", (verb,))}
+            english = [r[0] for r in self.conn.execute(
+                "SELECT english FROM translations WHERE verb = ? ORDER BY position", (verb,))]
+            if english or "english" in layouts:
+                record['english'] = english
+            # Empty moods and tenses come from the layout; rowid order is the order the forms were inserted in, i.e.
+            # the order of the Leo table
+            tables = {key: {mood: {tense: {} for tense in tenses} for mood, tenses in layouts[key]}
+                      for key in LANGS.values() if key in layouts}
+            for lang, mood, tense, pronoun, form in self.conn.execute(
+                    "SELECT lang, mood, tense, pronoun, form FROM conjugations WHERE verb = ? ORDER BY rowid", (verb,)):
+                tables.setdefault(LANGS[lang], {}).setdefault(mood, {}).setdefault(tense, {})[pronoun] = form
+            for key, table in tables.items():
+                record[key] = Conjugation.from_dict(table)
+            return record
+
+    def get_page(self, record: dict) -> str:
+        """
+        get_page(record) -> str - Returns the raw page referenced by the record's html_hash, or None
+        """
+        return self.pages.get(record.get('html_hash'))
+
+    def _put(self, verb: str, record: dict):
+        self.conn.execute("DELETE FROM verbs WHERE verb = ?", (verb,))
+        record = dict(record)
+        if record.get('html') is not None:
+            record['html_hash'] = self.pages.put(record['html'])
+        self.conn.execute(
+            f"INSERT INTO verbs (verb, { ', '.join(VERB_COLUMNS) }) "
+            f"VALUES ({ ', '.join(['?'] * (len(VERB_COLUMNS) + 1)) })",
+            [verb] + [record.get(col) for col in VERB_COLUMNS])
+        self.conn.executemany(
+            "INSERT INTO translations (verb, position, english) VALUES (?, ?, ?)",
+            [(verb, i, english) for i, english in enumerate(record.get('english') or [])])
+        layouts = {}
+        if record.get('english') is not None:
+            layouts['english'] = len(record['english'])
+        for lang, key in LANGS.items():
+            if record.get(key) is None:
+                continue
+            conjugation = Conjugation.from_dict(record[key])
+            layouts[key] = [[mood, list(tenses)] for mood, tenses in conjugation.to_dict().items()]
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO conjugations (verb, lang, mood, tense, pronoun, form) VALUES (?, ?, ?, ?, ?, ?)",
+                [(verb, lang) + row for row in conjugation.rows()])
+        self.conn.executemany(
+            "INSERT INTO layouts (verb, field, layout) VALUES (?, ?, ?)",
+            [(verb, field, json.dumps(layout)) for field, layout in layouts.items()])
+
+    def put(self, verb: str, record: dict):
+        """
+        put(verb, record) - Stores (replaces) the record for the verb
+        """
+        self.put_many({verb: record})
+
+    def put_many(self, records: dict):
+        """
+        put_many(records) - Stores a dictionary of records keyed by verb in one transaction
+        """
+        with self.lock, self.conn:
+            for verb, record in records.items():
+                self._put(verb, record)
+
+    def delete(self, verb: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM verbs WHERE verb = ?", (verb,))
+
+    def get_validators(self, url: str) -> dict:
+        """
+        get_validators(url) -> dict - Returns etag, last_modified and page_hash of the last download of url, or None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, page_hash FROM validators WHERE url = ?", (url,)).fetchone()
+        return dict(zip(["etag", "last_modified", "page_hash"], row)) if row else None
+
+    def set_validators(self, url: str, etag: str, last_modified: str, page_hash: str):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO validators (url, etag, last_modified, page_hash) VALUES (?, ?, ?, ?)",
+                              (url, etag, last_modified, page_hash))
+
+    def get_choice(self, verb: str) -> dict:
+        """
+        get_choice(verb) -> dict - Returns candidates, english and status ("confirmed" or "pending" review) of the
+                                   translation choice made for verb, or None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT candidates, english, status FROM choices WHERE verb = ?", (verb,)).fetchone()
+        if row is None:
+            return None
+        return {"candidates": json.loads(row[0]), "english": json.loads(row[1]), "status": row[2]}
+
+    def set_choice(self, verb: str, candidates: list, english: list, status: str="confirmed"):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO choices (verb, candidates, english, status) VALUES (?, ?, ?, ?)",
+                              (verb, json.dumps(candidates), json.dumps(english), status))
+
+    def pending_choices(self) -> dict:
+        """
+        pending_choices() -> dict - The review queue: {verb: choice} for every choice still waiting for review
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT verb, candidates, english FROM choices WHERE status = 'pending' ORDER BY rowid").fetchall()
+        return {verb: {"candidates": json.loads(candidates), "english": json.loads(english), "status": "pending"}
+                for verb, candidates, english in rows}
+
+    def forms(self, verbs: list, mood: str, tense: str, lang: str="de") -> dict:
+        """
+        forms(verbs, mood, tense, lang="de") -> dict
+            Returns {verb: {pronoun: form}} for one tense of every given verb that is cached, e.g.
+            db.forms(verbs, "Indikativ", "Präsens")
+        """
+        verbs = list(verbs)
+        result = {}
+        with self.lock:
+            for i in range(0, len(verbs), QUERY_CHUNK):
+                chunk = verbs[i:i + QUERY_CHUNK]
+                query = ("SELECT verb, pronoun, form FROM conjugations WHERE lang = ? AND mood = ? AND tense = ? "
+                         f"AND verb IN ({ ', '.join(['?'] * len(chunk)) }) ORDER BY rowid")
+                for verb, pronoun, form in self.conn.execute(query, [lang, mood, tense] + chunk):
+                    result.setdefault(verb, {})[pronoun] = form
+        return result
+
+    def migrate_dbm(self, path: str) -> int:
+        """
+        migrate_dbm(path) -> int - Copies every record of the old dbm/JSON verb cache into this database. Verbs that
+                                   were deleted in the old cache (stored as "{}") are skipped. Returns the count.
+        """
+        records = {}
+        with dbm.open(path, 'r') as old:
+            for key in old.keys():
+                record = json.loads(old[key].decode('UTF-8'))
+                if record:
+                    records[key.decode('UTF-8')] = record
+        self.put_many(records)
+        return len(records)
@@ -3,16 +3,119 @@
 #   A class to automate the retrieval, fill-in, and post/publish of a private wordpress.com Jinja2
 #   template (stored as unpublished blog post)
 #
-# Secrets are retrieved from AWS SSM Parameter Store abstracted in secrets.py
+# Secrets are retrieved from AWS SSM Parameter Store (or a file / the environment) abstracted in secrets.py
+# The OAuth bearer token is kept in a locked token file (TOKEN_FILE) with its expiry and reused across runs. It is
+# only requested again once it expires or the API rejects it (401), in which case the request is retried. In fixture
+# record / replay mode (fixtures.py) the token file is kept in the fixture directory instead, so a replayed token
+# never replaces the real one.
+# Templates are compiled once in a shared Jinja environment with an on-disk bytecode cache. The template post is kept
+# in TEMPLATE_CACHE and only downloaded again when its modified timestamp changes.
 # 
 # Distributed under MIT license (see license.txt), Copyright Tarah Z. Tamayo
 # 
 
+import os
+import time
+import fcntl
+import hashlib
+import tempfile
+import threading
+import contextlib
+import fixtures
 from secrets import Secrets
+from httpclient import get_client
+from postindex import PostIndex, POST_FIELDS, FULL_SYNC_INTERVAL, get_index, normalize_title, sync_start
+import tracing
 import json
-import requests
 import jinja2
 import re
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+TITLES_PAGE_SIZE = 100  # Posts per page requested by get_titles (the API maximum)
+TITLES_WORKERS = 4      # Pages of titles requested at the same time
+POST_WORKERS = 3        # Posts submitted at the same time by post_many
+POST_RATE = 2.0         # Requests per second to the WordPress API while post_many runs
+POST_RETRIES = 2        # Retries of a failed submission, once it is clear it did not create the post
+TOKEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "auth", "wp_token.json")
+TOKEN_LIFETIME = 14 * 24 * 3600  # Assumed token lifetime (seconds) when the token response has no expires_in
+TOKEN_MARGIN = 300               # Tokens this close to expiry (seconds) are treated as expired
+TITLE_INDEX_MAX_AGE = 300        # Seconds the local post index is trusted before find_title_keyword syncs it
+TEMPLATE_CACHE = "data/templates"  # Downloaded template posts, and compiled templates under bytecode/
+
+# Template sources by name ("<key>/title", "<key>/body"), served to the shared environment
+_sources = {}
+_environment = None
+_environment_lock = threading.Lock()
+
+
+def get_environment() -> jinja2.Environment:
+    """
+    get_environment() -> jinja2.Environment
+        The process wide template environment. Templates are compiled once per name and their bytecode is cached on
+        disk, so a template that did not change is not compiled again in the next run either.
+    """
+    global _environment
+    with _environment_lock:
+        if _environment is None:
+            bytecode = os.path.join(TEMPLATE_CACHE, "bytecode")
+            os.makedirs(bytecode, exist_ok=True)
+            _environment = jinja2.Environment(loader=jinja2.FunctionLoader(_sources.get),
+                                              bytecode_cache=jinja2.FileSystemBytecodeCache(bytecode))
+        return _environment
+
+
+def compile_template(key: str, title_template: str, body_template: str) -> tuple:
+    """
+    compile_template(key, title_template, body_template) -> (title, body) compiled templates
+        key names this revision of the templates (e.g. "<post ID>@<modified>"); a key seen before is not compiled
+        again.
+    """
+    _sources[f"{ key }/title"] = title_template
+    _sources[f"{ key }/body"] = body_template
+    environment = get_environment()
+    return environment.get_template(f"{ key }/title"), environment.get_template(f"{ key }/body")
+
+
+@contextlib.contextmanager
+def _locked(path: str, exclusive: bool):
+    """
+    _locked(path, exclusive) - Holds a shared or exclusive lock on the token file (through a .lock file next to it)
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _read_token(path: str) -> dict:
+    """
+    _read_token(path) -> dict - The saved token if it is not (nearly) expired, else None. Call with the lock held.
+    """
+    try:
+        with open(path) as fp:
+            token = json.load(fp)
+    except (OSError, ValueError):
+        return None
+    if token.get('expires_at', 0) - TOKEN_MARGIN < time.time():
+        return None
+    return token
+
+def _write_token(path: str, token: dict):
+    """
+    _write_token(path, token) - Atomically replaces the token file, readable by the owner only. Call with the lock held.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+    with os.fdopen(fd, 'w') as fp:
+        json.dump(token, fp)
+    os.chmod(tmp, 0o600)
+    os.replace(tmp, path)
+
+class PostRefused(Exception):
+    pass
+
 
 class WPT:
     secrets = None
@@ -23,32 +126,81 @@ class WPT:
     wp_template_body = None
     template_vars = None
     post_response = None
+    http = None
+    token_file = None   # Default: TOKEN_FILE, or a file in the fixture directory when recording / replaying
     
     oauth_url = "https://public-api.wordpress.com/oauth2/token"
     api_url = "https://public-api.wordpress.com/rest/v1.1"
     
     def __init__(self, secret_store: str="ssm", **kwargs):
         self.secrets = Secrets(type=secret_store, **kwargs)
+        self.http = get_client()
     
     def _get_secrets(self):
         self.wp_key = self.secrets.get_wp_key()
     def _get_site(self):
         self.wp_site = self.secrets.get_wp_site()
-    def _wp_authorize(self):
+    def _wp_authorize(self, rejected: str=None):
+        """
+        _wp_authorize(rejected=None) - Sets the bearer header from the token file, or from a new password grant when
+                                       the saved token is missing, expired or is the rejected token. The grant (and
+                                       the credentials fetch before it) happens under an exclusive lock, so
+                                       concurrent runs wait for one another's token instead of each requesting one.
+        """
+        path = self._token_path()
+        with _locked(path, exclusive=False):
+            token = _read_token(path)
+        if token is None or token['access_token'] == rejected:
+            with _locked(path, exclusive=True):
+                token = _read_token(path)
+                if token is None or token['access_token'] == rejected:
+                    token = self._password_grant()
+                    _write_token(path, token)
+        self.wp_oauth_header = {"Authorization": "Bearer " + token['access_token']}
+
+    def _token_path(self) -> str:
+        if self.token_file is not None:
+            return self.token_file
+        if fixtures.mode() != "live":
+            return fixtures.path("wp", "token_file")
+        return TOKEN_FILE
+
+    @tracing.traced("wpt.oauth", "network")
+    def _password_grant(self) -> dict:
         if self.wp_key is None:
             self._get_secrets()
         self.wp_key['grant_type'] = "password"
-        oauth_req = requests.post(self.oauth_url, data=self.wp_key)
+        oauth_req = self.http.post(self.oauth_url, data=self.wp_key)
         oauth_resp = json.loads(oauth_req.text)
-        self.wp_oauth_header = {"Authorization": "Bearer " + oauth_resp["access_token"]}
+        if "access_token" not in oauth_resp:
+            raise Exception(f"WordPress authorization failed: { oauth_resp.get('error_description', oauth_resp) }")
+        lifetime = int(oauth_resp.get('expires_in') or TOKEN_LIFETIME)
+        return {"access_token": oauth_resp['access_token'], "expires_at": time.time() + lifetime}
+
+    def _request(self, method: str, url: str, **kwargs):
+        """
+        _request(method, url, **kwargs) - Authorized API request. A 401 gets a new token and one retry.
+        """
+        if self.wp_oauth_header is None:
+            self._wp_authorize()
+        header = self.wp_oauth_header
+        wp_req = self.http.request(method, url, headers=header, **kwargs)
+        if wp_req.status_code == 401:
+            self._wp_authorize(rejected=header['Authorization'][len("Bearer "):])
+            wp_req = self.http.request(method, url, headers=self.wp_oauth_header, **kwargs)
+        return wp_req
     
+    def _template_cache_file(self, site: str, template_id: str) -> str:
+        return os.path.join(TEMPLATE_CACHE, re.sub(r'[^\w.-]', '_', f"{ site }_{ template_id }") + ".json")
+
+    @tracing.traced("wpt.get_template", "network")
     def get_template(self):
-        if self.wp_key is None:
-            self._get_secrets()
+        """
+        get_template() - Sets the templates from the template post. A saved copy of the post is used when a
+                         fields=modified request shows it was not edited since it was downloaded.
+        """
         if self.wp_site is None:
             self._get_site()
-        if self.wp_oauth_header is None:
-            self._wp_authorize()
         
         site = self.wp_site['url']
         template_id = self.wp_site['template']
@@ -56,41 +208,133 @@ class WPT:
         # Get the template post (usually private). This post should be in Jinja2 formatted HTML
         api = "/sites/" + site + "/posts/" + template_id
         url = self.api_url + api
-        wp_req = requests.get(url, headers=self.wp_oauth_header)
-        wp_resp = json.loads(wp_req.text)
-        self.set_template(wp_resp['title'], wp_resp['content'])
+        fname = self._template_cache_file(site, template_id)
+        template = None
+        if os.path.exists(fname):
+            with open(fname) as fp:
+                template = json.load(fp)
+            wp_req = self._request("GET", url, params={"fields": "modified"})
+            if json.loads(wp_req.text).get('modified') != template['modified']:
+                template = None
+        if template is None:
+            wp_req = self._request("GET", url, params={"fields": "title,content,modified"})
+            wp_resp = json.loads(wp_req.text)
+            template = {"modified": wp_resp['modified'], "title": wp_resp['title'], "content": wp_resp['content']}
+            os.makedirs(TEMPLATE_CACHE, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=TEMPLATE_CACHE)
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(template, fp)
+            os.replace(tmp, fname)
+        self.set_template(template['title'], template['content'], key=f"{ template_id }@{ template['modified'] }")
  
-    def set_template(self, title_template: str, body_template: str):
+    def set_template(self, title_template: str, body_template: str, key: str=None):
         """
-        set_template(title_template, body_template)
+        set_template(title_template, body_template, key=None)
           - Sets the template variables. This can be used in place of get_template() for customized template
-            changes.
+            changes. key names this revision of the templates for the compiled template cache (default: a hash of
+            the templates).
         """
         # Wordpress seems to add "Private: " to the beginning of post titles that have not been published
         if "Private: " in title_template:
             title_template = title_template.replace("Private: ", "")
-        # This sets up the template objects within the jinja2 framework
-        self.wp_template_title = jinja2.Environment(loader=jinja2.BaseLoader).from_string(title_template)
-        self.wp_template_body = jinja2.Environment(loader=jinja2.BaseLoader).from_string(body_template)
+        if key is None:
+            key = hashlib.sha256(f"{ title_template }\0{ body_template }".encode('UTF-8')).hexdigest()[:16]
+        # This sets up the template objects within the shared jinja2 environment
+        self.wp_template_title, self.wp_template_body = compile_template(key, title_template, body_template)
     
+    @tracing.traced("wpt.find_title_keyword", "network")
     def find_title_keyword(self, title_keyword: str) -> object:
         """
         find_title_keyword(title_keyword) -> wordpress response object
           - Determines whether the keyword has already been used in a post title. This is to avoid duplicates
             assuming a unique keyword used. (This project has a unique verb string)
             (note that this may not be entirely unique in the case of compound or prefixed verbs)
+          - Answered from the local post index (postindex.py), synced first when older than TITLE_INDEX_MAX_AGE.
+            If the index cannot be synced WordPress is searched instead.
+        """
+        return self.find_titles([title_keyword])[title_keyword]
+
+    def find_titles(self, title_keywords: list) -> dict:
+        """
+        find_titles(title_keywords) -> dict - find_title_keyword for many keywords at once: {keyword: post or None}
+        """
+        index = self._synced_index()
+        if index is None:
+            return {keyword: self._search_title_keyword(keyword) for keyword in title_keywords}
+        return {keyword: index.find(keyword) for keyword in title_keywords}
+
+    def posted_titles(self, category: str) -> list:
         """
+        posted_titles(category) -> list
+          - Titles of the published posts in a category, oldest first, read from the local post index after an
+            incremental sync (so only posts changed since the last run are downloaded). Falls back to
+            get_titles() when the index cannot be synced.
+        """
+        index = self._synced_index()
+        if index is None:
+            return list(self.get_titles(category))
+        return [title for verb, title in index.verbs(category)]
+
+    def _synced_index(self) -> PostIndex:
+        """
+        _synced_index() -> PostIndex - The local post index, synced when older than TITLE_INDEX_MAX_AGE, or None
+                                       when that sync failed
+        """
+        index = get_index()
+        try:
+            if index.age() > TITLE_INDEX_MAX_AGE:
+                self.sync_posts(index)
+        except Exception as e:
+            print(f"Post index sync failed ({ e }), asking WordPress instead")
+            return None
+        return index
+
+    def _search_title_keyword(self, title_keyword: str) -> object:
         if self.wp_site is None:
             self._get_site()
         site = self.wp_site['url']
-        url = f"{ self.api_url }/sites/{ site }/posts/?search={ title_keyword }"
-        wp_req = requests.get(url, headers=self.wp_oauth_header)
+        url = f"{ self.api_url }/sites/{ site }/posts/"
+        wp_req = self._request("GET", url, params={"search": title_keyword, "fields": ",".join(POST_FIELDS)})
         wp_resp = json.loads(wp_req.text)
         for post in wp_resp['posts']:
-            title = post['title'].split('\u2014')  # This splits on em-dash; need a way to make this more generic
-            if title[0].rstrip() == title_keyword:
+            if normalize_title(post['title']) == normalize_title(title_keyword):
                 return post
         return None
+
+    @tracing.traced("wpt.sync_posts", "network")
+    def sync_posts(self, index: PostIndex=None, full: bool=None) -> int:
+        """
+        sync_posts(index=None, full=None) -> int
+            Brings the local post index up to date: only posts modified since the last sync are requested, except
+            when full=True or the last complete sync is older than postindex.FULL_SYNC_INTERVAL. Returns the
+            number of posts received.
+        """
+        index = index if index is not None else get_index()
+        if self.wp_site is None:
+            self._get_site()
+        if full is None:
+            full = index.full_age() > FULL_SYNC_INTERVAL
+        started = time.time()
+        params = {
+            "number": TITLES_PAGE_SIZE,
+            "fields": ",".join(POST_FIELDS + ["categories"]),
+            "status": "any",
+            "order": "ASC",
+            "order_by": "modified"
+        }
+        modified_after = None if full else index.get_meta("modified_after")
+        if modified_after:
+            # WordPress filters strictly after; reach back so posts saved in the same second are not missed
+            params['modified_after'] = sync_start(modified_after)
+        url = f"{ self.api_url }/sites/{ self.wp_site['url'] }/posts/"
+        posts = list(self._get_posts(url, params))
+        index.put_many(posts, full=full)
+        if posts:
+            index.set_meta("modified_after", max(post['modified'] for post in posts))
+        index.set_meta("synced_at", str(started))
+        if full:
+            index.set_meta("full_synced_at", str(started))
+        return len(posts)
     
     def set_template_vars(self, template_vars: dict):
         """
@@ -98,6 +342,7 @@ class WPT:
         """
         self.template_vars = template_vars
 
+    @tracing.traced("wpt.render")
     def get_title(self) -> str:
         """
         get_title() - Fills in the Title template and returns it as a string
@@ -108,6 +353,7 @@ class WPT:
             self.get_template()
         return self.wp_template_title.render(self.template_vars)
     
+    @tracing.traced("wpt.render")
     def get_body(self) -> str:
         """
         get_body(template_vars) - Fills in the Body template and returns it as a string
@@ -116,51 +362,174 @@ class WPT:
             raise Exception(f"Use set_template_vars first before filling in template.")
         return self.wp_template_body.render(self.template_vars)
     
-    def post(self, categories: list=[], tags: list=[]) -> str:
+    def render(self, template_vars: dict) -> tuple:
+        """
+        render(template_vars) -> (title, body) - Fills in both templates without touching self.template_vars
         """
-        post() - Fills in templates and creates new WordPress post
+        if self.wp_template_title is None:
+            self.get_template()
+        return self.wp_template_title.render(template_vars), self.wp_template_body.render(template_vars)
+
+    @tracing.traced("wpt.post", "network")
+    def post(self, categories: list=None, tags: list=None, date: str=None) -> dict:
         """
+        post(categories=None, tags=None, date=None) -> dict
+          - Fills in templates and creates new WordPress post. A date (ISO 8601) in the future schedules the post.
+            Returns the new post. Raises PostRefused when WordPress rejects it.
+        """
+        self.post_response = self._submit(self.get_title(), self.get_body(), categories, tags, date)
+        return self.post_response
+
+    def _submit(self, title: str, body: str, categories: list=None, tags: list=None, date: str=None) -> dict:
+        if self.wp_site is None:
+            self._get_site()
         new_post = {}
-        new_post['content'] = self.get_body()
-        new_post['title'] = self.get_title()
-        new_post['categories'] = categories
-        new_post['tags'] = tags
+        new_post['content'] = body
+        new_post['title'] = title
+        new_post['categories'] = ",".join(categories or [])
+        new_post['tags'] = ",".join(tags or [])
+        if date is not None:
+            new_post['date'] = date
         
         site = self.wp_site['url']
         api = "/sites/" + site + "/posts/new/"
         url = self.api_url + api
-        wp_req = requests.post(url, headers=self.wp_oauth_header, data=new_post)
-        self.post_response = json.loads(wp_req.text)
+        wp_req = self._request("POST", url, data=new_post)
+        try:
+            wp_resp = json.loads(wp_req.text)
+        except ValueError:
+            wp_resp = {}
+        if "ID" not in wp_resp:
+            message = f"WordPress did not create post { title } ({ wp_req.status_code }: { wp_resp.get('message', '') })"
+            if 400 <= wp_req.status_code < 500:
+                raise PostRefused(message)
+            raise Exception(message)
+        # The new post goes straight into the local index, so a duplicate check right after sees it
+        get_index().put_many([wp_resp])
+        return wp_resp
 
-    def get_titles(self, category: str) -> list:
+    @tracing.traced("wpt.post_many", "network")
+    def post_many(self, posts: list, categories: list=None, tags: list=None, workers: int=POST_WORKERS,
+                  rate: float=POST_RATE) -> list:
         """
-        get_titles() - required by ankidevotd library. Gets a list of post titles filtered by 
-                       category or tag.
+        post_many(posts, categories=None, tags=None, workers=POST_WORKERS, rate=POST_RATE) -> list
+          - Renders and creates a batch of posts. posts is a list of dictionaries with
+                template_vars - variables for the templates
+                date          - optional ISO 8601 date; a future date schedules the post
+                key           - optional idempotency key (default: site and title)
+            Posts are submitted on `workers` threads and at most `rate` requests per second go to the API. A post
+            whose key already created a post, or whose title is already in the post index, is not submitted again.
+            A failed submission is retried only after a sync of the index shows it did not create the post.
+            Returns one entry per post, in order: the created (or already existing) post, or the Exception that
+            stopped it.
         """
-        if self.wp_key is None:
-            self._get_secrets()
         if self.wp_site is None:
             self._get_site()
         if self.wp_oauth_header is None:
             self._wp_authorize()
+        index = get_index()
+        jobs = []
+        for item in posts:
+            title, body = self.render(item['template_vars'])
+            key = item.get('key') or f"{ self.wp_site['url'] }:{ title }"
+            jobs.append((key, title, body, item.get('date')))
+
+        host = urlsplit(self.api_url).netloc
+        previous_rate = self.http.get_rate(host)
+        self.http.set_rate(host, rate)
+        results = []
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(self._post_once, index, key, title, body, categories, tags, date)
+                           for key, title, body, date in jobs]
+                for future in futures:
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        results.append(e)
+        finally:
+            self.http.set_rate(host, previous_rate)
+        return results
+
+    def _post_once(self, index: PostIndex, key: str, title: str, body: str, categories: list, tags: list,
+                   date: str) -> dict:
+        """
+        _post_once(index, key, title, body, categories, tags, date) - Creates the post for an idempotency key unless
+                                                                     it exists already
+        """
+        existing = index.get_submission(key) or index.find_title(title)
+        if existing is not None:
+            return existing
+        for attempt in range(POST_RETRIES + 1):
+            try:
+                post = self._submit(title, body, categories, tags, date)
+                index.set_submission(key, post)
+                return post
+            except PostRefused:
+                raise
+            except Exception:
+                if attempt == POST_RETRIES:
+                    raise
+            # The request may have created the post even though the answer was lost
+            time.sleep(2 ** attempt)
+            self.sync_posts(index)
+            existing = index.find_title(title)
+            if existing is not None:
+                index.set_submission(key, existing)
+                return existing
+
+    def _get_posts_page(self, url: str, params: dict, page: int) -> dict:
+        wp_req = self._request("GET", url, params=dict(params, page=page))
+        return json.loads(wp_req.text)
+
+    def _get_posts(self, url: str, params: dict):
+        """
+        _get_posts(url, params) - Generator of the posts of a paged posts query. The first page gives the number of
+                                  posts found; the remaining pages are requested concurrently and handed out in
+                                  order.
+        """
+        if self.wp_oauth_header is None:
+            self._wp_authorize()
+        first = self._get_posts_page(url, params, 1)
+        yield from first['posts']
+        pages = -(-first['found'] // params['number'])
+        if pages <= 1:
+            return
+        pool = ThreadPoolExecutor(max_workers=min(TITLES_WORKERS, pages - 1))
+        futures = [pool.submit(self._get_posts_page, url, params, page) for page in range(2, pages + 1)]
+        try:
+            # Pages are handed out in order, whatever order they arrive in
+            for future in futures:
+                yield from future.result()['posts']
+        finally:
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+
+    def get_titles(self, category: str):
+        """
+        get_titles(category) - required by ankidevotd library. Generator of the titles of published posts in a
+                               category or tag, oldest first. The first page gives the number of posts found; the
+                               remaining pages are requested concurrently and their titles yielded in date order.
+        """
+        if self.wp_site is None:
+            self._get_site()
         site = self.wp_site['url']
-        url = f"{ self.api_url }/sites/{ site }/posts/?number=100&fields=title&order=ASC&order_by=date&status=publish&category={ category }&page="
-        page = 0
-        num = 0
-        found = 1
-        while num < found:
-            page += 1
-            wp_req = requests.get(url + str(page), headers=self.wp_oauth_header)
-            wp_data = json.loads(wp_req.text)
-            found = wp_data['found']
-            num += 100
-            titles = []
-            for post in wp_data['posts']:
-                titles.append(post['title'])
-        return titles
+        url = f"{ self.api_url }/sites/{ site }/posts/"
+        params = {
+            "number": TITLES_PAGE_SIZE,
+            "fields": "title",
+            "order": "ASC",
+            "order_by": "date",
+            "status": "publish",
+            "category": category
+        }
+        with tracing.span("wpt.get_titles", "network", category=category):
+            for post in self._get_posts(url, params):
+                yield post['title']
         
 if __name__ == "__main__":
     wpt = WPT("ssm", region="us-east-2")
-    titles = wpt.get_titles(category="Verbs")
+    titles = list(wpt.get_titles(category="Verbs"))
     print(titles)
     print(len(titles))
\ No newline at end of file